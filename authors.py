@@ -1,62 +1,242 @@
+# 作者主页爬虫
 # https://www.ciweimao.com/reader/8747661
 
-import requests
-from lxml import html
-import logging
+import argparse
+import re
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from lxml import etree, html
+from tqdm import tqdm
+
+from config import LOG_PATH
+from database import Database
+from db_writer import completed_future
+from header_profiles import get_header_profiles
+from http_cache import get_http_cache
+from logger import setup_logger
+from metrics import RETRIES, observe_response, start_metrics
+from parse_pool import get_parse_pool
+from proxy_pool import get_proxy_manager, to_requests_proxies
+from rate_limiter import get_rate_limiter
+
+logger = setup_logger("authors", LOG_PATH)
+
+# 预编译的 XPath，每个字段只查询一次
+BOOK_AMOUNT = etree.XPath('//*[@id="J_BookAmount"]/text()')
+FOOTPRINT = etree.XPath("/html/body/div[3]/div/ul/li[2]/b/text()")
+FANS = etree.XPath("/html/body/div[3]/div/ul/li[3]/b/text()")
+FOLLOWING = etree.XPath("/html/body/div[3]/div/ul/li[4]/b/text()")
+AVATAR = etree.XPath('//*[@id="userAvatar"]/@data-original')
+BOOK_ITEMS = etree.XPath('//ul[contains(@class, "book-list")]/li')
+BOOK_COVER = etree.XPath(".//img/@data-original | .//img/@src")
+BOOK_LINK = etree.XPath('.//h3[@class="title"]/a')
+# 点击数和类别按 span 位置分别取，某个 span 为空或含多个文本节点时不会错位
+BOOK_CLICKS = etree.XPath('string(.//p[@class="intro"]/span[1])')
+BOOK_CATEGORY = etree.XPath('string(.//p[@class="intro"]/span[2])')
+BOOK_INFO = etree.XPath('.//div[@class="info"]/p')
+
+_READER_ID = re.compile(r"/reader/(\d+)")
+
+
+def author_id_from_url(url: str) -> Optional[int]:
+    match = _READER_ID.search(url or "")
+    return int(match.group(1)) if match else None
+
+
+def _first(values, default=""):
+    return values[0].strip() if values else default
+
+
+def _paragraph_text(paragraphs, index) -> str:
+    # 对应原来的 p[2]、p[4]，只取段落的直接文本
+    if len(paragraphs) <= index:
+        return ""
+    return _first(paragraphs[index].xpath("text()"))
+
 
 # 传入参数 作者主页链接
-def get_author_data(author_url):
-    response = requests.get(author_url)
-    # 打印响应内容 写入文件
-    tree = html.fromstring(response.text)
-    return tree
+def get_author_data(author_url, proxies=None, before_send=None):
+    """获取作者主页并返回 DOM"""
+    return html.fromstring(fetch_author_page(author_url, proxies, before_send).text)
+
+
+def fetch_author_page(author_url, proxies=None, before_send=None):
+    """请求作者主页，优先使用 HTTP 缓存；响应的 from_cache 表示是否未走网络"""
+    sent_at = []
+
+    def send():
+        if before_send is not None:
+            before_send()
+        # 限速等待结束后才开始计时
+        sent_at.append(time.perf_counter())
+
+    response = get_http_cache().request(
+        "GET",
+        author_url,
+        before_send=send,
+        proxies=proxies,
+        headers=get_header_profiles().for_proxy(proxies),
+        timeout=10,
+    )
+    if not response.from_cache:
+        proxy = (proxies or {}).get("http")
+        seconds = time.perf_counter() - sent_at[-1]
+        observe_response("author", proxy, response, seconds)
+    response.raise_for_status()
+    return response
+
 
 # 获取作者信息
-def get_author_info(tree):
-    # 使用xpath获取各项数据
-    try:
-        book_amount = tree.xpath('//*[@id="J_BookAmount"]/text()')[0]
-        footprint = tree.xpath('/html/body/div[3]/div/ul/li[2]/b/text()')[0]
-        fans = tree.xpath('/html/body/div[3]/div/ul/li[3]/b/text()')[0]
-        following = tree.xpath('/html/body/div[3]/div/ul/li[4]/b/text()')[0]
-        avatar = tree.xpath('//*[@id="userAvatar"]/@data-original')[0]
-        
-        # 获取作品数据
-        books = []
-        book_items = tree.xpath('//ul[contains(@class, "book-list")]/li')
-        
-        for item in book_items:
-            book = {
-                "book_id": item.get('data-book-id', ''),
-                "cover": item.xpath('.//img/@data-original | .//img/@src')[0] if item.xpath('.//img/@data-original | .//img/@src') else '',
-                "name": item.xpath('.//h3[@class="title"]/a/text()')[0].strip() if item.xpath('.//h3[@class="title"]/a/text()') else '',
-                "url": item.xpath('.//h3[@class="title"]/a/@href')[0] if item.xpath('.//h3[@class="title"]/a/@href') else '',
-                "clicks": item.xpath('.//p[@class="intro"]/span[1]/text()')[0].strip() if item.xpath('.//p[@class="intro"]/span[1]/text()') else '',
-                "category": item.xpath('.//p[@class="intro"]/span[2]/text()')[0].strip() if item.xpath('.//p[@class="intro"]/span[2]/text()') else '',
-                "update_to": item.xpath('.//div[@class="info"]/p[2]/text()')[0].strip() if item.xpath('.//div[@class="info"]/p[2]/text()') else '',
-                "update_time": item.xpath('.//div[@class="info"]/p[4]/text()')[0].strip() if item.xpath('.//div[@class="info"]/p[4]/text()') else ''
-            }
-            books.append(book)
-
-        # 返回包含所有信息的字典
-        return {
-            "book_amount": book_amount,
-            "footprint": footprint,
-            "fans": fans,
-            "following": following,
-            "avatar": avatar,
-            "books": books
-        }
-    except IndexError as e:
-        logging.error(f"获取作者信息失败: {str(e)}")
+def get_author_info(tree) -> Optional[Dict]:
+    """从作者主页 DOM 中提取作者信息和作品列表，缺少必要字段时返回 None"""
+    stats = [
+        BOOK_AMOUNT(tree),
+        FOOTPRINT(tree),
+        FANS(tree),
+        FOLLOWING(tree),
+        AVATAR(tree),
+    ]
+    if not all(stats):
+        logger.error("获取作者信息失败: 页面缺少作者统计信息")
         return None
+    book_amount, footprint, fans, following, avatar = (s[0] for s in stats)
 
-tree = get_author_data("https://www.ciweimao.com/reader/229453")
-author_info = get_author_info(tree)
-if author_info:
-    print(f"书架数量: {author_info['book_amount']}")
-    print(f"足迹数: {author_info['footprint']}")
-    print(f"粉丝数: {author_info['fans']}")
-    print(f"关注数: {author_info['following']}")
-    print(f"头像: {author_info['avatar']}")
-    print(f"作品: {author_info['books']}")
+    # 获取作品数据
+    books = []
+    for item in BOOK_ITEMS(tree):
+        links = BOOK_LINK(item)
+        info = BOOK_INFO(item)
+        covers = BOOK_COVER(item)
+        books.append(
+            {
+                "book_id": item.get("data-book-id", ""),
+                "cover": covers[0] if covers else "",
+                "name": (links[0].text or "").strip() if links else "",
+                "url": links[0].get("href", "") if links else "",
+                "clicks": BOOK_CLICKS(item).strip(),
+                "category": BOOK_CATEGORY(item).strip(),
+                "update_to": _paragraph_text(info, 1),
+                "update_time": _paragraph_text(info, 3),
+            }
+        )
+
+    # 返回包含所有信息的字典
+    return {
+        "book_amount": book_amount,
+        "footprint": footprint,
+        "fans": fans,
+        "following": following,
+        "avatar": avatar,
+        "books": books,
+    }
+
+
+def parse_author_page(text) -> Optional[Dict]:
+    """解析作者主页 HTML，不涉及网络请求，可在解析进程池中执行"""
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    return get_author_info(html.fromstring(text))
+
+
+def crawl_author(author, db: Database, retries=3) -> Future:
+    """爬取单个作者主页，返回写库 Future（结果为是否成功）"""
+    author_url = author["author_url"]
+    proxy_manager = get_proxy_manager()
+    rate_limiter = get_rate_limiter()
+    proxy = proxy_manager.get_proxy()
+
+    for attempt in range(retries):
+        try:
+            start = time.monotonic()
+            response = fetch_author_page(
+                author_url,
+                proxies=to_requests_proxies(proxy),
+                before_send=lambda: rate_limiter.acquire(author_url, proxy),
+            )
+            if not response.from_cache:
+                proxy_manager.report_success(proxy, time.monotonic() - start)
+                rate_limiter.report(author_url, proxy, status=200)
+            # 在解析进程池中解析，避免多个爬取线程争抢 GIL
+            info = get_parse_pool().parse("author", response.content).result()
+            if info is None:
+                return completed_future(False)
+            return db.submit_author(author_url, author["author"], info)
+
+        except Exception as e:
+            proxy_manager.report_error(proxy, e)
+            rate_limiter.report(author_url, proxy, error=e)
+            if attempt == retries - 1:  # 最后一次重试
+                logger.error("爬取作者 %s 失败: %s", author_url, e)
+                logger.error(traceback.format_exc())
+                return completed_future(False)
+            logger.warning(
+                "爬取作者 %s 失败，重试中... (尝试 %s/%s)", author_url, attempt + 1, retries
+            )
+            RETRIES.inc(kind="author")
+            # 更换代理重试，等待由限速器决定
+            proxy = proxy_manager.get_proxy()
+
+    return completed_future(False)
+
+
+def crawl_authors(max_workers=10, batch_size=1000):
+    """多线程爬取 books 中出现过的所有作者，每个作者只请求一次
+
+    参数:
+        max_workers: 线程数
+        batch_size: 每批从数据库读取的作者数量
+    """
+    db = Database()
+    success_count = 0
+    fail_count = 0
+    last_url = ""
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            authors = db.get_uncrawled_authors(after_url=last_url, limit=batch_size)
+            if not authors:
+                break
+            last_url = authors[-1]["author_url"]
+
+            futures = [executor.submit(crawl_author, author, db) for author in authors]
+            with tqdm(total=len(futures), desc="作者主页") as pbar:
+                for future in futures:
+                    try:
+                        ok = future.result().result()
+                    except Exception as e:
+                        logger.error("保存作者信息时出现异常: %s", e)
+                        ok = False
+                    if ok:
+                        success_count += 1
+                    else:
+                        fail_count += 1
+                    pbar.set_description(f"作者主页: {success_count}成功/{fail_count}失败")
+                    pbar.update(1)
+
+    db.close()
+    logger.info("作者爬取结束! 成功: %s, 失败: %s", success_count, fail_count)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="爬取作者主页")
+    parser.add_argument("--workers", type=int, default=10, help="线程数")
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="每批读取的作者数量"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        args = parse_args()
+        start_metrics()
+        crawl_authors(max_workers=args.workers, batch_size=args.batch_size)
+    except KeyboardInterrupt:
+        logger.info("用户中断，程序结束")
+    except Exception as e:
+        logger.error("程序运行出错: %s", e)
+        logger.error(traceback.format_exc())
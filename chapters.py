@@ -1,66 +1,277 @@
-import requests
-from lxml import html
-from typing import List, Dict
-from fake_useragent import UserAgent
-from config import PROXIES
+# 章节目录爬虫
+# https://www.ciweimao.com/chapter/get_chapter_list_in_chapter_detail
+
+import argparse
+import re
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from lxml import etree, html
+from tqdm import tqdm
+
+from config import CHAPTER_RECHECK_SECONDS, LOG_PATH
+from database import Database
+from db_writer import completed_future
+from header_profiles import get_header_profiles
+from http_cache import get_http_cache
 from logger import setup_logger
-import json
+from metrics import RETRIES, observe_response, start_metrics
+from parse_pool import get_parse_pool
+from proxy_pool import get_proxy_manager, to_requests_proxies
+from rate_limiter import get_rate_limiter
+
+logger = setup_logger("chapters", LOG_PATH)
+
+CHAPTER_LIST_URL = "https://www.ciweimao.com/chapter/get_chapter_list_in_chapter_detail"
+
+CHAPTER_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded",
+}
+
+# 预编译的 XPath，避免每本书重新编译
+VOLUMES = etree.XPath('//div[@class="book-chapter-box"]')
+VOLUME_TITLE = etree.XPath('.//h4[@class="sub-tit"]/text()')
+CHAPTER_LINKS = etree.XPath('.//ul[@class="book-chapter-list"]/li/a')
+LINK_TEXT = etree.XPath("text()")
+LOCK_ICON = etree.XPath('.//i[@class="icon-lock"]')
+
+_CHAPTER_ID = re.compile(r"/chapter/(\d+)")
+_BOOK_ID = re.compile(r"/book/(\d+)")
+
+
+def chapter_id_from_url(url: str) -> Optional[int]:
+    match = _CHAPTER_ID.search(url or "")
+    return int(match.group(1)) if match else None
+
+
+def book_id_from_url(url: str) -> Optional[int]:
+    match = _BOOK_ID.search(url or "")
+    return int(match.group(1)) if match else None
+
+
+def fetch_chapter_list(book_id: int, proxies=None, before_send=None):
+    """请求章节目录，优先使用 HTTP 缓存；响应的 from_cache 表示是否未走网络"""
+    headers = {
+        **get_header_profiles().for_proxy(proxies),
+        **CHAPTER_HEADERS,
+        "Referer": f"https://www.ciweimao.com/book/{book_id}",
+    }
+    data = {"book_id": str(book_id), "chapter_id": "0", "orderby": "0"}
+    sent_at = []
+
+    def send():
+        if before_send is not None:
+            before_send()
+        # 限速等待结束后才开始计时
+        sent_at.append(time.perf_counter())
+
+    response = get_http_cache().request(
+        "POST",
+        CHAPTER_LIST_URL,
+        before_send=send,
+        proxies=proxies,
+        headers=headers,
+        data=data,
+        timeout=10,
+    )
+    if not response.from_cache:
+        proxy = (proxies or {}).get("http")
+        seconds = time.perf_counter() - sent_at[-1]
+        observe_response("chapters", proxy, response, seconds)
+    response.raise_for_status()
+    return response
+
+
+def parse_chapter_list(text) -> List[Dict]:
+    """解析章节目录，返回按卷组织的章节列表，不涉及网络请求"""
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    if not text.strip():
+        return []
+    tree = html.fromstring(text)
+    volumes = []
+
+    # 遍历每个卷
+    for volume_elem in VOLUMES(tree):
+        titles = VOLUME_TITLE(volume_elem)
+        chapters = []
+
+        # 获取该卷下的所有章节
+        for chapter_elem in CHAPTER_LINKS(volume_elem):
+            texts = LINK_TEXT(chapter_elem)
+            url = chapter_elem.get("href", "")
+            chapters.append(
+                {
+                    "chapter_id": chapter_id_from_url(url),
+                    "title": texts[-1].strip() if texts else "",
+                    "url": url,
+                    "is_locked": bool(LOCK_ICON(chapter_elem)),
+                }
+            )
+
+        volumes.append(
+            {"title": titles[0].strip() if titles else "", "chapters": chapters}
+        )
+
+    return volumes
 
-logger = setup_logger('chapters', 'logs/chapters.log')
 
 def get_chapter_list(book_id: int) -> List[Dict]:
     """
     获取小说章节列表,按卷组织
-    
+
     Args:
         book_id: 书籍ID
-    
+
     Returns:
         卷信息列表，每个卷包含标题和章节列表
     """
-    url = "https://www.ciweimao.com/chapter/get_chapter_list_in_chapter_detail"
-    ua = UserAgent()
-    headers = {
-        'User-Agent': ua.random,
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'Referer': f'https://www.ciweimao.com/book/{book_id}'
-    }
-    
-    data = {
-        'book_id': str(book_id),
-        'chapter_id': '0',
-        'orderby': '0'
-    }
-    
-    req = requests.post(url, headers=headers, data=data).text
-    tree = html.fromstring(req)
-    volumes = []
-    
-    # 遍历每个卷
-    for volume_elem in tree.xpath('//div[@class="book-chapter-box"]'):
-        # 获取卷标题
-        volume_title = volume_elem.xpath('.//h4[@class="sub-tit"]/text()')[0].strip()
-        chapters = []
-        
-        # 获取该卷下的所有章节
-        for chapter_elem in volume_elem.xpath('.//ul[@class="book-chapter-list"]/li/a'):
-            chapter = {
-                'title': chapter_elem.xpath('text()')[-1].strip(),
-                'url': chapter_elem.get('href', ''),
-                'is_locked': bool(chapter_elem.xpath('.//i[@class="icon-lock"]'))
-            }
-            chapters.append(chapter)
-        
-        volume = {
-            'title': volume_title,
-            'chapters': chapters
-        }
-        volumes.append(volume)
-    
-    return volumes
+    proxy = get_proxy_manager().get_proxy()
+    response = fetch_chapter_list(book_id, proxies=to_requests_proxies(proxy))
+    return parse_chapter_list(response.text)
+
+
+def crawl_book_chapters(
+    book, db: Database, retries=3, recheck_seconds=CHAPTER_RECHECK_SECONDS
+) -> Future:
+    """爬取单本书的章节目录，返回写库 Future（结果为 (新增数, 更新数)）
+
+    最新章节已入库且在 recheck_seconds 内检查过的书籍直接跳过；
+    超过该时长会重新请求目录，以更新已有章节的标题和锁定状态。
+    """
+    book_id = book_id_from_url(book["book_url"])
+    if book_id is None:
+        logger.warning("无法从 %s 中解析书籍 ID", book["book_url"])
+        return completed_future(None)
+
+    # 最新章节已入库说明没有新增章节，近期检查过时无需请求
+    latest_id = chapter_id_from_url(book["latest_chapter_url"])
+    recently_checked = book["chapters_checked_at"] > time.time() - recheck_seconds
+    if latest_id is not None and recently_checked and db.has_chapter(latest_id):
+        return completed_future((0, 0))
+
+    proxy_manager = get_proxy_manager()
+    rate_limiter = get_rate_limiter()
+    proxy = proxy_manager.get_proxy()
+
+    for attempt in range(retries):
+        try:
+            start = time.monotonic()
+            response = fetch_chapter_list(
+                book_id,
+                proxies=to_requests_proxies(proxy),
+                before_send=lambda: rate_limiter.acquire(CHAPTER_LIST_URL, proxy),
+            )
+            if not response.from_cache:
+                proxy_manager.report_success(proxy, time.monotonic() - start)
+                rate_limiter.report(CHAPTER_LIST_URL, proxy, status=200)
+            # 在解析进程池中解析，避免多个爬取线程争抢 GIL
+            volumes = get_parse_pool().parse("chapters", response.content).result()
+            return db.submit_chapters(book["id"], volumes)
+
+        except Exception as e:
+            proxy_manager.report_error(proxy, e)
+            rate_limiter.report(CHAPTER_LIST_URL, proxy, error=e)
+            if attempt == retries - 1:  # 最后一次重试
+                logger.error("爬取书籍 %s 章节目录失败: %s", book_id, e)
+                logger.error(traceback.format_exc())
+                return completed_future(None)
+            logger.warning(
+                "爬取书籍 %s 章节目录失败，重试中... (尝试 %s/%s)", book_id, attempt + 1, retries
+            )
+            RETRIES.inc(kind="chapters")
+            # 更换代理重试，等待由限速器决定
+            proxy = proxy_manager.get_proxy()
+
+    return completed_future(None)
+
+
+def crawl_chapters(
+    max_workers=10, batch_size=1000, recheck_seconds=CHAPTER_RECHECK_SECONDS
+):
+    """多线程爬取所有书籍的章节目录，只写入新增或变化的章节
+
+    参数:
+        max_workers: 线程数
+        batch_size: 每批从数据库读取的书籍数量
+        recheck_seconds: 最新章节已入库的书籍多久后重新检查目录
+    """
+    db = Database()
+    total_inserted = 0
+    total_updated = 0
+    total_fail = 0
+    last_id = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            books = db.get_books_for_chapters(after_id=last_id, limit=batch_size)
+            if not books:
+                break
+            last_id = books[-1]["id"]
+
+            futures = [
+                executor.submit(
+                    crawl_book_chapters, book, db, recheck_seconds=recheck_seconds
+                )
+                for book in books
+            ]
+            with tqdm(total=len(futures), desc=f"章节目录 (id > {last_id})") as pbar:
+                for future in futures:
+                    try:
+                        result = future.result().result()
+                    except Exception as e:
+                        logger.error("保存章节目录时出现异常: %s", e)
+                        result = None
+                    if result is None:
+                        total_fail += 1
+                    else:
+                        total_inserted += result[0]
+                        total_updated += result[1]
+                    pbar.update(1)
+
+            logger.info(
+                "已处理到书籍 %s: 新增章节 %s, 更新章节 %s, 失败 %s",
+                last_id,
+                total_inserted,
+                total_updated,
+                total_fail,
+            )
+
+    db.close()
+    logger.info(
+        "章节目录爬取结束! 新增章节 %s, 更新章节 %s, 失败 %s", total_inserted, total_updated, total_fail
+    )
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="爬取章节目录")
+    parser.add_argument("--workers", type=int, default=10, help="线程数")
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="每批读取的书籍数量"
+    )
+    parser.add_argument(
+        "--recheck-hours",
+        type=float,
+        default=CHAPTER_RECHECK_SECONDS / 3600,
+        help="最新章节已入库的书籍多少小时后重新检查目录，0 表示全部重新检查",
+    )
+    return parser.parse_args()
 
-# 示例用法
-book_data = get_chapter_list(100420810)
-# 转为 json
 
-print(json.dumps(book_data, ensure_ascii=False, indent=4))
\ No newline at end of file
+if __name__ == "__main__":
+    try:
+        args = parse_args()
+        start_metrics()
+        crawl_chapters(
+            max_workers=args.workers,
+            batch_size=args.batch_size,
+            recheck_seconds=args.recheck_hours * 3600,
+        )
+    except KeyboardInterrupt:
+        logger.info("用户中断，程序结束")
+    except Exception as e:
+        logger.error("程序运行出错: %s", e)
+        logger.error(traceback.format_exc())
@@ -1,183 +1,258 @@
 # https://www.ciweimao.com/book_list
 
+import argparse
 import aiohttp
 import asyncio
-from lxml import html
-import random
-from typing import Tuple, List
-from fake_useragent import UserAgent
-from database import Database
+import time
+import traceback
+from storage import open_storage
+from parse_pool import ParsePool
 from tqdm import tqdm
 from logger import setup_logger
-from config import PROXIES, LOG_PATH
+from config import LISTING_URL, LOG_PATH
+from proxy_pool import get_proxy_manager
+from rate_limiter import get_rate_limiter
+from http_cache import get_http_cache
+from http_client import create_async_session
+from header_profiles import get_header_profiles
+from metrics import REQUESTS, RETRIES, observe_response, start_metrics
 
 logger = setup_logger("ciweimao", LOG_PATH)
 
 
-async def get_page_data(
+async def fetch_page(
     session: aiohttp.ClientSession, page: int, retries: int = 3
-) -> Tuple[List[str], ...]:
-    url = f"https://www.ciweimao.com/book_list/0-0-0-0-0-0/quanbu/{page}"
-    ua = UserAgent()
-    headers = {"User-Agent": ua.random}
+) -> bytes:
+    """获取列表页原始响应字节"""
+    url = LISTING_URL.format(page=page)
+    # 按健康分数选择代理
+    proxy_manager = get_proxy_manager()
+    rate_limiter = get_rate_limiter()
+    proxy = await proxy_manager.get_proxy_async()
 
-    # 随机选择代理
-    proxy = random.choice(PROXIES)
+    http_cache = get_http_cache()
+    sent_at = []
+
+    async def before_send():
+        await rate_limiter.acquire_async(url, proxy)
+        # 限速等待结束后才开始计时
+        sent_at.append(time.perf_counter())
 
     for attempt in range(retries):
         try:
-            async with session.get(url, headers=headers, proxy=proxy) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    tree = html.fromstring(text)
-
-                    # 提取各项信息
-                    categories = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[1]/p/text()"
-                    )
-                    book_names = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[2]/p/a/text()"
-                    )
-                    book_urls = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[2]/p/a/@href"
-                    )
-                    latest_chapters = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[3]/p/a/text()"
-                    )
-                    latest_chapter_urls = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[3]/p/a/@href"
-                    )
-                    authors = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[4]/p/a/text()"
-                    )
-                    author_urls = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[4]/p/a/@href"
-                    )
-                    word_counts = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[5]/p/text()"
-                    )
-                    update_times = tree.xpath(
-                        "//div[5]/div/div[2]/div[1]/table//tr/td[6]/p/text()"
-                    )
-
-                    logger.info(f"成功获取页面 {page} 的数据")
-                    return (
-                        categories,
-                        book_names,
-                        book_urls,
-                        latest_chapters,
-                        latest_chapter_urls,
-                        authors,
-                        author_urls,
-                        word_counts,
-                        update_times,
-                    )
+            start = time.monotonic()
+            response = await http_cache.request_async(
+                session,
+                "GET",
+                url,
+                before_send=before_send,
+                headers=get_header_profiles().for_proxy(proxy),
+                proxy=proxy,
+            )
+            if response.from_cache:
+                return response.content
+
+            observe_response(
+                "listing", proxy, response, time.perf_counter() - sent_at[-1]
+            )
+            rate_limiter.report(url, proxy, status=response.status)
+            if response.status == 200:
+                proxy_manager.report_success(proxy, time.monotonic() - start)
+                return response.content
 
+            proxy_manager.report_error(proxy, status=response.status)
+            RETRIES.inc(kind="listing")
+            proxy = await proxy_manager.get_proxy_async()
         except Exception as e:
+            REQUESTS.inc(kind="listing", status="error")
+            proxy_manager.report_error(proxy, e)
+            rate_limiter.report(url, proxy, error=e)
             if attempt == retries - 1:  # 最后一次重试
-                logger.error(f"获取页面 {page} 失败: {str(e)}")
+                logger.error("获取页面 %s 失败: %s", page, e)
                 raise
-            logger.warning(
-                f"获取页面 {page} 失败，重试中... (尝试 {attempt + 1}/{retries})"
-            )
-            # 如果失败则更换代理重试
-            proxy = random.choice(PROXIES)
-            await asyncio.sleep(random.uniform(1, 3))  # 随机延迟
+            logger.warning("获取页面 %s 失败，重试中... (尝试 %s/%s)", page, attempt + 1, retries)
+            RETRIES.inc(kind="listing")
+            # 如果失败则更换代理重试，等待由限速器决定
+            proxy = await proxy_manager.get_proxy_async()
+
+    # 所有重试都失败
+    raise Exception(f"获取页面 {page} 失败，已重试 {retries} 次")
+
+
+async def run_stages(*stages):
+    """并发运行流水线各级，任一级出错时取消其余各级并抛出该异常"""
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        for task in asyncio.as_completed(tasks):
+            await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 async def process_pages(
-    start_page: int = 1, end_page: int = 1050, max_concurrent_requests: int = 10
+    start_page: int = 1,
+    end_page: int = 1050,
+    max_concurrent_requests: int = 10,
+    queue_size: int = None,
+    parse_workers: int = None,
+    resume: bool = False,
 ):
-    db = Database()
-    semaphore = asyncio.Semaphore(max_concurrent_requests)
-
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        with tqdm(total=end_page - start_page + 1, desc="创建任务") as pbar:
-            for page in range(start_page, end_page + 1):
-                await asyncio.sleep(random.uniform(0.5, 1.5))
-                task = asyncio.create_task(
-                    fetch_with_semaphore(semaphore, session, page)
-                )
-                tasks.append(task)
-                pbar.update(1)
-                pbar.set_description(f"已创建第 {page} 页的任务")
-
-        # 使用tqdm显示处理进度
-        with tqdm(total=len(tasks), desc="处理页面") as pbar:
-            results = []
-            for task in asyncio.as_completed(tasks):
-                result = await task
-                results.append(result)
-                pbar.update(1)
-
-        # 使用tqdm显示数据保存进度
-        with tqdm(total=len(results), desc="保存数据") as pbar:
-            for page, result in enumerate(results, start=start_page):
-                if isinstance(result, Exception):
-                    logger.error(f"页面 {page} 处理失败: {str(result)}")
-                    continue
-
-                (
-                    categories,
-                    book_names,
-                    book_urls,
-                    latest_chapters,
-                    latest_chapter_urls,
-                    authors,
-                    author_urls,
-                    word_counts,
-                    update_times,
-                ) = result
-
-                # 准备数据库插入数据
-                books_data = list(
-                    zip(
-                        categories,
-                        book_names,
-                        book_urls,
-                        latest_chapters,
-                        latest_chapter_urls,
-                        authors,
-                        author_urls,
-                        word_counts,
-                        update_times,
-                    )
-                )
-
-                # 添加调试信息
-                logger.info(f"第 {page} 页获取到 {len(books_data)} 条数据")
-                if books_data:
-                    logger.debug(f"第一条数据: {books_data[0]}")
-                else:
-                    logger.warning(f"第 {page} 页没有获取到数据")
-                    continue
-
-                try:
-                    logger.info(f"保存第 {page} 页数据到数据库")
-                    # 保存到数据库
-                    saved_count = db.save_books(books_data)
-
-                    # 验证是否真的保存成功
-                    total_count = len(db.get_all_books())
-                    logger.info(f"数据库当前总记录数: {total_count}")
-
-                    pbar.set_description(f"第 {page} 页成功保存 {saved_count} 条记录")
-                    pbar.update(1)
-                    logger.info(f"第 {page} 页成功保存 {saved_count} 条记录")
-                except Exception as e:
-                    logger.error(f"保存第 {page} 页数据时出错: {str(e)}")
-                    import traceback
-
-                    logger.error(traceback.format_exc())
-
-    logger.info("所有页面处理完成")
-
-
-async def fetch_with_semaphore(semaphore, session, page):
-    async with semaphore:
-        return await get_page_data(session, page)
+    """抓取 → 解析 → 入库 三级流水线，各级之间用有界队列衔接
+
+    每页解析完成后立即交给写线程入库，内存占用与爬取页数无关。
+    解析在进程池中按批进行，parse_workers 为进程数，默认等于 CPU 核数。
+    入库与多线程版本共用 submit_listing_page：已存在的书籍按 book_url 去重，
+    书籍与页面进度在同一事务中提交；resume 为 True 时只爬取尚未成功的页面。
+    """
+    db = open_storage()
+    parse_pool = ParsePool(max_workers=parse_workers)
+    queue_size = queue_size or max_concurrent_requests * 2
+    page_queue = asyncio.Queue(maxsize=queue_size)
+    parse_queue = asyncio.Queue(maxsize=queue_size)
+    save_queue = asyncio.Queue(maxsize=queue_size)
+    pending_writes = set()
+    saved_records = 0
+
+    if resume:
+        pages = await asyncio.to_thread(db.get_pending_pages, start_page, end_page)
+        logger.info(
+            "断点续爬: 跳过 %d 个已完成页面", end_page - start_page + 1 - len(pages)
+        )
+    else:
+        pages = range(start_page, end_page + 1)
+
+    pbar = tqdm(total=len(pages), desc="处理页面")
+
+    async def mark_failed(page):
+        # 失败的页面在断点续爬时会重新抓取
+        await asyncio.to_thread(db.submit_page_failed, page)
+        pbar.update(1)
+
+    async def produce():
+        for page in pages:
+            await page_queue.put(page)
+        for _ in range(max_concurrent_requests):
+            await page_queue.put(None)
+
+    async def fetch_worker(session):
+        while True:
+            page = await page_queue.get()
+            if page is None:
+                break
+            try:
+                body = await fetch_page(session, page)
+            except Exception as e:
+                logger.error("页面 %d 处理失败: %s", page, e)
+                await mark_failed(page)
+                continue
+            await parse_queue.put((page, body))
+
+    async def parse_worker():
+        while True:
+            item = await parse_queue.get()
+            if item is None:
+                break
+            page, body = item
+            try:
+                # 解析放到进程池，多个解析协程的请求会被合并成批
+                books_data = await parse_pool.parse_async("listing", body)
+            except Exception as e:
+                logger.error("解析第 %d 页失败: %s", page, e)
+                await mark_failed(page)
+                continue
+            await save_queue.put((page, books_data))
+
+    async def wait_write(page, future):
+        nonlocal saved_records
+        try:
+            saved_count = await asyncio.wrap_future(future)
+            saved_records += saved_count
+            pbar.set_description(f"第 {page} 页成功保存 {saved_count} 条记录")
+            logger.debug("第 %d 页成功保存 %d 条记录", page, saved_count)
+        except Exception as e:
+            logger.error("保存第 %d 页数据时出错: %s", page, e)
+            logger.error(traceback.format_exc())
+        finally:
+            pbar.update(1)
+
+    async def save_worker():
+        while True:
+            item = await save_queue.get()
+            if item is None:
+                break
+            page, books_data = item
+
+            # 添加调试信息
+            logger.debug("第 %d 页获取到 %d 条数据", page, len(books_data))
+            if not books_data:
+                logger.warning("第 %d 页没有获取到数据", page)
+                await mark_failed(page)
+                continue
+            logger.debug("第一条数据: %s", books_data[0])
+
+            # 只入队不等待提交，写线程按批次提交事务；
+            # 首次调用会加载去重索引，入队在队列满时也会阻塞，都放到线程中
+            future = await asyncio.to_thread(
+                db.submit_listing_page, page, books_data
+            )
+            task = asyncio.create_task(wait_write(page, future))
+            pending_writes.add(task)
+            task.add_done_callback(pending_writes.discard)
+        if pending_writes:
+            await asyncio.gather(*pending_writes)
+
+    async def fetch_stage(session, parser_count):
+        await asyncio.gather(
+            *(fetch_worker(session) for _ in range(max_concurrent_requests))
+        )
+        for _ in range(parser_count):
+            await parse_queue.put(None)
+
+    async def parse_stage(parser_count):
+        await asyncio.gather(*(parse_worker() for _ in range(parser_count)))
+        await save_queue.put(None)
+
+    try:
+        async with create_async_session(limit=max_concurrent_requests) as session:
+            await run_stages(
+                produce(),
+                fetch_stage(session, queue_size),
+                parse_stage(queue_size),
+                save_worker(),
+            )
+        # save_worker 已等待全部写入提交，需在关闭存储之前统计
+        total = await asyncio.to_thread(db.count_books)
+    finally:
+        pbar.close()
+        parse_pool.close()
+        # 关闭存储会等待剩余写入提交
+        await asyncio.to_thread(db.close)
+
+    logger.info(
+        "所有页面处理完成, 新增 %d 条记录, 数据库当前共 %d 条", saved_records, total
+    )
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="异步爬取书籍列表")
+    parser.add_argument("--start", type=int, default=1, help="起始页")
+    parser.add_argument("--end", type=int, default=1050, help="结束页")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发请求数")
+    parser.add_argument("--resume", action="store_true", help="只爬取尚未成功的页面")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(process_pages())
+    args = parse_args()
+    start_metrics()
+    asyncio.run(
+        process_pages(
+            start_page=args.start,
+            end_page=args.end,
+            max_concurrent_requests=args.concurrency,
+            resume=args.resume,
+        )
+    )
@@ -1,199 +1,154 @@
 # https://www.ciweimao.com/book_list
 
-import requests
-from lxml import html
-import random
 import time
+import argparse
 import traceback
 from concurrent.futures import ThreadPoolExecutor
-from typing import List, Tuple
-from fake_useragent import UserAgent
-from database import Database
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+from database import (
+    BOOK_LATEST_CHAPTER_URL_INDEX,
+    BOOK_UPDATE_TIME_INDEX,
+    BOOK_URL_INDEX,
+    Database,
+)
+from parse_pool import get_parse_pool
+from db_writer import completed_future
 from tqdm import tqdm
 from logger import setup_logger
-from config import PROXIES, LOG_PATH
+from config import INCREMENTAL_LISTING_URL, LISTING_URL, LOG_PATH
+from proxy_pool import get_proxy_manager, to_requests_proxies
+from rate_limiter import get_rate_limiter
+from http_cache import get_http_cache
+from header_profiles import get_header_profiles
+from metrics import REQUESTS, RETRIES, observe_response, start_metrics
 import os
 
 logger = setup_logger("ciweimao_thread", LOG_PATH)
 
 
-def get_valid_proxy(proxies_list: List[str]) -> str:
-    """获取有效代理"""
-    while proxies_list:
-        proxy = random.choice(proxies_list)
-        proxies = {"http": proxy, "https": proxy} if proxy else None
-        try:
-            response = requests.get(
-                "https://www.ciweimao.com", proxies=proxies, timeout=5
-            )
-            if response.status_code == 200:
-                return proxy
-            logger.warning(f"代理 {proxy} 响应状态码: {response.status_code}")
-        except Exception:
-            proxies_list.remove(proxy)
-    return None
+def get_page_data(
+    page: int, retries: int = 3, url_template: str = LISTING_URL
+) -> List[Tuple]:
+    """获取单页数据，返回按行对齐的书籍记录"""
+    url = url_template.format(page=page)
 
+    proxy_manager = get_proxy_manager()
+    rate_limiter = get_rate_limiter()
+    proxy = proxy_manager.get_proxy()
+    logger.debug("使用代理: %s", proxy)
+    http_cache = get_http_cache()
+    sent_at = []
 
-def get_page_data(page: int, retries: int = 3) -> Tuple[List[str], ...]:
-    """获取单页数据"""
-    url = f"https://www.ciweimao.com/book_list/0-0-0-0-0-0/quanbu/{page}"
+    def before_send():
+        rate_limiter.acquire(url, proxy)
+        # 限速等待结束后才开始计时
+        sent_at.append(time.perf_counter())
 
-    # 获取有效代理
-    proxy = get_valid_proxy(PROXIES.copy())
-    proxies = {"http": proxy, "https": proxy} if proxy else None
-    logger.info(f"使用代理: {proxies}")
     for attempt in range(retries):
         try:
-            response = requests.get(url, proxies=proxies, timeout=10)
-            if response.status_code == 200:
-                tree = html.fromstring(response.text)
-
-                # 提取各项信息
-                categories = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[1]/p/text()"
-                )
-                book_names = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[2]/p/a/text()"
-                )
-                book_urls = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[2]/p/a/@href"
-                )
-                latest_chapters = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[3]/p/a/text()"
-                )
-                latest_chapter_urls = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[3]/p/a/@href"
-                )
-                authors = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[4]/p/a/text()"
-                )
-                author_urls = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[4]/p/a/@href"
-                )
-                word_counts = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[5]/p/text()"
-                )
-                update_times = tree.xpath(
-                    "//div[5]/div/div[2]/div[1]/table//tr/td[6]/p/text()"
+            start = time.monotonic()
+            response = http_cache.request(
+                "GET",
+                url,
+                before_send=before_send,
+                proxies=to_requests_proxies(proxy),
+                headers=get_header_profiles().for_proxy(proxy),
+                timeout=10,
+            )
+            if not response.from_cache:
+                observe_response(
+                    "listing", proxy, response, time.perf_counter() - sent_at[-1]
                 )
+                rate_limiter.report(url, proxy, status=response.status_code)
+            if response.status_code == 200:
+                if not response.from_cache:
+                    proxy_manager.report_success(proxy, time.monotonic() - start)
+                # 在解析进程池中解析，避免多个爬取线程争抢 GIL
+                books_data = get_parse_pool().parse("listing", response.content).result()
 
-                logger.info(f"成功获取页面 {page} 的数据")
+                logger.debug("成功获取页面 %d 的数据", page)
                 # 判断是否获取到数据
-                if not book_names:
-                    logger.warning(f"页面 {page} 没有获取到数据")
+                if not books_data:
+                    logger.warning("页面 %s 没有获取到数据", page)
                     # 把html 写入文件
                     with open(f"page_{page}.html", "w", encoding="utf-8") as f:
                         f.write(response.text)
-                    return ([],) * 9
-
-                return (
-                    categories,
-                    book_names,
-                    book_urls,
-                    latest_chapters,
-                    latest_chapter_urls,
-                    authors,
-                    author_urls,
-                    word_counts,
-                    update_times,
-                )
+
+                return books_data
             else:
-                logger.warning(f"页面 {page} 响应状态码: {response.status_code}")
+                logger.warning("页面 %s 响应状态码: %s", page, response.status_code)
+                proxy_manager.report_error(proxy, status=response.status_code)
+                RETRIES.inc(kind="listing")
+                proxy = proxy_manager.get_proxy()
         except Exception as e:
+            REQUESTS.inc(kind="listing", status="error")
+            proxy_manager.report_error(proxy, e)
+            rate_limiter.report(url, proxy, error=e)
             if attempt == retries - 1:  # 最后一次重试
-                logger.error(f"获取页面 {page} 失败: {str(e)}")
+                logger.error("获取页面 %s 失败: %s", page, e)
                 raise
-            logger.warning(
-                f"获取页面 {page} 失败，重试中... (尝试 {attempt + 1}/{retries})"
-            )
-            # 如果失败则更换代理重试
-            proxy = get_valid_proxy(PROXIES.copy())
-            proxies = {"http": proxy, "https": proxy} if proxy else None
-            time.sleep(random.uniform(1, 3))  # 随机延迟
+            logger.warning("获取页面 %s 失败，重试中... (尝试 %s/%s)", page, attempt + 1, retries)
+            RETRIES.inc(kind="listing")
+            # 如果失败则更换代理重试，等待由限速器决定
+            proxy = proxy_manager.get_proxy()
 
     # 所有重试都失败
     raise Exception(f"获取页面 {page} 失败，已重试 {retries} 次")
 
 
-def process_and_save_page(page: int, db: Database) -> int:
-    """处理并保存单页数据"""
+def process_and_save_page(page: int, db: Database) -> Future:
+    """处理并保存单页数据，返回写库 Future（结果为新增记录数）"""
     try:
         # 获取页面数据
-        result = get_page_data(page)
-
-        # 解包数据
-        (
-            categories,
-            book_names,
-            book_urls,
-            latest_chapters,
-            latest_chapter_urls,
-            authors,
-            author_urls,
-            word_counts,
-            update_times,
-        ) = result
-
-        # 准备数据库插入数据
-        books_data = list(
-            zip(
-                categories,
-                book_names,
-                book_urls,
-                latest_chapters,
-                latest_chapter_urls,
-                authors,
-                author_urls,
-                word_counts,
-                update_times,
-            )
-        )
+        books_data = get_page_data(page)
 
         # 添加调试信息
-        logger.info(f"第 {page} 页获取到 {len(books_data)} 条数据")
+        logger.debug("第 %d 页获取到 %d 条数据", page, len(books_data))
         if books_data:
-            logger.debug(f"第一条数据: {books_data[0]}")
+            logger.debug("第一条数据: %s", books_data[0])
         else:
-            logger.warning(f"第 {page} 页没有获取到数据")
-            return 0
+            logger.warning("第 %s 页没有获取到数据", page)
+            db.submit_page_failed(page)
+            return completed_future(0)
 
-        # 获取现有书名
-        existing_books = db.get_all_book_names()
-        # 过滤掉已存在的书籍
-        new_books_data = [book for book in books_data if book[1] not in existing_books]
-
-        skipped_count = len(books_data) - len(new_books_data)
-        if skipped_count > 0:
-            logger.info(f"第 {page} 页跳过 {skipped_count} 条重复记录")
-
-        # 保存到数据库
-        logger.info(f"保存第 {page} 页数据到数据库")
-        saved_count = db.save_books(new_books_data)
-        logger.info(f"第 {page} 页成功保存 {saved_count} 条记录")
-
-        return saved_count
+        # 交给写线程保存，已存在的书籍由去重索引过滤
+        logger.debug("保存第 %d 页数据到数据库", page)
+        return db.submit_listing_page(page, books_data)
     except Exception as e:
-        logger.error(f"处理第 {page} 页数据时出错: {str(e)}")
+        logger.error("处理第 %s 页数据时出错: %s", page, e)
         logger.error(traceback.format_exc())
-        return 0
+        db.submit_page_failed(page)
+        return completed_future(0)
+
 
+def process_pages(
+    start_page: int = 1, end_page: int = 1050, max_workers: int = 10, resume=False
+):
+    """使用多线程处理多个页面
 
-def process_pages(start_page: int = 1, end_page: int = 1050, max_workers: int = 10):
-    """使用多线程处理多个页面"""
+    参数:
+        resume: 只爬取 crawl_pages 中尚未成功的页面
+    """
     db = Database()
-    logger.info(f"使用数据库: {db.db_name}")
+    logger.info("使用数据库: %s", db.db_name)
 
     # 确认数据库文件
     if os.path.exists(db.db_name):
-        logger.info(f"数据库文件存在: {db.db_name}")
+        logger.info("数据库文件存在: %s", db.db_name)
     else:
-        logger.warning(f"数据库文件不存在，将创建: {db.db_name}")
+        logger.warning("数据库文件不存在，将创建: %s", db.db_name)
 
-    # 获取初始记录数
-    initial_count = len(db.get_all_books())
-    logger.info(f"爬取前数据库共有 {initial_count} 条记录")
+    # 获取初始记录数，并预先加载去重索引
+    initial_count = db.count_books()
+    db.get_book_index()
+    logger.info("爬取前数据库共有 %s 条记录", initial_count)
 
-    pages = list(range(start_page, end_page + 1))
+    if resume:
+        pages = db.get_pending_pages(start_page, end_page)
+        logger.info("断点续爬: 跳过 %s 个已完成页面", end_page - start_page + 1 - len(pages))
+    else:
+        pages = list(range(start_page, end_page + 1))
     total_pages = len(pages)
     processed_pages = 0
     saved_records = 0
@@ -210,28 +165,194 @@ def process_pages(start_page: int = 1, end_page: int = 1050, max_workers: int =
             for future in tqdm(future_to_page):
                 page = future_to_page[future]
                 try:
-                    saved_count = future.result()
+                    saved_count = future.result().result()
                     processed_pages += 1
                     saved_records += saved_count
                     pbar.set_description(f"第 {page} 页成功保存 {saved_count} 条记录")
                 except Exception as e:
-                    logger.error(f"处理第 {page} 页时出现异常: {str(e)}")
+                    logger.error("处理第 %s 页时出现异常: %s", page, e)
                 finally:
                     pbar.update(1)
 
+    db.close()
+
     # 获取最终记录数
-    final_count = len(db.get_all_books())
-    logger.info(f"爬取完成! 处理了 {processed_pages} 页，保存了 {saved_records} 条记录")
+    final_count = db.count_books()
+    logger.info("爬取完成! 处理了 %s 页，保存了 %s 条记录", processed_pages, saved_records)
     logger.info(
-        f"数据库记录数: {initial_count} -> {final_count}, 新增 {final_count - initial_count} 条"
+        "数据库记录数: %s -> %s, 新增 %s 条",
+        initial_count,
+        final_count,
+        final_count - initial_count,
     )
 
 
+class ListingOrderError(Exception):
+    """增量爬取的列表页没有按更新时间倒序排列，无法判断何时停止"""
+
+
+def is_sorted_by_update(books_data: List[Tuple], after: Optional[str] = None) -> bool:
+    """检查一页书籍是否按更新时间倒序排列
+
+    after 为上一页最后一行的更新时间，本页不能比它更新。
+    更新时间为 "YYYY-MM-DD HH:MM" 格式，按字符串比较即可，空值跳过。
+    """
+    times = [book[BOOK_UPDATE_TIME_INDEX] for book in books_data]
+    times = [t for t in ([after] if after else []) + times if t]
+    return all(a >= b for a, b in zip(times, times[1:]))
+
+
+def save_changed_page(
+    db: Database, books_data: List[Tuple]
+) -> Optional[Tuple[int, int]]:
+    """保存一页中与数据库不一致的书籍
+
+    返回 (新增数, 更新数)，整页都与数据库一致时返回 None。
+    """
+    state = db.get_books_state([book[BOOK_URL_INDEX] for book in books_data])
+    changed = [
+        book
+        for book in books_data
+        if state.get(book[BOOK_URL_INDEX])
+        != (book[BOOK_UPDATE_TIME_INDEX], book[BOOK_LATEST_CHAPTER_URL_INDEX])
+    ]
+    if not changed:
+        return None
+    return db.submit_changed_books(changed).result()
+
+
+def crawl_incremental(
+    max_pages: int = 6548,
+    max_workers: int = 5,
+    stop_after: int = 1,
+    url_template: str = INCREMENTAL_LISTING_URL,
+):
+    """增量爬取：按更新时间顺序遍历列表页，只保存有变化的书籍
+
+    遇到连续 stop_after 个所有行都与数据库一致的页面后停止，
+    有变化的书籍会重置 detail_crawled，交由详情爬虫重新爬取。
+
+    提前停止依赖列表页按更新时间倒序排列：url_template 为空时抛出 ValueError，
+    每页都会检查顺序，不符时抛出 ListingOrderError，需要全量遍历时应使用
+    process_pages。抓取失败的页面在遍历结束后再重试一次，仍失败的页面会记录在日志中。
+    """
+    if not url_template:
+        raise ValueError(
+            "增量爬取需要按更新时间倒序的列表页，请设置 CIWEIMAO_INCREMENTAL_LISTING_URL"
+        )
+    db = Database()
+    try:
+        return _crawl_incremental(db, max_pages, max_workers, stop_after, url_template)
+    finally:
+        db.close()
+
+
+def _crawl_incremental(db, max_pages, max_workers, stop_after, url_template):
+    page = 1
+    last_page = 0
+    unchanged_pages = 0
+    inserted_total = 0
+    updated_total = 0
+    failed_pages = []
+    last_update_time = None
+
+    def record(current, books_data):
+        nonlocal unchanged_pages, inserted_total, updated_total
+        result = save_changed_page(db, books_data)
+        if result is None:
+            unchanged_pages += 1
+            logger.info("第 %d 页没有变化", current)
+            return
+        unchanged_pages = 0
+        inserted, updated = result
+        inserted_total += inserted
+        updated_total += updated
+        logger.info("第 %d 页: 新增 %d 本, 更新 %d 本", current, inserted, updated)
+
+    def fetch(p):
+        return get_page_data(p, url_template=url_template)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while page <= max_pages and unchanged_pages < stop_after:
+            # 每次并发抓取一个窗口的页面，再按页码顺序比对
+            window = list(range(page, min(page + max_workers, max_pages + 1)))
+            futures = [executor.submit(fetch, p) for p in window]
+            for current, future in zip(window, futures):
+                last_page = current
+                try:
+                    books_data = future.result()
+                except Exception as e:
+                    logger.error("获取第 %d 页失败，稍后重试: %s", current, e)
+                    failed_pages.append(current)
+                    # 缺失的页面可能有变化，不能据此判断顺序
+                    last_update_time = None
+                    continue
+                if not books_data:
+                    logger.warning("第 %d 页没有获取到数据", current)
+                    continue
+
+                if not is_sorted_by_update(books_data, last_update_time):
+                    logger.error("第 %d 页未按更新时间倒序排列: %s", current, url_template)
+                    raise ListingOrderError(
+                        f"第 {current} 页未按更新时间倒序排列，无法增量爬取: {url_template}"
+                    )
+                last_update_time = books_data[-1][BOOK_UPDATE_TIME_INDEX]
+
+                record(current, books_data)
+                if unchanged_pages >= stop_after:
+                    break
+            page = window[-1] + 1
+
+    still_failed = []
+    for current in failed_pages:
+        try:
+            books_data = fetch(current)
+        except Exception as e:
+            logger.error("重试第 %d 页仍然失败: %s", current, e)
+            still_failed.append(current)
+            continue
+        if books_data:
+            record(current, books_data)
+
+    logger.info(
+        "增量爬取完成! 共检查 %d 页, 新增 %d 本, 更新 %d 本",
+        last_page,
+        inserted_total,
+        updated_total,
+    )
+    if still_failed:
+        logger.error("以下页面抓取失败，未能检查: %s", still_failed)
+    return still_failed
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="多线程爬取书籍列表")
+    parser.add_argument("--start", type=int, default=1, help="起始页")
+    parser.add_argument("--end", type=int, default=6548, help="结束页")
+    parser.add_argument("--workers", type=int, default=5, help="线程数")
+    parser.add_argument("--resume", action="store_true", help="只爬取尚未成功的页面")
+    parser.add_argument(
+        "--incremental", action="store_true", help="只爬取更新时间有变化的书籍"
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     # 先测试数据库连接
     try:
+        args = parse_args()
+        start_metrics()
         db = Database()
-        process_pages(start_page=1, end_page=6548, max_workers=5)
+        if args.incremental:
+            crawl_incremental(max_pages=args.end, max_workers=args.workers)
+        else:
+            process_pages(
+                start_page=args.start,
+                end_page=args.end,
+                max_workers=args.workers,
+                resume=args.resume,
+            )
     except Exception as e:
-        logger.error(f"程序启动时出错: {str(e)}")
+        logger.error("程序启动时出错: %s", e)
         logger.error(traceback.format_exc())
@@ -0,0 +1,24 @@
+# 测试运行的公共配置：数据库和日志写入临时目录
+
+import os
+import shutil
+import tempfile
+
+_run_dir = None
+
+
+def pytest_configure(config):
+    """数据库和日志指向本次运行的临时目录，测试不会改写项目下的 ciweimao.db 和 logs
+
+    各模块导入时就按 config 中的路径创建 logger，必须在收集测试之前设置。
+    """
+    global _run_dir
+    _run_dir = tempfile.mkdtemp(prefix="ciweimao-test-")
+    os.environ["CIWEIMAO_DB_NAME"] = os.path.join(_run_dir, "ciweimao.db")
+    os.environ["CIWEIMAO_LOG_PATH"] = os.path.join(_run_dir, "logs", "ciweimao.log")
+
+
+def pytest_unconfigure(config):
+    if _run_dir is not None:
+        shutil.rmtree(_run_dir, ignore_errors=True)
+
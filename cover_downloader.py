@@ -0,0 +1,337 @@
+# 封面图片下载：异步并发下载，按 SHA-256 去重存放
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import os
+import tempfile
+import time
+import traceback
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+from tqdm import tqdm
+
+from config import COVER_DIR, LOG_PATH
+from database import Database
+from header_profiles import get_header_profiles
+from http_client import create_async_session
+from logger import setup_logger
+from metrics import BYTES_FETCHED, REQUEST_SECONDS, REQUESTS, RETRIES, start_metrics
+from rate_limiter import get_rate_limiter
+
+logger = setup_logger("cover_downloader", LOG_PATH)
+
+# 在浏览器请求头之上替换为图片请求的字段
+COVER_HEADERS = {
+    "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+    "Referer": "https://www.ciweimao.com/",
+}
+
+CHUNK_SIZE = 64 * 1024
+# 读到的块在内存中攒到这么大再交给线程写入，避免每个块都切换一次线程
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# 4xx 中可以重试的状态码：请求超时、被限流
+RETRYABLE_STATUSES = (408, 429)
+
+
+class CoverStatusError(Exception):
+    """封面请求返回了非 200 状态码"""
+
+    def __init__(self, status: int):
+        super().__init__(f"响应状态码: {status}")
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        return self.status >= 500 or self.status in RETRYABLE_STATUSES
+
+
+class BlobWriter:
+    """边写入临时文件边计算哈希，提交时按哈希移动到最终位置
+
+    方法都是阻塞的文件操作，协程中应通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, store: "BlobStore"):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=store.tmp_dir, delete=False)
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> Tuple[str, int, bool]:
+        """返回 (哈希, 大小, 是否为新内容)；内容已存在时丢弃临时文件"""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = self.store.path(digest)
+        if os.path.exists(path):
+            os.remove(self._file.name)
+            return digest, self.size, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self._file.name, path)
+        return digest, self.size, True
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._file.name)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """内容寻址的文件存储，路径为 ab/cd/<sha256>，相同内容只存一份"""
+
+    def __init__(self, root: str = COVER_DIR):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def open_writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+
+def normalize_cover_url(url: str) -> str:
+    if url.startswith("//"):
+        return "https:" + url
+    return url
+
+
+async def download_cover(session, store: BlobStore, url: str) -> Tuple[str, int, bool]:
+    """流式下载一张封面到存储中，内存中最多缓存 WRITE_BUFFER_SIZE 字节
+
+    文件读写在线程中执行，不阻塞事件循环；非 200 响应抛出 CoverStatusError。
+    """
+    rate_limiter = get_rate_limiter()
+    await rate_limiter.acquire_async(url)
+    start = time.perf_counter()
+    try:
+        headers = {**get_header_profiles().for_proxy(None), **COVER_HEADERS}
+        async with session.get(url, headers=headers) as response:
+            rate_limiter.report(url, status=response.status)
+            REQUESTS.inc(kind="cover", status=response.status)
+            if response.status != 200:
+                raise CoverStatusError(response.status)
+            writer = await asyncio.to_thread(store.open_writer)
+            try:
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(writer.write, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(writer.write, bytes(buffer))
+            except BaseException:
+                await asyncio.to_thread(writer.abort)
+                raise
+            result = await asyncio.to_thread(writer.commit)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        REQUESTS.inc(kind="cover", status="error")
+        rate_limiter.report(url, error=e)
+        raise
+    REQUEST_SECONDS.observe(time.perf_counter() - start, kind="cover", proxy="direct")
+    BYTES_FETCHED.inc(result[1], kind="cover")
+    return result
+
+
+class CoverSync:
+    """把 books.book_image 指向的封面同步到本地存储
+
+    只处理还没有下载或封面链接已变化的书籍；同一次运行中相同链接
+    （如默认占位图）只下载一次。
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        store: BlobStore,
+        concurrency: int = 64,
+        retries: int = 3,
+        memo_size: int = 10000,
+    ):
+        self.db = db
+        self.store = store
+        self.concurrency = concurrency
+        self.retries = retries
+        self.memo_size = memo_size
+        self.new_blobs = 0
+        self.reused = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._memo = collections.OrderedDict()
+
+    async def fetch(self, session, url: str) -> Optional[Tuple[str, int]]:
+        """下载或复用一个链接的内容，返回 (哈希, 大小)，失败返回 None"""
+        if url in self._memo:
+            self._memo.move_to_end(url)
+            self.reused += 1
+            return self._memo[url]
+        if url in self._inflight:
+            self.reused += 1
+            return await asyncio.shield(self._inflight[url])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        result = None
+        try:
+            result = await self._download(session, url)
+        finally:
+            del self._inflight[url]
+            future.set_result(result)
+        if result is not None:
+            self._memo[url] = result
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    async def _download(self, session, url: str) -> Optional[Tuple[str, int]]:
+        for attempt in range(self.retries):
+            try:
+                async with self._semaphore:
+                    digest, size, new = await download_cover(session, self.store, url)
+                if new:
+                    self.new_blobs += 1
+                return digest, size
+            except Exception as e:
+                # 404 等客户端错误重试也不会成功
+                final = isinstance(e, CoverStatusError) and not e.retryable
+                if final or attempt == self.retries - 1:
+                    logger.error("下载封面失败 %s: %s", url, e)
+                    return None
+                RETRIES.inc(kind="cover")
+        return None
+
+    async def sync_book(self, session, book) -> bool:
+        url = normalize_cover_url(book["book_image"])
+        result = await self.fetch(session, url)
+        if result is None:
+            return False
+        # 记录的是 book_image 原值，便于与下次查询比较
+        future = await asyncio.to_thread(
+            self.db.submit_cover, book["id"], book["book_image"], *result
+        )
+        return await asyncio.wrap_future(future)
+
+    async def sync_books(self, session, books) -> Tuple[int, int]:
+        """并发同步一批书籍的封面，返回 (成功数, 失败数)"""
+        success_count = 0
+        fail_count = 0
+        tasks = [asyncio.create_task(self.sync_book(session, b)) for b in books]
+        with tqdm(total=len(tasks), desc="封面下载") as pbar:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    ok = await task
+                except Exception as e:
+                    logger.error("保存封面时出现异常: %s", e)
+                    ok = False
+                if ok:
+                    success_count += 1
+                else:
+                    fail_count += 1
+                pbar.set_description(f"封面下载: {success_count}成功/{fail_count}失败")
+                pbar.update(1)
+        return success_count, fail_count
+
+    def missing_blobs(self, books) -> list:
+        """已记录封面文件的书籍中，文件已不存在的部分"""
+        return [b for b in books if not self.store.exists(b["cover_sha256"])]
+
+
+async def sync_covers(concurrency=64, batch_size=2000, retries=3, verify=True):
+    """下载所有缺失或已变化的封面
+
+    参数:
+        concurrency: 并发下载数
+        batch_size: 每批从数据库读取的书籍数量
+        retries: 单张封面的重试次数
+        verify: 是否检查已下载的封面文件，文件被删除的重新下载
+    """
+    db = Database()
+    sync = CoverSync(db, BlobStore(), concurrency=concurrency, retries=retries)
+    success_count = 0
+    fail_count = 0
+    last_id = 0
+
+    timeout = aiohttp.ClientTimeout(total=60, sock_read=20)
+    async with create_async_session(limit=concurrency, timeout=timeout) as session:
+        while True:
+            books = await asyncio.to_thread(
+                db.get_pending_covers, after_id=last_id, limit=batch_size
+            )
+            if not books:
+                break
+            last_id = books[-1]["id"]
+            success, fail = await sync.sync_books(session, books)
+            success_count += success
+            fail_count += fail
+
+        last_id = 0
+        while verify:
+            books = await asyncio.to_thread(
+                db.get_downloaded_covers, after_id=last_id, limit=batch_size
+            )
+            if not books:
+                break
+            last_id = books[-1]["id"]
+            missing = await asyncio.to_thread(sync.missing_blobs, books)
+            if missing:
+                logger.warning("%s 个封面文件已不存在，重新下载", len(missing))
+                success, fail = await sync.sync_books(session, missing)
+                success_count += success
+                fail_count += fail
+
+    await asyncio.to_thread(db.close)
+    logger.info(
+        "封面同步结束! 成功: %s, 失败: %s, 新文件: %s, 复用下载: %s",
+        success_count,
+        fail_count,
+        sync.new_blobs,
+        sync.reused,
+    )
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="下载书籍封面")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发下载数")
+    parser.add_argument(
+        "--batch-size", type=int, default=2000, help="每批读取的书籍数量"
+    )
+    parser.add_argument("--retries", type=int, default=3, help="单张封面的重试次数")
+    parser.add_argument(
+        "--no-verify", action="store_true", help="不检查已下载的封面文件是否存在"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        args = parse_args()
+        start_metrics()
+        asyncio.run(
+            sync_covers(
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+                retries=args.retries,
+                verify=not args.no_verify,
+            )
+        )
+    except KeyboardInterrupt:
+        logger.info("用户中断，程序结束")
+    except Exception as e:
+        logger.error("程序运行出错: %s", e)
+        logger.error(traceback.format_exc())
@@ -1,28 +1,453 @@
+import hashlib
 import sqlite3
 import os
-from typing import List, Tuple
+import re
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from logger import setup_logger
-from config import DB_NAME, LOG_PATH
+from config import DB_NAME, LOG_PATH, DETAIL_LEASE_SECONDS
+from db_writer import DatabaseWriter
+from metrics import DB_WRITE_SECONDS
+from storage import Storage
 import traceback
 import json
+from decimal import Decimal, InvalidOperation
 
 logger = setup_logger("database", LOG_PATH)
 
+# books 表中各字段在行元组中的位置
+BOOK_URL_INDEX = 2
+BOOK_LATEST_CHAPTER_URL_INDEX = 4
+BOOK_UPDATE_TIME_INDEX = 8
+
+# book_details 的字段映射: (列名, 来源, 键名, 是否数值)
+# 来源为 None 表示 detail_data 顶层字段
+DETAIL_FIELDS = (
+    ("title", None, "title", False),
+    ("author", None, "author", False),
+    ("author_id", None, "author_id", False),
+    ("description", None, "description", False),
+    ("last_update", None, "last_update", False),
+    ("status", None, "status", False),
+    ("total_hits", "stats", "总点击", True),
+    ("total_favor", "stats", "总收藏", True),
+    ("total_word", "stats", "总字数", True),
+    ("total_recommend", "detail_stats", "总推荐", True),
+    ("week_hits", "detail_stats", "周点击", True),
+    ("mouth_hits", "detail_stats", "月点击", True),
+    ("week_recommend", "detail_stats", "周推荐", True),
+    ("mouth_recommend", "detail_stats", "月点击", True),
+    ("book_type", "detail_stats", "小说类别", False),
+    ("word_count", "detail_stats", "完成字数", False),
+    ("chapter_count", "detail_stats", "章节", True),
+    ("first_publish_status", "detail_stats", "首发状态", False),
+)
+DETAIL_COLUMNS = ("book_id", "book_url", "tags") + tuple(f[0] for f in DETAIL_FIELDS)
+
+# 需要保留历史的统计字段
+STATS_COLUMNS = tuple(f[0] for f in DETAIL_FIELDS if f[3])
+_ROW_STATS = tuple(DETAIL_COLUMNS.index(c) for c in STATS_COLUMNS)
+
+_DETAIL_REPLACE_SQL = "INSERT OR REPLACE INTO book_details ({}) VALUES ({})".format(
+    ", ".join(DETAIL_COLUMNS), ", ".join("?" * len(DETAIL_COLUMNS))
+)
+_DETAIL_UPSERT_SQL = """
+    INSERT INTO book_details ({columns}) VALUES ({placeholders})
+    ON CONFLICT(book_url) DO UPDATE SET {updates}
+""".format(
+    columns=", ".join(DETAIL_COLUMNS),
+    placeholders=", ".join("?" * len(DETAIL_COLUMNS)),
+    updates=", ".join(
+        f"{column} = excluded.{column}"
+        for column in DETAIL_COLUMNS
+        if column != "book_url"
+    ),
+)
+
+_COUNT = re.compile(r"([\d.]+)\s*(万|亿)?")
+_UNITS = {"万": 10_000, "亿": 100_000_000}
+_READER_ID = re.compile(r"/reader/(\d+)")
+
+# 工作队列查询，启动时用 EXPLAIN QUERY PLAN 检查是否命中对应索引
+UNCRAWLED_BOOKS_SQL = "SELECT id, book_url FROM books WHERE detail_crawled = 0 LIMIT ?"
+# 封面由详情爬取写入，这里只取详情已爬取但仍没有封面的书籍做补抓
+BOOKS_WITHOUT_IMAGE_SQL = """
+    SELECT id, book_url, book_name FROM books
+    WHERE (book_image IS NULL OR book_image = '')
+      AND detail_crawled = 1 AND id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+# 未被租用的行 lease_expires 为 0，已过期的租约可直接被重新领取
+CLAIMABLE_BOOKS_SQL = """
+    SELECT id FROM books
+    WHERE detail_crawled = 0 AND lease_expires < ?
+    LIMIT ?
+"""
+PENDING_COVERS_SQL = """
+    SELECT id, book_image FROM books
+    WHERE book_image IS NOT NULL AND book_image != ''
+      AND (cover_sha256 IS NULL OR cover_url IS NOT book_image)
+      AND id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+# 已下载过的封面，用于检查文件是否仍然存在
+DOWNLOADED_COVERS_SQL = """
+    SELECT id, book_image, cover_sha256 FROM books
+    WHERE cover_sha256 IS NOT NULL AND cover_url IS book_image AND id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+# 未爬取的书籍由租约部分索引覆盖，不再单独建索引
+WORK_QUEUE_PLANS = (
+    (UNCRAWLED_BOOKS_SQL, "idx_books_lease"),
+    (CLAIMABLE_BOOKS_SQL, "idx_books_lease"),
+    (PENDING_COVERS_SQL, "idx_books_cover_pending"),
+    (BOOKS_WITHOUT_IMAGE_SQL, "idx_books_without_image"),
+)
+
+
+def parse_count(text) -> Optional[int]:
+    """把 "12345"、"1.2万" 这类计数转换为整数，无法识别时返回 None"""
+    if text is None or isinstance(text, (int, float)):
+        return None if text is None else int(text)
+    match = _COUNT.search(text.replace(",", ""))
+    if not match:
+        return None
+    # 用 Decimal 换算，float 会把 "0.57万" 算成 5699
+    try:
+        return int(Decimal(match.group(1)) * _UNITS.get(match.group(2), 1))
+    except InvalidOperation:
+        return None
+
+
+def extract_number(text) -> int:
+    """从字符串中提取计数，按 万/亿 换算为整数，无法识别时返回 0"""
+    count = parse_count(text)
+    return 0 if count is None else count
+
+
+def detail_row(book_id, book_url, detail_data) -> Tuple:
+    """把详情数据按 DETAIL_COLUMNS 的顺序转换为一行，各存储后端共用"""
+    sections = {
+        None: detail_data,
+        "stats": detail_data.get("stats", {}),
+        "detail_stats": detail_data.get("detail_stats", {}),
+    }
+    row = [
+        book_id,
+        book_url,
+        json.dumps(detail_data.get("tags", []), ensure_ascii=False),
+    ]
+    for _, section, key, numeric in DETAIL_FIELDS:
+        if numeric:
+            row.append(extract_number(sections[section].get(key, "0")))
+        else:
+            row.append(sections[section].get(key, ""))
+    return tuple(row)
+
+
+def page_hash(books_data: List[Tuple]) -> str:
+    """列表页内容指纹，便于判断页面是否变化"""
+    return hashlib.sha1(repr(books_data).encode("utf-8")).hexdigest()
+
+
+def stats_snapshot(row: Tuple) -> Tuple:
+    """从 detail_row 生成的行中取出 (book_id, 按 STATS_COLUMNS 排列的统计值)"""
+    return row[0], tuple(row[i] for i in _ROW_STATS)
+
+
+def _add_column(cursor, table: str, column: str, definition: str):
+    """列不存在时才添加，兼容手工加过列的旧库"""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_1(cursor):
+    # spride_img 依赖的封面列，之前从未由建表语句创建
+    _add_column(cursor, "books", "book_image", "TEXT")
+    # 增量爬取发现变化的书籍，详情需要绕过已有记录和缓存重新抓取
+    _add_column(cursor, "books", "detail_stale", "INTEGER NOT NULL DEFAULT 0")
+    # 章节目录上次检查的时间，最新章节已入库的书籍也需要定期重新检查
+    _add_column(cursor, "books", "chapters_checked_at", "INTEGER NOT NULL DEFAULT 0")
+    # 部分索引只包含待处理的行，取一批任务的代价与表大小无关；
+    # 未爬取详情的书籍由迁移 2 的租约索引覆盖
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_books_without_image
+        ON books(id) WHERE book_image IS NULL OR book_image = ''
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_book_name ON books(book_name)"
+    )
+
+
+def _migration_2(cursor):
+    # 详情任务租约：领取者与到期时间
+    _add_column(cursor, "books", "lease_owner", "TEXT")
+    _add_column(cursor, "books", "lease_expires", "REAL NOT NULL DEFAULT 0")
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_books_lease
+        ON books(lease_expires) WHERE detail_crawled = 0
+        """
+    )
+
+
+def _migration_3(cursor):
+    # 章节目录：卷与章节
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS volumes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER,
+            position INTEGER,
+            title TEXT,
+            UNIQUE (book_id, position),
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chapters (
+            chapter_id INTEGER PRIMARY KEY,
+            book_id INTEGER,
+            volume_id INTEGER,
+            title TEXT,
+            url TEXT,
+            is_locked INTEGER DEFAULT 0,
+            position INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (book_id) REFERENCES books (id),
+            FOREIGN KEY (volume_id) REFERENCES volumes (id)
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chapters_book ON chapters(book_id)"
+    )
+
+
+def _migration_4(cursor):
+    # 作者主页与作者作品
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS authors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            author_id INTEGER,
+            author_url TEXT UNIQUE,
+            name TEXT,
+            book_amount INTEGER,
+            footprint INTEGER,
+            fans INTEGER,
+            following INTEGER,
+            avatar TEXT,
+            crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS author_books (
+            author_url TEXT,
+            book_id TEXT,
+            name TEXT,
+            url TEXT,
+            cover TEXT,
+            clicks TEXT,
+            category TEXT,
+            update_to TEXT,
+            update_time TEXT,
+            PRIMARY KEY (author_url, book_id)
+        )
+        """
+    )
+    # 按作者去重遍历 books 时使用
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_author_url ON books(author_url)"
+    )
+
+
+def _migration_5(cursor):
+    # 统计字段的历史快照，只在数值变化时追加一行；
+    # 按 (book_id, ts) 聚簇存放，单本书的时间序列是一段连续的 B 树区间。
+    # STRICT 拒绝写入非整数，统计值必须是按 万/亿 换算后的整数
+    columns = ",\n".join(f"{column} INTEGER" for column in STATS_COLUMNS)
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS book_stats_history (
+            book_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            {columns},
+            PRIMARY KEY (book_id, ts)
+        ) WITHOUT ROWID, STRICT
+        """
+    )
+    # 按时间窗口找出有变化的书籍
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stats_history_ts
+        ON book_stats_history(ts)
+        """
+    )
+
+
+def _migration_6(cursor):
+    # 封面文件：内容哈希、大小以及下载时使用的链接
+    _add_column(cursor, "books", "cover_sha256", "TEXT")
+    _add_column(cursor, "books", "cover_size", "INTEGER")
+    _add_column(cursor, "books", "cover_url", "TEXT")
+    # 只索引有封面链接但还没有下载、或链接已变化的书籍
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_books_cover_pending ON books(id)
+        WHERE book_image IS NOT NULL AND book_image != ''
+          AND (cover_sha256 IS NULL OR cover_url IS NOT book_image)
+        """
+    )
+
+
+def _migration_7(cursor):
+    # 旧版本提取统计值时丢掉了 万/亿 单位（"1.2万" 记为 1.2，"26万" 记为 26），
+    # 与没有单位的计数无法区分，不能就地换算；已有详情全部标记为过期，
+    # 重新爬取后按单位换算为整数
+    cursor.execute(
+        """
+        UPDATE books SET detail_crawled = 0, detail_stale = 1
+        WHERE id IN (SELECT book_id FROM book_details)
+        """
+    )
+
+
+# 按版本顺序执行的迁移，版本号记录在 PRAGMA user_version 中
+MIGRATIONS = (
+    (1, "工作队列相关列与部分索引", _migration_1),
+    (2, "详情任务租约", _migration_2),
+    (3, "章节目录表", _migration_3),
+    (4, "作者表", _migration_4),
+    (5, "统计历史快照", _migration_5),
+    (6, "封面文件", _migration_6),
+    (7, "重新爬取统计单位不明的详情", _migration_7),
+)
+
+
+def new_lease_owner() -> str:
+    """生成租约持有者标识：主机名、进程号加随机后缀"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# crawl_pages 表中的页面状态
+PAGE_DONE = "done"
+PAGE_FAILED = "failed"
+
+
+class BookUrlIndex:
+    """以 book_url 为键的内存去重索引，启动时加载一次，写入时同步更新"""
+
+    def __init__(self, urls: Iterable[str] = ()):
+        self._urls: Set[str] = set(urls)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._urls)
+
+    def __contains__(self, book_url):
+        return book_url in self._urls
+
+    def claim_new(self, books_data: List[Tuple]) -> List[Tuple]:
+        """过滤出索引中不存在的书籍，并立即登记，避免多线程重复写入"""
+        new_books = []
+        with self._lock:
+            for book in books_data:
+                book_url = book[BOOK_URL_INDEX]
+                if book_url not in self._urls:
+                    self._urls.add(book_url)
+                    new_books.append(book)
+        return new_books
+
+    def add(self, book_urls: Iterable[str]):
+        with self._lock:
+            self._urls.update(book_urls)
+
+    def release(self, book_urls: Iterable[str]):
+        """撤销登记，写入失败时调用，使这些书籍之后还能被重新写入"""
+        with self._lock:
+            self._urls.difference_update(book_urls)
+
+
+class LeaseHeartbeat:
+    """后台定期续约正在处理的书籍，处理完成后调用 discard 移除"""
+
+    def __init__(self, db, owner: str, lease_seconds: float = DETAIL_LEASE_SECONDS):
+        self.db = db
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._ids: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="lease-heartbeat", daemon=True
+        )
+        self._thread.start()
+
+    def add(self, book_ids: Iterable[int]):
+        with self._lock:
+            self._ids.update(book_ids)
+
+    def discard(self, book_id: int):
+        with self._lock:
+            self._ids.discard(book_id)
+
+    def stop(self):
+        """停止续约并释放尚未完成的租约"""
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            remaining, self._ids = list(self._ids), set()
+        if remaining:
+            self.db.release_leases(self.owner, remaining)
+
+    def _run(self):
+        # 每三分之一租期续约一次，留出两次失败的余量
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                book_ids = list(self._ids)
+            if book_ids:
+                renewed = self.db.renew_leases(self.owner, book_ids, self.lease_seconds)
+                if renewed < len(book_ids):
+                    logger.warning("%s 个租约已失效，可能被其他进程领取", len(book_ids) - renewed)
+
+
+class Database(Storage):
+    """SQLite 存储后端，写入由单个写线程分组提交"""
 
-class Database:
     def __init__(self, db_name: str = DB_NAME):
         self.db_name = db_name
         # 确保路径存在
         os.makedirs(os.path.dirname(self.db_name), exist_ok=True)
-        logger.info(f"数据库路径: {self.db_name}")
+        logger.info("数据库路径: %s", self.db_name)
+        self.writer = None
+        self._writer_lock = threading.Lock()
+        self.book_index = None
+        self._local = threading.local()
         self.init_database()
 
     def init_database(self):
         """初始化数据库和表结构"""
         try:
-            logger.info(f"初始化数据库: {self.db_name}")
+            logger.info("初始化数据库: %s", self.db_name)
             with sqlite3.connect(self.db_name) as conn:
                 cursor = conn.cursor()
+                # WAL 模式下读操作不会被写线程阻塞
+                cursor.execute("PRAGMA journal_mode=WAL")
 
                 # 创建书籍信息表
                 cursor.execute(
@@ -82,20 +507,64 @@ class Database:
                 """
                 )
 
+                # 列表页爬取进度表，用于断点续爬
+                cursor.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS crawl_pages (
+                        page INTEGER PRIMARY KEY,
+                        status TEXT,
+                        attempts INTEGER DEFAULT 0,
+                        row_count INTEGER DEFAULT 0,
+                        content_hash TEXT,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """
+                )
+
                 conn.commit()
+                self._migrate(conn)
+                self._check_query_plans(conn)
             logger.info("数据库初始化成功")
         except sqlite3.OperationalError as e:
             if "duplicate column" in str(e).lower():
                 logger.info("列已存在，跳过添加")
             else:
-                logger.error(f"初始化数据库失败: {str(e)}")
+                logger.error("初始化数据库失败: %s", e)
                 logger.error(traceback.format_exc())
                 raise
         except Exception as e:
-            logger.error(f"初始化数据库失败: {str(e)}")
+            logger.error("初始化数据库失败: %s", e)
             logger.error(traceback.format_exc())
             raise
 
+    def _migrate(self, conn):
+        """执行尚未应用的迁移，每个迁移在独立事务中完成"""
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for target, description, migrate in MIGRATIONS:
+            if target <= version:
+                continue
+            logger.info("执行数据库迁移 %s: %s", target, description)
+            try:
+                migrate(cursor)
+                # PRAGMA 不支持参数绑定，版本号来自常量
+                cursor.execute(f"PRAGMA user_version = {int(target)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = target
+
+    def _check_query_plans(self, conn):
+        """确认工作队列查询走部分索引，否则随表增长会退化为全表扫描"""
+        for sql, index in WORK_QUEUE_PLANS:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", (1,) * sql.count("?"))
+            plan = " | ".join(row[-1] for row in rows)
+            if index not in plan:
+                logger.warning("查询未使用索引 %s: %s", index, plan)
+            else:
+                logger.debug("查询计划: %s", plan)
+
     def save_books(self, books_data: List[Tuple]):
         """保存书籍信息到数据库"""
         if not books_data:
@@ -103,52 +572,148 @@ class Database:
             return 0
 
         try:
-            logger.info(f"准备保存 {len(books_data)} 条数据")
-            if books_data:
-                logger.debug(f"第一条数据: {books_data[0]}")
-
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-
-                # 先查询现有记录数
-                cursor.execute("SELECT COUNT(*) FROM books")
-                before_count = cursor.fetchone()[0]
-                logger.debug(f"保存前数据库记录数: {before_count}")
-
-                # 执行插入操作
-                cursor.executemany(
-                    """
-                    INSERT OR REPLACE INTO books (
-                        category, book_name, book_url, latest_chapter,
-                        latest_chapter_url, author, author_url,
-                        word_count, update_time
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                    books_data,
-                )
+            logger.debug("准备保存 %d 条数据", len(books_data))
+            logger.debug("第一条数据: %s", books_data[0])
 
+            with sqlite3.connect(self.db_name) as conn, DB_WRITE_SECONDS.time(
+                op="save_books"
+            ):
+                new_records = self._save_books(conn.cursor(), books_data)
                 # 确保提交事务
                 conn.commit()
                 logger.debug("事务已提交")
 
-                # 查询插入后的记录数
-                cursor.execute("SELECT COUNT(*) FROM books")
-                after_count = cursor.fetchone()[0]
-                logger.debug(f"保存后数据库记录数: {after_count}")
-
-                # 计算实际新增的记录数
-                new_records = after_count - before_count
-
                 logger.info(
-                    f"成功保存 {len(books_data)} 条书籍信息，新增 {new_records} 条记录"
+                    "成功保存 %d 条书籍信息，新增 %d 条记录",
+                    len(books_data),
+                    new_records,
                 )
                 return new_records
 
         except Exception as e:
-            logger.error(f"保存数据失败: {str(e)}")
+            logger.error("保存数据失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def _save_books(self, cursor, books_data: List[Tuple]) -> int:
+        """在给定游标的事务中写入书籍信息，返回新增记录数"""
+        inserted, updated = self._upsert_books(cursor, books_data)
+        logger.debug("新增 %d 条, 更新 %d 条", inserted, updated)
+        return inserted
+
+    def upsert_books(self, books_data: List[Tuple]) -> Tuple[int, int]:
+        """按 book_url 插入或更新书籍信息，返回 (新增数, 更新数)"""
+        if not books_data:
+            return 0, 0
+
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                result = self._upsert_books(conn.cursor(), books_data)
+                conn.commit()
+                return result
+        except Exception as e:
+            logger.error("保存数据失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0, 0
+
+    def _upsert_books(self, cursor, books_data: List[Tuple]) -> Tuple[int, int]:
+        # 同一批次内按 book_url 去重，保留最后一条
+        rows = list({book[BOOK_URL_INDEX]: book for book in books_data}.values())
+        urls = [book[BOOK_URL_INDEX] for book in rows]
+
+        # 借助 book_url 唯一索引查询已存在的记录，代价只与批次大小有关
+        updated = 0
+        for i in range(0, len(urls), 500):
+            chunk = urls[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT COUNT(*) FROM books WHERE book_url IN ({placeholders})",
+                chunk,
+            )
+            updated += cursor.fetchone()[0]
+
+        # ON CONFLICT 原地更新，保留原有 id 和 detail_crawled 状态
+        cursor.executemany(
+            """
+            INSERT INTO books (
+                category, book_name, book_url, latest_chapter,
+                latest_chapter_url, author, author_url,
+                word_count, update_time
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(book_url) DO UPDATE SET
+                category = excluded.category,
+                book_name = excluded.book_name,
+                latest_chapter = excluded.latest_chapter,
+                latest_chapter_url = excluded.latest_chapter_url,
+                author = excluded.author,
+                author_url = excluded.author_url,
+                word_count = excluded.word_count,
+                update_time = excluded.update_time
+        """,
+            rows,
+        )
+
+        if self.book_index is not None:
+            self.book_index.add(urls)
+        return len(rows) - updated, updated
+
+    def get_books_state(self, book_urls: List[str]) -> Dict[str, Tuple[str, str]]:
+        """按 book_url 查询已保存的 (update_time, latest_chapter_url)"""
+        state = {}
+        cursor = self._read_connection().cursor()
+        for i in range(0, len(book_urls), 500):
+            chunk = book_urls[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"""
+                SELECT book_url, update_time, latest_chapter_url FROM books
+                WHERE book_url IN ({placeholders})
+                """,
+                chunk,
+            )
+            for book_url, update_time, latest_chapter_url in cursor:
+                state[book_url] = (update_time, latest_chapter_url)
+        return state
+
+    def _save_changed_books(self, cursor, books_data: List[Tuple]) -> Tuple[int, int]:
+        """保存有变化的书籍，并重置其详情爬取状态以便重新爬取详情
+
+        同时标记 detail_stale，详情爬虫不会因已有详情记录而跳过这些书籍。
+        """
+        result = self._upsert_books(cursor, books_data)
+        urls = [book[BOOK_URL_INDEX] for book in books_data]
+        for i in range(0, len(urls), 500):
+            chunk = urls[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"""
+                UPDATE books SET detail_crawled = 0, detail_stale = 1
+                WHERE book_url IN ({placeholders})
+                """,
+                chunk,
+            )
+        return result
+
+    def count_books(self) -> int:
+        """获取书籍总数，不加载任何行数据"""
+        try:
+            cursor = self._read_connection().cursor()
+            cursor.execute("SELECT COUNT(*) FROM books")
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error("获取书籍总数失败: %s", e)
             logger.error(traceback.format_exc())
             return 0
 
+    def get_book_index(self) -> BookUrlIndex:
+        """获取 book_url 去重索引，首次调用时从数据库加载"""
+        if self.book_index is None:
+            cursor = self._read_connection().cursor()
+            cursor.execute("SELECT book_url FROM books")
+            self.book_index = BookUrlIndex(row[0] for row in cursor)
+            logger.info("加载去重索引: %s 条 book_url", len(self.book_index))
+        return self.book_index
+
     def get_all_books(self):
         """获取所有书籍信息"""
         try:
@@ -157,10 +722,10 @@ class Database:
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM books")
                 books = cursor.fetchall()
-                logger.debug(f"获取到 {len(books)} 条书籍信息")
+                logger.debug("获取到 %s 条书籍信息", len(books))
                 return books
         except Exception as e:
-            logger.error(f"获取数据失败: {str(e)}")
+            logger.error("获取数据失败: %s", e)
             logger.error(traceback.format_exc())
             return []
 
@@ -172,7 +737,7 @@ class Database:
                 cursor.execute("SELECT book_name FROM books")
                 return [row[0] for row in cursor.fetchall()]
         except Exception as e:
-            logger.error(f"获取书名失败: {str(e)}")
+            logger.error("获取书名失败: %s", e)
             logger.error(traceback.format_exc())
             return []
 
@@ -182,131 +747,748 @@ class Database:
             with sqlite3.connect(self.db_name) as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
-                cursor.execute(
-                    """
-                    SELECT id, book_url FROM books 
-                    WHERE detail_crawled = 0 
-                    LIMIT ?
-                    """,
-                    (limit,),
-                )
+                cursor.execute(UNCRAWLED_BOOKS_SQL, (limit,))
                 books = cursor.fetchall()
-                logger.debug(f"获取到 {len(books)} 条未爬取详情的书籍")
+                logger.debug("获取到 %d 条未爬取详情的书籍", len(books))
                 return books
         except Exception as e:
-            logger.error(f"获取未爬取书籍失败: {str(e)}")
+            logger.error("获取未爬取书籍失败: %s", e)
             logger.error(traceback.format_exc())
             return []
 
-    def save_book_detail(self, book_id, book_url, detail_data):
-        """保存书籍详情信息，使用扁平化字段结构"""
+    def claim_books(
+        self, owner: str, limit=100, lease_seconds: float = DETAIL_LEASE_SECONDS
+    ):
+        """原子地领取一批未爬取详情的书籍，租约到期前其他进程不会领到同一本"""
+        conn = self._lease_connection()
+        now = time.time()
         try:
-            # 从detail_data中提取各个字段
-            tags_json = json.dumps(detail_data.get("tags", []), ensure_ascii=False)
-
-            # 提取stats字段的数据
-            stats = detail_data.get("stats", {})
-            total_hits = self._extract_number(stats.get("总点击", "0"))
-            total_favor = self._extract_number(stats.get("总收藏", "0"))
-            total_word = self._extract_number(stats.get("总字数", "0"))
-
-            # 提取detail_stats字段的数据
-            detail_stats = detail_data.get("detail_stats", {})
-            total_recommend = self._extract_number(detail_stats.get("总推荐", "0"))
-            week_hits = self._extract_number(detail_stats.get("周点击", "0"))
-            mouth_hits = self._extract_number(detail_stats.get("月点击", "0"))
-            week_recommend = self._extract_number(detail_stats.get("周推荐", "0"))
-            mouth_recommend = self._extract_number(detail_stats.get("月点击", "0"))
-            book_type = detail_stats.get("小说类别", "")
-            word_count = detail_stats.get("完成字数", "")
-            chapter_count = self._extract_number(detail_stats.get("章节", "0"))
-            first_publish_status = detail_stats.get("首发状态", "")
+            # IMMEDIATE 事务在读之前就拿到写锁，多个进程领取时不会交叉
+            conn.execute("BEGIN IMMEDIATE")
+            book_ids = [
+                row[0] for row in conn.execute(CLAIMABLE_BOOKS_SQL, (now, limit))
+            ]
+            books = []
+            if book_ids:
+                placeholders = ",".join("?" * len(book_ids))
+                conn.execute(
+                    f"""
+                    UPDATE books SET lease_owner = ?, lease_expires = ?
+                    WHERE id IN ({placeholders})
+                    """,
+                    (owner, now + lease_seconds, *book_ids),
+                )
+                books = conn.execute(
+                    f"""
+                    SELECT id, book_url, detail_stale FROM books
+                    WHERE id IN ({placeholders})
+                    """,
+                    book_ids,
+                ).fetchall()
+            conn.execute("COMMIT")
+            logger.debug("%s 领取 %d 本书籍", owner, len(books))
+            return books
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error("领取书籍失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
 
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+    def renew_leases(
+        self,
+        owner: str,
+        book_ids: List[int],
+        lease_seconds: float = DETAIL_LEASE_SECONDS,
+    ) -> int:
+        """为仍由 owner 持有的租约续期，返回续期成功的数量"""
+        return self._update_leases(
+            "lease_expires = ?",
+            (time.time() + lease_seconds,),
+            "lease_owner = ? AND detail_crawled = 0",
+            (owner,),
+            book_ids,
+        )
 
-                # 插入详情数据 - 修正字段顺序和数量
-                cursor.execute(
+    def release_leases(self, owner: str, book_ids: List[int]) -> int:
+        """释放 owner 持有的租约，使这些书籍可以立即被重新领取"""
+        return self._update_leases(
+            "lease_owner = NULL, lease_expires = 0",
+            (),
+            "lease_owner = ?",
+            (owner,),
+            book_ids,
+        )
+
+    def reclaim_expired_leases(self) -> int:
+        """清理已过期的租约，返回清理的数量"""
+        try:
+            conn = self._lease_connection()
+            with conn:
+                cursor = conn.execute(
                     """
-                    INSERT OR REPLACE INTO book_details (
-                        book_id, book_url, title, author, author_id,
-                        description, last_update, status, tags,
-                        total_hits, total_favor, total_word,
-                        total_recommend, week_hits, mouth_hits, 
-                        week_recommend, mouth_recommend,
-                        book_type, word_count, chapter_count, 
-                        first_publish_status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    UPDATE books SET lease_owner = NULL, lease_expires = 0
+                    WHERE detail_crawled = 0
+                      AND lease_expires > 0 AND lease_expires < ?
                     """,
-                    (
-                        book_id,
-                        book_url,
-                        detail_data.get("title", ""),
-                        detail_data.get("author", ""),
-                        detail_data.get("author_id", ""),
-                        detail_data.get("description", ""),
-                        detail_data.get("last_update", ""),
-                        detail_data.get("status", ""),
-                        tags_json,
-                        total_hits,
-                        total_favor,
-                        total_word,
-                        total_recommend,
-                        week_hits,
-                        mouth_hits,
-                        week_recommend,
-                        mouth_recommend,
-                        book_type,
-                        word_count,
-                        chapter_count,
-                        first_publish_status,
-                    ),
+                    (time.time(),),
                 )
+            if cursor.rowcount:
+                logger.info("回收 %s 个过期租约", cursor.rowcount)
+            return cursor.rowcount
+        except Exception as e:
+            logger.error("回收过期租约失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
 
-                # 更新书籍表中的爬取状态
-                cursor.execute(
+    def _update_leases(self, assignments, values, condition, params, book_ids):
+        count = 0
+        try:
+            conn = self._lease_connection()
+            with conn:
+                for i in range(0, len(book_ids), 500):
+                    chunk = book_ids[i : i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(
+                        f"""
+                        UPDATE books SET {assignments}
+                        WHERE {condition} AND id IN ({placeholders})
+                        """,
+                        (*values, *params, *chunk),
+                    )
+                    count += cursor.rowcount
+            return count
+        except Exception as e:
+            logger.error("更新租约失败: %s", e)
+            logger.error(traceback.format_exc())
+            return count
+
+    def _lease_connection(self):
+        """租约操作使用的线程内长连接，自行管理事务"""
+        conn = getattr(self._local, "lease_conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.row_factory = sqlite3.Row
+            self._local.lease_conn = conn
+        return conn
+
+    def get_books_for_chapters(self, after_id=0, limit=1000):
+        """按 id 顺序分页获取书籍，用于遍历全部书籍的章节目录"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.row_factory = sqlite3.Row
+                return conn.execute(
                     """
-                    UPDATE books SET detail_crawled = 1
-                    WHERE id = ?
+                    SELECT id, book_url, latest_chapter_url, chapters_checked_at
+                    FROM books
+                    WHERE id > ? ORDER BY id LIMIT ?
                     """,
-                    (book_id,),
-                )
+                    (after_id, limit),
+                ).fetchall()
+        except Exception as e:
+            logger.error("获取书籍列表失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def get_uncrawled_authors(self, after_url="", limit=1000):
+        """按 author_url 顺序分页获取尚未爬取的作者，多本书的作者只出现一次"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.row_factory = sqlite3.Row
+                return conn.execute(
+                    """
+                    SELECT author_url, MAX(author) AS author FROM books
+                    WHERE author_url > ?
+                      AND NOT EXISTS (
+                          SELECT 1 FROM authors a WHERE a.author_url = books.author_url
+                      )
+                    GROUP BY author_url
+                    ORDER BY author_url
+                    LIMIT ?
+                    """,
+                    (after_url, limit),
+                ).fetchall()
+        except Exception as e:
+            logger.error("获取作者列表失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def has_chapter(self, chapter_id: int) -> bool:
+        """章节是否已入库"""
+        cursor = self._read_connection().cursor()
+        cursor.execute("SELECT 1 FROM chapters WHERE chapter_id = ?", (chapter_id,))
+        return cursor.fetchone() is not None
+
+    def get_pending_covers(self, after_id=0, limit=1000):
+        """按 id 分页获取需要下载封面的书籍：尚未下载或封面链接已变化"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.row_factory = sqlite3.Row
+                return conn.execute(PENDING_COVERS_SQL, (after_id, limit)).fetchall()
+        except Exception as e:
+            logger.error("获取待下载封面失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def get_downloaded_covers(self, after_id=0, limit=1000):
+        """按 id 分页获取已记录封面文件的书籍，返回 id、book_image 和 cover_sha256"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.row_factory = sqlite3.Row
+                return conn.execute(DOWNLOADED_COVERS_SQL, (after_id, limit)).fetchall()
+        except Exception as e:
+            logger.error("获取已下载封面失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
 
+    def get_books_without_image(self, after_id=0, limit=100):
+        """按 id 分页获取详情已爬取但仍没有封面的书籍"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                conn.row_factory = sqlite3.Row
+                books = conn.execute(
+                    BOOKS_WITHOUT_IMAGE_SQL, (after_id, limit)
+                ).fetchall()
+                logger.debug("获取到 %s 条没有封面的书籍", len(books))
+                return books
+        except Exception as e:
+            logger.error("获取没有封面的书籍失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def save_book_detail(self, book_id, book_url, detail_data):
+        """保存书籍详情信息，使用扁平化字段结构"""
+        try:
+            row = detail_row(book_id, book_url, detail_data)
+
+            with sqlite3.connect(self.db_name) as conn, DB_WRITE_SECONDS.time(
+                op="save_book_detail"
+            ):
+                self._save_book_detail(
+                    conn.cursor(), row, detail_data.get("cover", "")
+                )
                 conn.commit()
-                logger.info(f"成功保存书籍 {book_url} 的详情")
+                logger.debug("成功保存书籍 %s 的详情", book_url)
                 return True
         except Exception as e:
-            logger.error(f"保存书籍详情失败 {book_url}: {str(e)}")
+            logger.error("保存书籍详情失败 %s: %s", book_url, e)
             logger.error(traceback.format_exc())
             return False
 
-    def _extract_number(self, text):
-        """从字符串中提取数字"""
-        if not text:
+    def _save_book_detail(self, cursor, row: Tuple, cover: str = "") -> bool:
+        """在给定游标的事务中写入一条详情、封面链接并标记已爬取"""
+        cursor.execute(_DETAIL_REPLACE_SQL, row)
+
+        self._record_stats(cursor, [stats_snapshot(row)])
+
+        # 更新书籍表中的爬取状态
+        self._mark_detail_crawled(cursor, row[0], cover)
+        return True
+
+    def _mark_detail_crawled(self, cursor, book_id, cover: str = "") -> bool:
+        # 没有解析到封面时保留原有链接
+        cursor.execute(
+            """
+            UPDATE books
+            SET detail_crawled = 1, detail_stale = 0,
+                lease_owner = NULL, lease_expires = 0,
+                book_image = COALESCE(NULLIF(?, ''), book_image)
+            WHERE id = ?
+            """,
+            (cover, book_id),
+        )
+        return True
+
+    def save_book_details_bulk(self, records: Iterable[Tuple]) -> int:
+        """批量保存书籍详情
+
+        records 为 (book_id, book_url, detail_data) 序列，
+        在一个事务中用 executemany 写入并统一更新爬取状态，返回写入条数。
+        """
+        records = list(records)
+        rows = [detail_row(*record) for record in records]
+        if not rows:
             return 0
 
         try:
-            # 移除非数字字符，保留小数点
-            text = "".join(c for c in text if c.isdigit() or c == ".")
-            if text:
-                if "." in text:
-                    return float(text)
-                return int(text)
-            return 0
-        except:
+            with sqlite3.connect(self.db_name) as conn:
+                count = self._save_book_details_bulk(
+                    conn.cursor(), rows, self._detail_covers(records)
+                )
+                conn.commit()
+            logger.info("批量保存 %s 条书籍详情", count)
+            return count
+        except Exception as e:
+            logger.error("批量保存书籍详情失败: %s", e)
+            logger.error(traceback.format_exc())
             return 0
 
+    @staticmethod
+    def _detail_covers(records: List[Tuple]) -> List[Tuple]:
+        """从 (book_id, book_url, detail_data) 中取出解析到的封面，生成 (封面, book_id)"""
+        return [
+            (detail_data["cover"], book_id)
+            for book_id, _, detail_data in records
+            if detail_data.get("cover")
+        ]
+
+    def _save_book_details_bulk(
+        self, cursor, rows: List[Tuple], covers: List[Tuple] = ()
+    ) -> int:
+        cursor.executemany(_DETAIL_UPSERT_SQL, rows)
+        if covers:
+            cursor.executemany("UPDATE books SET book_image = ? WHERE id = ?", covers)
+        self._record_stats(cursor, [stats_snapshot(row) for row in rows])
+        book_ids = [row[0] for row in rows]
+        for i in range(0, len(book_ids), 500):
+            chunk = book_ids[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"""
+                UPDATE books
+                SET detail_crawled = 1, detail_stale = 0,
+                    lease_owner = NULL, lease_expires = 0
+                WHERE id IN ({placeholders})
+                """,
+                chunk,
+            )
+        return len(rows)
+
+    def _record_stats(self, cursor, snapshots: List[Tuple], ts: int = None) -> int:
+        """与每本书最近一次快照比较，只追加有变化的统计，返回追加数量
+
+        snapshots 为 (book_id, 按 STATS_COLUMNS 排列的数值) 序列。
+        """
+        ts = int(time.time()) if ts is None else ts
+        columns = ", ".join(STATS_COLUMNS)
+        latest = {}
+        book_ids = list({book_id for book_id, _ in snapshots})
+        for i in range(0, len(book_ids), 500):
+            chunk = book_ids[i : i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"""
+                SELECT h.book_id, {columns} FROM book_stats_history h
+                JOIN (
+                    SELECT book_id, MAX(ts) AS ts FROM book_stats_history
+                    WHERE book_id IN ({placeholders}) GROUP BY book_id
+                ) last USING (book_id, ts)
+                """,
+                chunk,
+            )
+            latest.update((row[0], tuple(row[1:])) for row in cursor)
+
+        changed = []
+        for book_id, values in snapshots:
+            if latest.get(book_id) != values:
+                latest[book_id] = values
+                changed.append((book_id, ts, *values))
+        # 同一秒内多次写入同一本书时以最后一次为准
+        cursor.executemany(
+            f"""
+            INSERT OR REPLACE INTO book_stats_history (book_id, ts, {columns})
+            VALUES ({", ".join("?" * (len(STATS_COLUMNS) + 2))})
+            """,
+            changed,
+        )
+        return len(changed)
+
+    def get_stats_series(
+        self, book_id: int, start_ts: int = None, end_ts: int = None
+    ) -> List[Dict]:
+        """返回一本书在时间区间内的统计快照，按时间升序"""
+        try:
+            cursor = self._read_connection().cursor()
+            cursor.execute(
+                f"""
+                SELECT ts, {", ".join(STATS_COLUMNS)} FROM book_stats_history
+                WHERE book_id = ? AND ts BETWEEN ? AND ?
+                ORDER BY ts
+                """,
+                (book_id, start_ts or 0, end_ts or int(time.time())),
+            )
+            names = ("ts",) + STATS_COLUMNS
+            return [dict(zip(names, row)) for row in cursor]
+        except Exception as e:
+            logger.error("获取统计历史失败 %s: %s", book_id, e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def get_top_movers(
+        self, metric: str = "total_hits", window: int = 7 * 24 * 3600, limit=20
+    ) -> List[Dict]:
+        """返回最近 window 秒内 metric 增长最多的书籍
+
+        只扫描窗口内有新快照的书籍，再按主键取窗口起点和最新的数值；
+        窗口开始前没有快照的书籍以其第一条快照为起点。
+        """
+        if metric not in STATS_COLUMNS:
+            raise ValueError(f"不支持的统计字段: {metric}")
+        since = int(time.time()) - window
+        try:
+            cursor = self._read_connection().cursor()
+            cursor.execute(
+                f"""
+                SELECT book_id, start_value, end_value,
+                       end_value - start_value AS delta
+                FROM (
+                    SELECT c.book_id,
+                        COALESCE(
+                            (SELECT {metric} FROM book_stats_history h
+                             WHERE h.book_id = c.book_id AND h.ts <= ?
+                             ORDER BY h.ts DESC LIMIT 1),
+                            (SELECT {metric} FROM book_stats_history h
+                             WHERE h.book_id = c.book_id
+                             ORDER BY h.ts LIMIT 1)
+                        ) AS start_value,
+                        (SELECT {metric} FROM book_stats_history h
+                         WHERE h.book_id = c.book_id
+                         ORDER BY h.ts DESC LIMIT 1) AS end_value
+                    FROM (
+                        SELECT DISTINCT book_id
+                        FROM book_stats_history INDEXED BY idx_stats_history_ts
+                        WHERE ts > ?
+                    ) c
+                )
+                ORDER BY delta DESC
+                LIMIT ?
+                """,
+                (since, since, limit),
+            )
+            names = ("book_id", "start_value", "end_value", "delta")
+            return [dict(zip(names, row)) for row in cursor]
+        except Exception as e:
+            logger.error("获取统计变化排行失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def _record_page(
+        self, cursor, page: int, status: str, row_count: int = 0, content_hash=None
+    ) -> int:
+        """记录列表页的爬取状态，累加尝试次数"""
+        cursor.execute(
+            """
+            INSERT INTO crawl_pages (page, status, attempts, row_count, content_hash)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT(page) DO UPDATE SET
+                status = excluded.status,
+                attempts = attempts + 1,
+                row_count = excluded.row_count,
+                content_hash = COALESCE(excluded.content_hash, content_hash),
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (page, status, row_count, content_hash),
+        )
+        return 0
+
+    def _save_page(
+        self, cursor, page: int, books_data: List[Tuple], row_count: int, content_hash
+    ) -> int:
+        """在同一事务中保存一页书籍并标记该页完成，返回新增记录数"""
+        saved_count = self._save_books(cursor, books_data) if books_data else 0
+        self._record_page(cursor, page, PAGE_DONE, row_count, content_hash)
+        return saved_count
+
+    def get_pending_pages(self, start_page: int, end_page: int) -> List[int]:
+        """获取区间内尚未成功爬取的页码"""
+        try:
+            cursor = self._read_connection().cursor()
+            cursor.execute(
+                """
+                SELECT page FROM crawl_pages
+                WHERE status = ? AND page BETWEEN ? AND ?
+                """,
+                (PAGE_DONE, start_page, end_page),
+            )
+            done = {row[0] for row in cursor}
+            return [p for p in range(start_page, end_page + 1) if p not in done]
+        except Exception as e:
+            logger.error("获取爬取进度失败: %s", e)
+            logger.error(traceback.format_exc())
+            return list(range(start_page, end_page + 1))
+
+    def start_writer(self, **kwargs) -> DatabaseWriter:
+        """启动单写线程，之后的 submit_* 写操作都经由它分组提交
+
+        多个爬取线程会同时首次调用 submit_*，加锁保证只启动一个写线程。
+        """
+        with self._writer_lock:
+            if self.writer is None:
+                self.writer = DatabaseWriter(self.db_name, **kwargs).start()
+            return self.writer
+
+    def submit_books(self, books_data: List[Tuple]) -> Future:
+        """异步保存书籍信息，Future 返回新增记录数"""
+        return self.start_writer().submit(self._save_books, books_data)
+
+    def submit_upsert_books(self, books_data: List[Tuple]) -> Future:
+        """异步插入或更新书籍信息，Future 返回 (新增数, 更新数)"""
+        return self.start_writer().submit(self._upsert_books, books_data)
+
+    def submit_page(
+        self, page: int, books_data: List[Tuple], row_count: int, content_hash: str
+    ) -> Future:
+        """异步保存一页书籍并记录进度，Future 返回新增记录数"""
+        return self.start_writer().submit(
+            self._save_page, page, books_data, row_count, content_hash
+        )
+
+    def submit_listing_page(self, page: int, books_data: List[Tuple]) -> Future:
+        """异步保存一页列表数据并记录进度，Future 返回新增记录数
+
+        按 book_url 过滤掉已存在的书籍，并先登记避免其他线程重复写入；
+        事务没有提交时撤销登记，否则这些书籍会一直被当作已存在而跳过。
+        """
+        book_index = self.get_book_index()
+        new_books = book_index.claim_new(books_data)
+        skipped_count = len(books_data) - len(new_books)
+        if skipped_count > 0:
+            logger.debug("第 %d 页跳过 %d 条重复记录", page, skipped_count)
+
+        # 书籍和页面进度在同一事务中提交
+        future = self.submit_page(
+            page, new_books, len(books_data), page_hash(books_data)
+        )
+        claimed_urls = [book[BOOK_URL_INDEX] for book in new_books]
+
+        def release_on_failure(done):
+            if claimed_urls and done.exception() is not None:
+                book_index.release(claimed_urls)
+                logger.warning(
+                    "第 %d 页写入失败，撤销 %d 条去重登记", page, len(claimed_urls)
+                )
+
+        future.add_done_callback(release_on_failure)
+        return future
+
+    def submit_page_failed(self, page: int) -> Future:
+        """异步记录列表页爬取失败"""
+        return self.start_writer().submit(self._record_page, page, PAGE_FAILED)
+
+    def submit_changed_books(self, books_data: List[Tuple]) -> Future:
+        """异步保存有变化的书籍，Future 返回 (新增数, 更新数)"""
+        return self.start_writer().submit(self._save_changed_books, books_data)
+
+    def submit_book_detail(self, book_id, book_url, detail_data) -> Future:
+        """异步保存书籍详情，Future 在事务提交后返回 True"""
+        row = detail_row(book_id, book_url, detail_data)
+        return self.start_writer().submit(
+            self._save_book_detail, row, detail_data.get("cover", "")
+        )
+
+    def submit_book_details_bulk(self, records: Iterable[Tuple]) -> Future:
+        """异步批量保存书籍详情，Future 返回写入条数"""
+        records = list(records)
+        rows = [detail_row(*record) for record in records]
+        return self.start_writer().submit(
+            self._save_book_details_bulk, rows, self._detail_covers(records)
+        )
+
+    def submit_chapters(self, book_id, volumes: List[Dict]) -> Future:
+        """异步保存章节目录，Future 返回 (新增数, 更新数)"""
+        return self.start_writer().submit(self._save_chapters, book_id, volumes)
+
+    def _save_chapters(self, cursor, book_id, volumes: List[Dict]) -> Tuple[int, int]:
+        """与已入库的章节比较，插入新章节，更新标题、锁定状态或所在位置有变化的章节
+
+        网站调整章节顺序或把章节移到其他卷时，已有章节的 volume_id 和 position 随之更新。
+        """
+        cursor.execute(
+            """
+            SELECT chapter_id, volume_id, title, is_locked, url, position
+            FROM chapters WHERE book_id = ?
+            """,
+            (book_id,),
+        )
+        existing = {row[0]: row[1:] for row in cursor}
+
+        rows = []
+        new_count = 0
+        position = 0
+        for volume_position, volume in enumerate(volumes):
+            cursor.execute(
+                """
+                INSERT INTO volumes (book_id, position, title) VALUES (?, ?, ?)
+                ON CONFLICT(book_id, position) DO UPDATE SET title = excluded.title
+                """,
+                (book_id, volume_position, volume["title"]),
+            )
+            volume_id = cursor.execute(
+                "SELECT id FROM volumes WHERE book_id = ? AND position = ?",
+                (book_id, volume_position),
+            ).fetchone()[0]
+
+            for chapter in volume["chapters"]:
+                chapter_id = chapter["chapter_id"]
+                if chapter_id is None:
+                    continue
+                position += 1
+                state = (
+                    volume_id,
+                    chapter["title"],
+                    int(chapter["is_locked"]),
+                    chapter["url"],
+                    position,
+                )
+                if chapter_id not in existing:
+                    new_count += 1
+                elif existing[chapter_id] == state:
+                    continue
+                rows.append((chapter_id, book_id, *state))
+
+        cursor.executemany(
+            """
+            INSERT INTO chapters (
+                chapter_id, book_id, volume_id, title, is_locked, url, position
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chapter_id) DO UPDATE SET
+                volume_id = excluded.volume_id,
+                title = excluded.title,
+                is_locked = excluded.is_locked,
+                url = excluded.url,
+                position = excluded.position
+            """,
+            rows,
+        )
+        cursor.execute(
+            "UPDATE books SET chapters_checked_at = ? WHERE id = ?",
+            (int(time.time()), book_id),
+        )
+        if new_count:
+            logger.debug("书籍 %s 新增 %d 个章节", book_id, new_count)
+        return new_count, len(rows) - new_count
+
+    def submit_author(self, author_url, name, info: Dict) -> Future:
+        """异步保存作者信息及其作品列表，Future 返回是否成功"""
+        return self.start_writer().submit(self._save_author, author_url, name, info)
+
+    def _save_author(self, cursor, author_url, name, info: Dict) -> bool:
+        match = _READER_ID.search(author_url)
+        cursor.execute(
+            """
+            INSERT INTO authors (
+                author_id, author_url, name, book_amount, footprint,
+                fans, following, avatar
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(author_url) DO UPDATE SET
+                author_id = excluded.author_id,
+                name = excluded.name,
+                book_amount = excluded.book_amount,
+                footprint = excluded.footprint,
+                fans = excluded.fans,
+                following = excluded.following,
+                avatar = excluded.avatar,
+                crawled_at = CURRENT_TIMESTAMP
+            """,
+            (
+                int(match.group(1)) if match else None,
+                author_url,
+                name,
+                self._extract_number(info["book_amount"]),
+                self._extract_number(info["footprint"]),
+                self._extract_number(info["fans"]),
+                self._extract_number(info["following"]),
+                info["avatar"],
+            ),
+        )
+        cursor.executemany(
+            """
+            INSERT INTO author_books (
+                author_url, book_id, name, url, cover, clicks,
+                category, update_to, update_time
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(author_url, book_id) DO UPDATE SET
+                name = excluded.name,
+                url = excluded.url,
+                cover = excluded.cover,
+                clicks = excluded.clicks,
+                category = excluded.category,
+                update_to = excluded.update_to,
+                update_time = excluded.update_time
+            """,
+            [
+                (
+                    author_url,
+                    book["book_id"],
+                    book["name"],
+                    book["url"],
+                    book["cover"],
+                    book["clicks"],
+                    book["category"],
+                    book["update_to"],
+                    book["update_time"],
+                )
+                for book in info["books"]
+            ],
+        )
+        return True
+
+    def submit_cover(self, book_id, cover_url, sha256, size) -> Future:
+        """异步记录已下载的封面文件"""
+        return self.start_writer().submit(
+            self._save_cover, book_id, cover_url, sha256, size
+        )
+
+    def _save_cover(self, cursor, book_id, cover_url, sha256, size) -> bool:
+        cursor.execute(
+            """
+            UPDATE books SET cover_sha256 = ?, cover_size = ?, cover_url = ?
+            WHERE id = ?
+            """,
+            (sha256, size, cover_url, book_id),
+        )
+        return True
+
+    def submit_book_image(self, book_id, image_url) -> Future:
+        """异步补写封面链接，只填充仍为空的记录"""
+        return self.start_writer().submit(self._save_book_image, book_id, image_url)
+
+    def _save_book_image(self, cursor, book_id, image_url) -> bool:
+        # 期间详情爬取可能已写入封面，以详情页为准
+        cursor.execute(
+            """
+            UPDATE books SET book_image = ?
+            WHERE id = ? AND (book_image IS NULL OR book_image = '')
+            """,
+            (image_url, book_id),
+        )
+        return cursor.rowcount == 1
+
+    def submit_detail_crawled(self, book_id) -> Future:
+        """异步标记书籍详情已爬取"""
+        return self.start_writer().submit(self._mark_detail_crawled, book_id)
+
+    def close(self):
+        """提交写队列中剩余的数据并关闭写线程"""
+        with self._writer_lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+            logger.info("写线程已关闭，共提交 %s 次事务", writer.commit_count)
+
+    def _read_connection(self):
+        """每个线程复用一个只读长连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name)
+            self._local.conn = conn
+        return conn
+
+    def _extract_number(self, text):
+        """从字符串中提取数字"""
+        return extract_number(text)
+
     def is_detail_exists(self, book_url):
         """检查书籍详情是否已存在"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT COUNT(*) FROM book_details WHERE book_url = ?", (book_url,)
-                )
-                count = cursor.fetchone()[0]
-                return count > 0
+            cursor = self._read_connection().cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM book_details WHERE book_url = ?", (book_url,)
+            )
+            count = cursor.fetchone()[0]
+            return count > 0
         except Exception as e:
-            logger.error(f"检查书籍详情是否存在失败 {book_url}: {str(e)}")
+            logger.error("检查书籍详情是否存在失败 %s: %s", book_url, e)
             logger.error(traceback.format_exc())
             return False
@@ -0,0 +1,145 @@
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Callable
+
+from logger import setup_logger
+from config import LOG_PATH
+from metrics import DB_WRITE_SECONDS, track_queue_depth
+
+logger = setup_logger("db_writer", LOG_PATH)
+
+_STOP = object()
+
+
+def completed_future(value) -> Future:
+    """返回一个已完成的 Future，便于生产者在无需写库时保持统一返回值"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class DatabaseWriter:
+    """单写线程的 SQLite 写入器
+
+    独占一个 WAL 模式的长连接，从有界队列中取出写操作，
+    按数量或时间阈值分组提交事务。生产者只需入队并拿到 Future。
+    """
+
+    def __init__(
+        self,
+        db_name: str,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+    ):
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.commit_count = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        track_queue_depth("db_writer", self._queue.qsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._thread = threading.Thread(
+                target=self._run, name="db-writer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def submit(self, op: Callable, *args) -> Future:
+        """提交写操作 op(cursor, *args)，事务提交后 Future 返回 op 的结果"""
+        if self._thread is None:
+            self.start()
+        future = Future()
+        # 队列满时阻塞，对生产者形成背压
+        self._queue.put((op, args, future))
+        return future
+
+    def flush(self, timeout: float = None):
+        """等待此前提交的所有写操作完成"""
+        self.submit(lambda cursor: None).result(timeout)
+
+    def close(self):
+        """提交剩余数据并停止写线程"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        cursor = conn.cursor()
+        results = []
+        start = time.perf_counter()
+        try:
+            cursor.execute("BEGIN")
+            for op, args, future in batch:
+                # 每个操作使用独立保存点，单个失败不影响整批
+                cursor.execute("SAVEPOINT op")
+                try:
+                    results.append((future, op(cursor, *args), None))
+                    cursor.execute("RELEASE op")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO op")
+                    cursor.execute("RELEASE op")
+                    results.append((future, None, e))
+            cursor.execute("COMMIT")
+            DB_WRITE_SECONDS.observe(time.perf_counter() - start, op="writer_batch")
+            self.commit_count += 1
+            logger.debug("提交 %d 个写操作", len(batch))
+        except Exception as e:
+            logger.error("批量提交失败: %s", e)
+            logger.error(traceback.format_exc())
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -1,95 +1,90 @@
 import time
-import random
 import traceback
 import argparse
+import asyncio
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
+import aiohttp
 from tqdm import tqdm
-import sqlite3
 
-from database import Database
-from details import get_book_data
+from database import LeaseHeartbeat, new_lease_owner
+from db_writer import completed_future
+from details import fetch_book_page
+from header_profiles import get_header_profiles
+from http_cache import get_http_cache
+from http_client import create_async_session
+from parse_pool import get_parse_pool
 from logger import setup_logger
-from config import PROXIES, LOG_PATH
-import requests
+from config import LOG_PATH
+from storage import open_storage
+from proxy_pool import get_proxy_manager, to_requests_proxies
+from rate_limiter import get_rate_limiter
+from metrics import REQUESTS, RETRIES, observe_response, start_metrics
 
 logger = setup_logger("detail_crawler", LOG_PATH)
 
+# 在代理对应的浏览器请求头之上追加的字段
+DETAIL_HEADERS = {
+    "Referer": "https://www.ciweimao.com/book_list",
+}
 
-def get_valid_proxy(proxies_list):
-    """获取有效代理"""
-    if not proxies_list:
-        logger.warning("没有可用代理")
-        return None
 
-    proxy_list = proxies_list.copy()
-    while proxy_list:
-        proxy = random.choice(proxy_list)
-        proxies = {"http": proxy, "https": proxy} if proxy else None
-        try:
-            response = requests.get(
-                "https://www.ciweimao.com", proxies=proxies, timeout=5
-            )
-            if response.status_code == 200:
-                logger.debug(f"找到有效代理: {proxy}")
-                return proxy
-            logger.warning(f"代理 {proxy} 响应状态码: {response.status_code}")
-        except Exception as e:
-            logger.warning(f"代理 {proxy} 测试失败: {str(e)}")
-            proxy_list.remove(proxy)
-    return None
+def detail_headers(proxy):
+    return {**get_header_profiles().for_proxy(proxy), **DETAIL_HEADERS}
+
 
+def crawl_book_detail(book_id, book_url, db, retries=3, stale=False):
+    """爬取单本书籍详情，返回写库 Future（结果为是否成功）
 
-def crawl_book_detail(book_id, book_url, db, retries=3):
-    """爬取单本书籍详情"""
+    stale 为 True 表示已有的详情已过期，跳过存在性检查并绕过缓存重新抓取。
+    """
     # 检查详情是否已爬取，避免重复爬取
-    if db.is_detail_exists(book_url):
-        logger.info(f"书籍 {book_url} 详情已存在，跳过")
+    if not stale and db.is_detail_exists(book_url):
+        logger.debug("书籍 %s 详情已存在，跳过", book_url)
         # 更新爬取状态
-        with sqlite3.connect(db.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE books SET detail_crawled = 1 WHERE id = ?", (book_id,)
-            )
-            conn.commit()
-        return True
+        return db.submit_detail_crawled(book_id)
 
-    # 获取有效代理
-    proxy = get_valid_proxy(PROXIES)
-    proxies = {"http": proxy, "https": proxy} if proxy else None
+    proxy_manager = get_proxy_manager()
+    rate_limiter = get_rate_limiter()
+    proxy = proxy_manager.get_proxy()
 
     for attempt in range(retries):
         try:
-            # 增加请求头模拟浏览器
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-                "Referer": "https://www.ciweimao.com/book_list",
-            }
-
-            # 爬取详情
-            book_data = get_book_data(book_url, proxies=proxies, headers=headers)
+            # 爬取详情，缓存命中时不经过限速器
+            start = time.monotonic()
+            response = fetch_book_page(
+                book_url,
+                proxies=to_requests_proxies(proxy),
+                headers=detail_headers(proxy),
+                before_send=lambda: rate_limiter.acquire(book_url, proxy),
+                revalidate=stale,
+            )
+            if not response.from_cache:
+                proxy_manager.report_success(proxy, time.monotonic() - start)
+                rate_limiter.report(book_url, proxy, status=200)
+            # 在解析进程池中解析，避免多个爬取线程争抢 GIL
+            book_data = get_parse_pool().parse("detail", response.content).result()
 
-            # 保存到数据库
-            if db.save_book_detail(book_id, book_url, book_data):
-                logger.info(f"成功爬取并保存书籍 {book_url} 的详情")
-                return True
+            # 交给写线程保存
+            logger.debug("成功爬取书籍 %s 的详情", book_url)
+            return db.submit_book_detail(book_id, book_url, book_data)
 
         except Exception as e:
+            proxy_manager.report_error(proxy, e)
+            rate_limiter.report(book_url, proxy, error=e)
             if attempt == retries - 1:  # 最后一次重试
-                logger.error(f"爬取书籍 {book_url} 详情失败: {str(e)}")
+                logger.error("爬取书籍 %s 详情失败: %s", book_url, e)
                 logger.error(traceback.format_exc())
-                return False
+                return completed_future(False)
 
             logger.warning(
-                f"爬取书籍 {book_url} 详情失败，重试中... (尝试 {attempt + 1}/{retries})"
+                "爬取书籍 %s 详情失败，重试中... (尝试 %s/%s)", book_url, attempt + 1, retries
             )
-            # 更换代理重试
-            proxy = get_valid_proxy(PROXIES)
-            proxies = {"http": proxy, "https": proxy} if proxy else None
-            time.sleep(random.uniform(1, 3))  # 随机延迟
+            RETRIES.inc(kind="detail")
+            # 更换代理重试，等待由限速器决定
+            proxy = proxy_manager.get_proxy()
 
-    return False
+    return completed_future(False)
 
 
 def crawl_details_multi_thread(
@@ -103,62 +98,78 @@ def crawl_details_multi_thread(
         continuous: 是否持续爬取直到全部完成
         rest_time: 每批爬取后的休息时间(秒)
     """
-    db = Database()
+    db = open_storage()
+    # 以租约方式领取任务，多个爬虫进程可以共享同一个数据库
+    owner = new_lease_owner()
+    heartbeat = LeaseHeartbeat(db, owner)
+    logger.info("租约持有者: %s", owner)
     total_success = 0
     total_fail = 0
     batch_count = 0
 
     while True:
         batch_count += 1
-        # 获取待爬取的书籍
-        books = db.get_uncrawled_books(limit=batch_size)
+        db.reclaim_expired_leases()
+        # 领取待爬取的书籍
+        books = db.claim_books(owner, limit=batch_size)
         if not books:
             logger.info("没有需要爬取详情的书籍，爬取完成")
             break
 
-        logger.info(f"第 {batch_count} 批: 找到 {len(books)} 本需要爬取详情的书籍")
+        logger.info("第 %s 批: 找到 %s 本需要爬取详情的书籍", batch_count, len(books))
 
+        heartbeat.add(book["id"] for book in books)
         success_count = 0
         fail_count = 0
+        failed_ids = []
 
         # 使用线程池处理爬取任务
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 创建任务列表
             future_to_book = {
                 executor.submit(
-                    crawl_book_detail, book["id"], book["book_url"], db
-                ): book["book_url"]
+                    crawl_book_detail,
+                    book["id"],
+                    book["book_url"],
+                    db,
+                    stale=bool(book["detail_stale"]),
+                ): book
                 for book in books
             }
 
             # 使用tqdm显示进度
             with tqdm(total=len(books), desc=f"批次 {batch_count} 爬取进度") as pbar:
                 for future in future_to_book:
-                    book_url = future_to_book[future]
+                    book_id = future_to_book[future]["id"]
+                    book_url = future_to_book[future]["book_url"]
                     try:
-                        result = future.result()
+                        result = future.result().result()
                         if result:
                             success_count += 1
                         else:
                             fail_count += 1
+                            failed_ids.append(book_id)
                         pbar.set_description(
                             f"批次 {batch_count}: {success_count}成功/{fail_count}失败"
                         )
                     except Exception as e:
-                        logger.error(f"处理书籍 {book_url} 时出现异常: {str(e)}")
+                        logger.error("处理书籍 %s 时出现异常: %s", book_url, e)
                         fail_count += 1
+                        failed_ids.append(book_id)
                     finally:
+                        heartbeat.discard(book_id)
                         pbar.update(1)
-                        # 随机延迟，避免请求过快
-                        time.sleep(random.uniform(0.5, 1.5))
+
+        # 失败的书籍释放租约，下一批可以重新领取
+        db.release_leases(owner, failed_ids)
 
         total_success += success_count
         total_fail += fail_count
 
         logger.info(
-            f"第 {batch_count} 批爬取完成! 成功: {success_count}, 失败: {fail_count}"
+            "第 %s 批爬取完成! 成功: %s, 失败: %s", batch_count, success_count, fail_count
         )
-        logger.info(f"累计爬取: 成功 {total_success}, 失败 {total_fail}")
+        logger.info("累计爬取: 成功 %s, 失败 %s", total_success, total_fail)
 
         # 如果不是持续爬取模式，退出循环
         if not continuous:
@@ -166,10 +177,183 @@ def crawl_details_multi_thread(
 
         # 如果还有更多书籍要爬取，休息一段时间再继续
         if books and rest_time > 0:
-            logger.info(f"休息 {rest_time} 秒后继续下一批爬取...")
+            logger.info("休息 %s 秒后继续下一批爬取...", rest_time)
             time.sleep(rest_time)
 
-    logger.info(f"全部爬取任务结束! 总成功: {total_success}, 总失败: {total_fail}")
+    heartbeat.stop()
+    db.close()
+    logger.info("全部爬取任务结束! 总成功: %s, 总失败: %s", total_success, total_fail)
+
+
+async def crawl_book_detail_async(
+    session, book_id, book_url, db, proxy_semaphores, retries=3, stale=False
+):
+    """异步爬取单本书籍详情，解析放到进程池执行，不阻塞事件循环
+
+    返回写库 Future（结果为是否成功），由调用方在释放并发名额后等待。
+    stale 的含义与 crawl_book_detail 相同。
+    """
+    # 存储接口是同步的，放到线程中执行，不阻塞事件循环
+    if not stale and await asyncio.to_thread(db.is_detail_exists, book_url):
+        logger.debug("书籍 %s 详情已存在，跳过", book_url)
+        return await asyncio.to_thread(db.submit_detail_crawled, book_id)
+
+    proxy_manager = get_proxy_manager()
+    rate_limiter = get_rate_limiter()
+
+    http_cache = get_http_cache()
+    sent_at = []
+
+    async def before_send():
+        await rate_limiter.acquire_async(book_url, proxy)
+        # 限速等待结束后才开始计时
+        sent_at.append(time.perf_counter())
+
+    for attempt in range(retries):
+        proxy = await proxy_manager.get_proxy_async()
+        try:
+            # 单个代理上的并发数受限，避免集中压垮某个代理
+            async with proxy_semaphores[proxy]:
+                start = time.monotonic()
+                response = await http_cache.request_async(
+                    session,
+                    "GET",
+                    book_url,
+                    before_send=before_send,
+                    headers=detail_headers(proxy),
+                    proxy=proxy,
+                    revalidate=stale,
+                )
+                if not response.from_cache:
+                    observe_response(
+                        "detail", proxy, response, time.perf_counter() - sent_at[-1]
+                    )
+                    rate_limiter.report(book_url, proxy, status=response.status)
+                if response.status != 200:
+                    proxy_manager.report_error(proxy, status=response.status)
+                    raise Exception(f"响应状态码: {response.status}")
+                if not response.from_cache:
+                    proxy_manager.report_success(proxy, time.monotonic() - start)
+
+            book_data = await get_parse_pool().parse_async("detail", response.content)
+        except Exception as e:
+            # 状态码已在上面回报，这里只回报网络层错误
+            proxy_manager.report_error(proxy, e)
+            if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                REQUESTS.inc(kind="detail", status="error")
+                rate_limiter.report(book_url, proxy, error=e)
+            if attempt == retries - 1:  # 最后一次重试
+                logger.error("爬取书籍 %s 详情失败: %s", book_url, e)
+                return completed_future(False)
+            logger.warning(
+                "爬取书籍 %s 详情失败，重试中... (尝试 %s/%s)", book_url, attempt + 1, retries
+            )
+            RETRIES.inc(kind="detail")
+            continue
+
+        return await asyncio.to_thread(
+            db.submit_book_detail, book_id, book_url, book_data
+        )
+
+    return completed_future(False)
+
+
+async def crawl_details_async(
+    batch_size=1000,
+    concurrency=200,
+    per_proxy_limit=20,
+    continuous=True,
+    rest_time=60,
+):
+    """基于 aiohttp 的异步爬取书籍详情
+
+    参数:
+        batch_size: 每批爬取的数量
+        concurrency: 全局并发请求数
+        per_proxy_limit: 每个代理的并发请求数
+        continuous: 是否持续爬取直到全部完成
+        rest_time: 每批爬取后的休息时间(秒)
+    """
+    db = open_storage()
+    owner = new_lease_owner()
+    heartbeat = LeaseHeartbeat(db, owner)
+    logger.info("租约持有者: %s", owner)
+    global_semaphore = asyncio.Semaphore(concurrency)
+    proxy_semaphores = defaultdict(lambda: asyncio.Semaphore(per_proxy_limit))
+    total_success = 0
+    total_fail = 0
+    batch_count = 0
+
+    async def crawl_one(book):
+        ok = False
+        try:
+            async with global_semaphore:
+                future = await crawl_book_detail_async(
+                    session,
+                    book["id"],
+                    book["book_url"],
+                    db,
+                    proxy_semaphores,
+                    stale=bool(book["detail_stale"]),
+                )
+            # 等待写库提交时不占用并发名额
+            ok = await asyncio.wrap_future(future)
+            return ok
+        finally:
+            heartbeat.discard(book["id"])
+            if not ok:
+                # 失败的书籍释放租约，下一批可以重新领取
+                await asyncio.to_thread(db.release_leases, owner, [book["id"]])
+
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with create_async_session(limit=concurrency, timeout=timeout) as session:
+        while True:
+            batch_count += 1
+            await asyncio.to_thread(db.reclaim_expired_leases)
+            books = await asyncio.to_thread(db.claim_books, owner, limit=batch_size)
+            if not books:
+                logger.info("没有需要爬取详情的书籍，爬取完成")
+                break
+
+            logger.info("第 %s 批: 找到 %s 本需要爬取详情的书籍", batch_count, len(books))
+
+            heartbeat.add(book["id"] for book in books)
+            success_count = 0
+            fail_count = 0
+            tasks = [asyncio.create_task(crawl_one(book)) for book in books]
+            with tqdm(total=len(tasks), desc=f"批次 {batch_count} 爬取进度") as pbar:
+                for task in asyncio.as_completed(tasks):
+                    try:
+                        if await task:
+                            success_count += 1
+                        else:
+                            fail_count += 1
+                    except Exception as e:
+                        logger.error("处理书籍时出现异常: %s", e)
+                        fail_count += 1
+                    pbar.set_description(
+                        f"批次 {batch_count}: {success_count}成功/{fail_count}失败"
+                    )
+                    pbar.update(1)
+
+            total_success += success_count
+            total_fail += fail_count
+            logger.info(
+                "第 %s 批爬取完成! 成功: %s, 失败: %s", batch_count, success_count, fail_count
+            )
+            logger.info("累计爬取: 成功 %s, 失败 %s", total_success, total_fail)
+
+            if not continuous:
+                break
+
+            if rest_time > 0:
+                logger.info("休息 %s 秒后继续下一批爬取...", rest_time)
+                await asyncio.sleep(rest_time)
+
+    # 停止心跳会释放剩余租约，关闭存储会等待写入完成，都可能阻塞
+    await asyncio.to_thread(heartbeat.stop)
+    await asyncio.to_thread(db.close)
+    logger.info("全部爬取任务结束! 总成功: %s, 总失败: %s", total_success, total_fail)
 
 
 def parse_args():
@@ -181,28 +365,52 @@ def parse_args():
         "--no-continuous", action="store_true", help="不持续爬取，只爬取一批"
     )
     parser.add_argument("--rest", type=int, default=60, help="每批爬取后的休息时间(秒)")
+    parser.add_argument(
+        "--async", dest="use_async", action="store_true", help="使用 aiohttp 异步爬取"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="异步模式的全局并发请求数"
+    )
+    parser.add_argument(
+        "--per-proxy", type=int, default=20, help="异步模式下每个代理的并发请求数"
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     try:
         args = parse_args()
+        start_metrics()
 
         logger.info(
-            f"开始爬取详情，配置: 批量={args.batch_size}, 线程={args.workers}, "
-            f"持续爬取={not args.no_continuous}, 休息时间={args.rest}秒"
+            "开始爬取详情，配置: 批量=%s, 线程=%s, 持续爬取=%s, 休息时间=%s秒",
+            args.batch_size,
+            args.workers,
+            not args.no_continuous,
+            args.rest,
         )
 
         # 开始爬取详情
-        crawl_details_multi_thread(
-            batch_size=args.batch_size,
-            max_workers=args.workers,
-            continuous=not args.no_continuous,
-            rest_time=args.rest,
-        )
+        if args.use_async:
+            asyncio.run(
+                crawl_details_async(
+                    batch_size=args.batch_size,
+                    concurrency=args.concurrency,
+                    per_proxy_limit=args.per_proxy,
+                    continuous=not args.no_continuous,
+                    rest_time=args.rest,
+                )
+            )
+        else:
+            crawl_details_multi_thread(
+                batch_size=args.batch_size,
+                max_workers=args.workers,
+                continuous=not args.no_continuous,
+                rest_time=args.rest,
+            )
 
     except KeyboardInterrupt:
         logger.info("用户中断，程序结束")
     except Exception as e:
-        logger.error(f"程序运行出错: {str(e)}")
+        logger.error("程序运行出错: %s", e)
         logger.error(traceback.format_exc())
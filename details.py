@@ -1,21 +1,79 @@
 # 获取作品详情
-import requests
 from lxml import etree
 import json
+import time
+from urllib.parse import urljoin
+
+from header_profiles import get_header_profiles
+from http_cache import get_http_cache
+from metrics import PARSE_SECONDS, observe_response
 
 # https://www.ciweimao.com/book/100420810
 
+SITE_URL = "https://www.ciweimao.com/"
+
+# 封面链接：优先 og:image，其次封面区域的图片
+COVER_META = etree.XPath('//meta[@property="og:image"]/@content')
+COVER_IMG = etree.XPath(
+    '//div[contains(concat(" ", normalize-space(@class), " "), " cover ")]//img/@src'
+)
+
+
+def extract_cover(tree) -> str:
+    """从详情页提取封面链接，相对链接补全为绝对链接，未找到时返回空字符串"""
+    for xpath in (COVER_META, COVER_IMG):
+        for url in xpath(tree):
+            url = url.strip()
+            if url:
+                return urljoin(SITE_URL, url)
+    return ""
+
+
+def fetch_book_page(
+    url, proxies=None, headers=None, before_send=None, revalidate=False
+):
+    """获取书籍详情页，优先使用 HTTP 缓存；响应的 from_cache 表示是否未走网络
+
+    revalidate 为 True 时不直接使用未过期的缓存，而是向服务器确认页面是否有更新。
+    """
+    # 未提供请求头时使用代理对应的浏览器请求头
+    if headers is None:
+        headers = get_header_profiles().for_proxy(proxies)
+
+    sent_at = []
+
+    def send():
+        if before_send is not None:
+            before_send()
+        # 限速等待结束后才开始计时
+        sent_at.append(time.perf_counter())
+
+    response = get_http_cache().request(
+        "GET",
+        url,
+        before_send=send,
+        proxies=proxies,
+        headers=headers,
+        timeout=10,
+        revalidate=revalidate,
+    )
+    if not response.from_cache:
+        proxy = (proxies or {}).get("http")
+        observe_response("detail", proxy, response, time.perf_counter() - sent_at[-1])
+    response.raise_for_status()
+    return response
+
 
 def get_book_data(url, proxies=None, headers=None):
     """获取书籍详情数据，支持代理和自定义请求头"""
-    # 使用默认请求头如果没有提供
-    if headers is None:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
+    response = fetch_book_page(url, proxies=proxies, headers=headers)
+    with PARSE_SECONDS.time(kind="detail"):
+        return parse_book_data(response.text)
+
 
-    response = requests.get(url, proxies=proxies, headers=headers, timeout=10)
-    tree = etree.HTML(response.text)
+def parse_book_data(text):
+    """解析书籍详情页 HTML，不涉及网络请求，可在线程池或事件循环外执行"""
+    tree = etree.HTML(text)
 
     # 提取书籍标题
     title = tree.xpath("//h1[@class='title']/text()")[0]
@@ -87,6 +145,7 @@ def get_book_data(url, proxies=None, headers=None):
         "tags": tags,
         "stats": stats,
         "detail_stats": detail_stats,
+        "cover": extract_cover(tree),
     }
 
 
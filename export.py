@@ -0,0 +1,317 @@
+# 把爬取数据库导出为列式文件（Parquet 或 Arrow IPC），供分析使用
+
+import argparse
+import os
+import sqlite3
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from config import BASE_DIR, DB_NAME, LOG_PATH
+from database import parse_count
+from logger import setup_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖，只有导出时才需要
+    pa = None
+    pq = None
+
+logger = setup_logger("export", LOG_PATH)
+
+EXPORT_DIR = os.path.join(BASE_DIR, "exports")
+DEFAULT_TABLES = ("books", "book_details", "book_stats_history")
+
+# 需要特殊转换的列：count 为字数，time 为站点上的时间文本，
+# utc 为 SQLite CURRENT_TIMESTAMP 写入的 UTC 时间文本，epoch 为 Unix 秒，
+# dict 为重复值多的文本列，做字典编码
+COLUMN_KINDS = {
+    "books": {
+        "category": "dict",
+        "author": "dict",
+        "word_count": "count",
+        "update_time": "time",
+        "created_at": "utc",
+    },
+    "book_details": {
+        "author": "dict",
+        "status": "dict",
+        "book_type": "dict",
+        "first_publish_status": "dict",
+        "word_count": "count",
+        "last_update": "time",
+        "created_at": "utc",
+    },
+    "book_stats_history": {"ts": "epoch"},
+    "authors": {"crawled_at": "utc"},
+    "chapters": {"created_at": "utc"},
+}
+
+_TIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d",
+)
+
+
+def parse_time(text) -> Optional[datetime]:
+    """按常见格式解析时间文本，无法识别时返回 None"""
+    if not text:
+        return None
+    text = text.strip()
+    for fmt in _TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _arrow_type(kind: str, declared: str, has_real: bool = False):
+    if kind == "dict":
+        return pa.dictionary(pa.int32(), pa.string())
+    if kind == "count":
+        return pa.int64()
+    if kind == "time":
+        return pa.timestamp("s")
+    if kind in ("utc", "epoch"):
+        return pa.timestamp("s", tz="UTC")
+    declared = declared.upper()
+    if "INT" in declared:
+        # SQLite 的 INTEGER 列可以存小数，旧数据中就有，转成 int64 会被截断
+        return pa.float64() if has_real else pa.int64()
+    if "REAL" in declared or "FLOA" in declared or "DOUB" in declared:
+        return pa.float64()
+    return pa.string()
+
+
+def _convert(kind: str, values: List):
+    if kind == "count":
+        return [parse_count(v) for v in values]
+    if kind == "time":
+        return [parse_time(v) for v in values]
+    if kind == "utc":
+        times = (parse_time(v) for v in values)
+        return [None if t is None else t.replace(tzinfo=timezone.utc) for t in times]
+    if kind == "epoch":
+        return [
+            None if v is None else datetime.fromtimestamp(v, tz=timezone.utc)
+            for v in values
+        ]
+    return values
+
+
+class DictionaryEncoder:
+    """跨块共享的字典编码器
+
+    字典只追加不重排，后续块的字典是前一块的扩展，
+    Arrow IPC 写入时只输出新增的值（dictionary delta），Parquet 也能直接使用。
+    每块只转换新出现的值，再拼接到已有的 Arrow 字典后面。
+    """
+
+    def __init__(self):
+        self._index: Dict[str, int] = {}
+        self._dictionary = pa.array([], pa.string())
+
+    def encode(self, values: List):
+        indices = []
+        new_values = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            index = self._index.get(value)
+            if index is None:
+                index = self._index[value] = len(self._index)
+                new_values.append(value)
+            indices.append(index)
+        if new_values:
+            self._dictionary = pa.concat_arrays(
+                [self._dictionary, pa.array(new_values, pa.string())]
+            )
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, type=pa.int32()), self._dictionary
+        )
+
+
+def _real_columns(conn, table: str, columns: List[str]) -> set:
+    """扫描一遍表，找出实际存有小数的列"""
+    if not columns:
+        return set()
+    checks = ", ".join(f"MAX(typeof({column}) = 'real')" for column in columns)
+    row = conn.execute(f"SELECT {checks} FROM {table}").fetchone()
+    return {column for column, has_real in zip(columns, row) if has_real}
+
+
+def table_schema(conn, table: str):
+    """根据 SQLite 声明类型和 COLUMN_KINDS 生成 Arrow schema
+
+    声明为整数的列如果存有小数，导出为 float64，不丢失精度。
+    """
+    kinds = COLUMN_KINDS.get(table, {})
+    columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    real_columns = _real_columns(
+        conn,
+        table,
+        [
+            name
+            for _, name, declared, *_ in columns
+            if not kinds.get(name) and "INT" in (declared or "").upper()
+        ],
+    )
+    fields = [
+        pa.field(
+            name,
+            _arrow_type(kinds.get(name, ""), declared or "", name in real_columns),
+        )
+        for _, name, declared, *_ in columns
+    ]
+    return pa.schema(fields)
+
+
+def iter_batches(conn, table: str, schema, chunk_size: int):
+    """按块读取整张表并转换为 RecordBatch，内存占用只与块大小有关"""
+    kinds = COLUMN_KINDS.get(table, {})
+    names = schema.names
+    encoders = {
+        name: DictionaryEncoder() for name, kind in kinds.items() if kind == "dict"
+    }
+    cursor = conn.execute(f"SELECT {', '.join(names)} FROM {table}")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        arrays = []
+        for index, field in enumerate(schema):
+            kind = kinds.get(field.name, "")
+            values = _convert(kind, [row[index] for row in rows])
+            if kind == "dict":
+                array = encoders[field.name].encode(values)
+            else:
+                array = pa.array(values, type=field.type)
+            arrays.append(array)
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_table(
+    conn, table: str, out_dir: str, fmt: str = "parquet", chunk_size: int = 50000
+) -> Dict:
+    """导出一张表，写入临时文件后再替换，避免留下半个文件；失败时删除临时文件"""
+    schema = table_schema(conn, table)
+    suffix = "parquet" if fmt == "parquet" else "arrow"
+    path = os.path.join(out_dir, f"{table}.{suffix}")
+    tmp_path = f"{path}.tmp"
+    rows = 0
+
+    try:
+        if fmt == "parquet":
+            dict_columns = [
+                name
+                for name, kind in COLUMN_KINDS.get(table, {}).items()
+                if kind == "dict" and name in schema.names
+            ]
+            writer = pq.ParquetWriter(
+                tmp_path,
+                schema,
+                compression="zstd",
+                use_dictionary=dict_columns or False,
+            )
+        else:
+            # 字典随块增长，以增量方式写入
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            writer = pa.ipc.new_file(tmp_path, schema, options=options)
+
+        try:
+            for batch in iter_batches(conn, table, schema, chunk_size):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        finally:
+            writer.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {"table": table, "path": path, "rows": rows}
+
+
+def read_arrow(path: str):
+    """以内存映射方式读取导出的 Arrow IPC 文件，不复制数据"""
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def export_database(
+    db_name: str = DB_NAME,
+    out_dir: str = EXPORT_DIR,
+    tables: Iterable[str] = DEFAULT_TABLES,
+    fmt: str = "parquet",
+    chunk_size: int = 50000,
+) -> List[Dict]:
+    """导出数据库中的多张表，不存在的表跳过"""
+    if pa is None:
+        raise RuntimeError("导出需要安装 pyarrow: pip install pyarrow")
+    os.makedirs(out_dir, exist_ok=True)
+
+    results = []
+    # 只读打开，导出期间不阻塞爬虫写入
+    with sqlite3.connect(f"file:{db_name}?mode=ro", uri=True) as conn:
+        existing = {
+            row[0]
+            for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        for table in tables:
+            if table not in existing:
+                logger.warning("表 %s 不存在，跳过", table)
+                continue
+            start = time.monotonic()
+            result = export_table(conn, table, out_dir, fmt, chunk_size)
+            logger.info(
+                "导出 %s: %s 行 -> %s (%.1fs)",
+                table,
+                result["rows"],
+                result["path"],
+                time.monotonic() - start,
+            )
+            results.append(result)
+    return results
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="导出数据库为列式文件")
+    parser.add_argument(
+        "--format",
+        dest="fmt",
+        choices=("parquet", "arrow"),
+        default="parquet",
+        help="导出格式",
+    )
+    parser.add_argument("--out", default=EXPORT_DIR, help="输出目录")
+    parser.add_argument(
+        "--tables", nargs="+", default=list(DEFAULT_TABLES), help="要导出的表"
+    )
+    parser.add_argument("--chunk-size", type=int, default=50000, help="每块读取的行数")
+    parser.add_argument("--db", default=DB_NAME, help="数据库路径")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        args = parse_args()
+        export_database(
+            db_name=args.db,
+            out_dir=args.out,
+            tables=args.tables,
+            fmt=args.fmt,
+            chunk_size=args.chunk_size,
+        )
+    except KeyboardInterrupt:
+        logger.info("用户中断，程序结束")
+    except Exception as e:
+        logger.error("导出失败: %s", e)
+        logger.error(traceback.format_exc())
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional, Union
+
+from config import HEADER_PROFILE_FAKE_UA, LOG_PATH
+from logger import setup_logger
+
+logger = setup_logger("header_profiles", LOG_PATH)
+
+_CHROME_ACCEPT = (
+    "text/html,application/xhtml+xml,application/xml;q=0.9,"
+    "image/avif,image/webp,image/apng,*/*;q=0.8"
+)
+_FIREFOX_ACCEPT = (
+    "text/html,application/xhtml+xml,application/xml;q=0.9,"
+    "image/avif,image/webp,*/*;q=0.8"
+)
+_SAFARI_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+
+# 各浏览器的 Accept 与 Accept-Language 写法不同，按 UA 所属浏览器成套使用
+_FAMILY_HEADERS = {
+    "chrome": (_CHROME_ACCEPT, "zh-CN,zh;q=0.9,en;q=0.8"),
+    "firefox": (
+        _FIREFOX_ACCEPT,
+        "zh-CN,zh;q=0.8,zh-TW;q=0.7,en-US;q=0.5,en;q=0.3",
+    ),
+    "safari": (_SAFARI_ACCEPT, "zh-CN,zh-Hans;q=0.9"),
+}
+
+# 内置的离线 UA 列表，不依赖网络或 fake_useragent 的数据文件
+BUILTIN_USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.0.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:125.0) Gecko/20100101 Firefox/125.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+)
+
+_MOBILE_MARKS = ("Mobile", "Android", "iPhone", "iPad")
+
+
+def browser_family(user_agent: str) -> str:
+    if "Firefox/" in user_agent:
+        return "firefox"
+    if "Chrome/" in user_agent or "Chromium/" in user_agent:
+        return "chrome"
+    if "Safari/" in user_agent:
+        return "safari"
+    return "chrome"
+
+
+def build_profile(user_agent: str) -> Dict[str, str]:
+    """根据 UA 生成一套与之匹配的浏览器请求头"""
+    accept, language = _FAMILY_HEADERS[browser_family(user_agent)]
+    return {"User-Agent": user_agent, "Accept": accept, "Accept-Language": language}
+
+
+def _load_fake_user_agents(count: int) -> List[str]:
+    """从 fake_useragent 取一批 UA，只在启动时调用一次，失败时返回空列表"""
+    try:
+        from fake_useragent import UserAgent
+
+        ua = UserAgent()
+        # 移动端 UA 可能被跳转到手机版页面，解析规则不适用
+        return [
+            user_agent
+            for user_agent in dict.fromkeys(ua.random for _ in range(count))
+            if not any(mark in user_agent for mark in _MOBILE_MARKS)
+        ]
+    except Exception as e:
+        logger.warning("加载 fake_useragent 失败，使用内置 UA 列表: %s", e)
+        return []
+
+
+class HeaderProfiles:
+    """请求头配置提供者
+
+    UA 数据只在创建时加载一次；同一代理始终得到同一套请求头，
+    使经过该代理的会话看起来来自同一个浏览器。创建后只读，线程和协程中均可直接调用。
+    """
+
+    def __init__(self, user_agents: Optional[List[str]] = None):
+        if user_agents is None:
+            user_agents = (
+                _load_fake_user_agents(32) if HEADER_PROFILE_FAKE_UA else []
+            ) or list(BUILTIN_USER_AGENTS)
+        self.profiles = tuple(build_profile(ua) for ua in user_agents)
+
+    def for_proxy(self, proxy: Union[str, Dict[str, str], None]) -> Dict[str, str]:
+        """返回代理对应请求头的副本，调用方可以在其上追加字段
+
+        proxy 可以是代理地址，也可以是 requests 格式的 proxies 参数；
+        按地址的哈希选择，跨进程和重启保持一致。
+        """
+        if isinstance(proxy, dict):
+            proxy = proxy.get("http")
+        digest = hashlib.md5((proxy or "direct").encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % len(self.profiles)
+        return dict(self.profiles[index])
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_header_profiles() -> HeaderProfiles:
+    """获取进程内共享的请求头配置"""
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            _profiles = HeaderProfiles()
+        return _profiles
@@ -0,0 +1,409 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Optional
+from urllib.parse import urlencode
+
+import requests
+
+from http_client import get_http_client
+from logger import setup_logger
+from config import (
+    LOG_PATH,
+    HTTP_CACHE_DIR,
+    HTTP_CACHE_MAX_BYTES,
+    HTTP_CACHE_OFFLINE,
+    HTTP_CACHE_TTL,
+    HTTP_CACHE_DEFAULT_TTL,
+)
+
+logger = setup_logger("http_cache", LOG_PATH)
+
+
+class CacheMiss(Exception):
+    """离线模式下缓存中没有对应的响应"""
+
+
+_HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.I)
+
+
+def detect_encoding(headers, body: bytes) -> Optional[str]:
+    """按 Content-Type 中的 charset、页面 <meta> 声明的顺序确定编码
+
+    都没有时返回 None。不能使用 requests 的默认值，它对没有 charset 的
+    text/html 返回 ISO-8859-1，中文页面会变成乱码。
+    """
+    content_type = next(
+        (v for k, v in (headers or {}).items() if k.lower() == "content-type"), ""
+    )
+    match = _HEADER_CHARSET.search(content_type)
+    if match:
+        return match.group(1)
+    match = _META_CHARSET.search(body[:2048])
+    if match:
+        return match.group(1).decode("ascii")
+    return None
+
+
+class CachedResponse:
+    """缓存命中或条件请求返回 304 时使用的响应对象"""
+
+    def __init__(
+        self,
+        url: str,
+        body: bytes,
+        encoding: Optional[str] = None,
+        status: int = 200,
+        from_cache: bool = True,
+    ):
+        self.url = url
+        self.content = body
+        self.encoding = encoding
+        self.status_code = status
+        self.from_cache = from_cache
+
+    @property
+    def status(self) -> int:
+        return self.status_code
+
+    @property
+    def text(self) -> str:
+        encoding = self.encoding or detect_encoding(None, self.content) or "utf-8"
+        return self.content.decode(encoding, errors="replace")
+
+    def raise_for_status(self):
+        # 附带响应对象，调用方可以从异常中取得状态码
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                f"{self.status_code} for url: {self.url}", response=self
+            )
+
+
+class CacheEntry:
+    def __init__(self, key, blob, encoding, etag, last_modified, fetched_at, ttl):
+        self.key = key
+        self.blob = blob
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.fetched_at < self.ttl
+
+
+def cache_key(method: str, url: str, data: Optional[Dict] = None) -> str:
+    """GET 请求以 URL 为键，带表单的请求把排序后的参数拼在后面"""
+    key = url if method.upper() == "GET" else f"{method.upper()} {url}"
+    if data:
+        key += "#" + urlencode(sorted(data.items()))
+    return key
+
+
+class HttpCache:
+    """磁盘上的内容寻址 HTTP 响应缓存
+
+    响应体按 SHA-256 压缩存放在 objects/ 下，索引保存在 SQLite 中，
+    记录 ETag/Last-Modified 与抓取时间。按 URL 分类设置有效期，
+    过期后发条件请求重新验证；超过容量时按最近访问时间淘汰。
+    命中时的访问时间先记在内存中，随下一次写入或攒够一批后再写索引，
+    读操作不提交事务。
+    """
+
+    # 内存中的访问时间攒到这么多条，或距上次写入超过这么多秒时写入索引
+    ACCESS_FLUSH_SIZE = 256
+    ACCESS_FLUSH_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        cache_dir: str = HTTP_CACHE_DIR,
+        max_bytes: int = HTTP_CACHE_MAX_BYTES,
+        offline: bool = HTTP_CACHE_OFFLINE,
+        ttl_rules=HTTP_CACHE_TTL,
+        default_ttl: int = HTTP_CACHE_DEFAULT_TTL,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.default_ttl = default_ttl
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._accessed: Dict[str, float] = {}
+        self._accessed_flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "index.db"), check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                blob TEXT,
+                size INTEGER,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                last_access REAL
+            )
+        """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def ttl_for(self, key: str) -> int:
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(key):
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT blob, encoding, etag, last_modified, fetched_at
+                FROM entries WHERE key = ?
+                """,
+                (key,),
+            ).fetchone()
+            # 索引存在但内容文件丢失时视为未命中
+            if row is None or not os.path.exists(self._blob_path(row[0])):
+                return None
+            self._accessed[key] = time.time()
+            if (
+                len(self._accessed) >= self.ACCESS_FLUSH_SIZE
+                or time.monotonic() - self._accessed_flushed_at
+                >= self.ACCESS_FLUSH_INTERVAL
+            ):
+                self._flush_access()
+                self._conn.commit()
+        return CacheEntry(key, *row, ttl=self.ttl_for(key))
+
+    def _flush_access(self):
+        # 调用方需持有锁并负责提交
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE entries SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._accessed.items()],
+            )
+            self._accessed.clear()
+        self._accessed_flushed_at = time.monotonic()
+
+    def read(self, entry: CacheEntry) -> bytes:
+        with open(self._blob_path(entry.blob), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def validators(self, entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """条件请求头"""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, key: str, body: bytes, headers, encoding: Optional[str] = None):
+        """保存 200 响应
+
+        压缩和写临时文件在锁外进行；移入最终位置与写索引在同一次加锁中完成，
+        其他线程淘汰同一内容时不会删掉刚被引用的文件。
+        容量按压缩后的文件大小统计。
+        """
+        blob = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(blob)
+        data = zlib.compress(body, 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        now = time.time()
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+            old = self._conn.execute(
+                "SELECT blob, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO entries (
+                    key, blob, size, encoding, etag, last_modified,
+                    fetched_at, last_access
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    blob,
+                    len(data),
+                    encoding,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    now,
+                    now,
+                ),
+            )
+            self._accessed.pop(key, None)
+            self._total_bytes += len(data) - (old[1] if old else 0)
+            if old and old[0] != blob:
+                self._drop_blob_if_unused(old[0])
+            # 淘汰按访问时间排序，先写入内存中的访问时间
+            self._flush_access()
+            self._conn.commit()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def refresh(self, entry: CacheEntry):
+        """304 之后更新抓取时间"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET fetched_at = ? WHERE key = ?",
+                (time.time(), entry.key),
+            )
+            self._flush_access()
+            self._conn.commit()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        requester: Callable = None,
+        before_send: Callable = None,
+        data: Optional[Dict] = None,
+        headers: Optional[Dict] = None,
+        revalidate: bool = False,
+        **kwargs,
+    ):
+        """带缓存的同步请求，接口与 requests.request 一致
+
+        返回的响应带有 from_cache 属性；只有真正发出网络请求时才调用 before_send。
+        revalidate 为 True 时即使缓存未过期也发条件请求，确认页面是否有更新。
+        未指定 requester 时使用共享的连接池客户端。
+        """
+        key = cache_key(method, url, data)
+        entry = self.lookup(key)
+        if entry is not None and (self.offline or (entry.fresh and not revalidate)):
+            return CachedResponse(url, self.read(entry), entry.encoding)
+        if self.offline:
+            raise CacheMiss(key)
+
+        if before_send is not None:
+            before_send()
+        headers = {**(headers or {}), **self.validators(entry)}
+        requester = requester or get_http_client().request
+        response = requester(method, url, data=data, headers=headers, **kwargs)
+        response.from_cache = False
+        if response.status_code == 304 and entry is not None:
+            self.refresh(entry)
+            body = self.read(entry)
+            return CachedResponse(url, body, entry.encoding, from_cache=False)
+        if response.status_code == 200:
+            encoding = detect_encoding(response.headers, response.content)
+            # response.text 与缓存命中时使用同样的编码
+            response.encoding = encoding or "utf-8"
+            self.store(key, response.content, response.headers, encoding)
+        return response
+
+    async def request_async(
+        self,
+        session,
+        method: str,
+        url: str,
+        before_send: Callable = None,
+        data: Optional[Dict] = None,
+        headers: Optional[Dict] = None,
+        revalidate: bool = False,
+        **kwargs,
+    ) -> CachedResponse:
+        """request 的 aiohttp 版本，磁盘读写在线程池中执行"""
+        loop = asyncio.get_running_loop()
+        key = cache_key(method, url, data)
+        entry = await loop.run_in_executor(None, self.lookup, key)
+        if entry is not None and (self.offline or (entry.fresh and not revalidate)):
+            body = await loop.run_in_executor(None, self.read, entry)
+            return CachedResponse(url, body, entry.encoding)
+        if self.offline:
+            raise CacheMiss(key)
+
+        if before_send is not None:
+            await before_send()
+        headers = {**(headers or {}), **self.validators(entry)}
+        async with session.request(
+            method, url, data=data, headers=headers, **kwargs
+        ) as response:
+            status = response.status
+            body = await response.read() if status == 200 else b""
+            response_headers = dict(response.headers)
+        encoding = detect_encoding(response_headers, body) if status == 200 else None
+
+        if status == 304 and entry is not None:
+            await loop.run_in_executor(None, self.refresh, entry)
+            body = await loop.run_in_executor(None, self.read, entry)
+            return CachedResponse(url, body, entry.encoding, from_cache=False)
+        if status == 200:
+            await loop.run_in_executor(
+                None, self.store, key, body, response_headers, encoding
+            )
+        return CachedResponse(url, body, encoding, status=status, from_cache=False)
+
+    def _blob_path(self, blob: str) -> str:
+        return os.path.join(self.cache_dir, "objects", blob[:2], blob[2:] + ".z")
+
+    def _drop_blob_if_unused(self, blob: str):
+        # 调用方需持有锁
+        count = self._conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE blob = ?", (blob,)
+        ).fetchone()[0]
+        if count == 0:
+            try:
+                os.remove(self._blob_path(blob))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        # 调用方需持有锁，淘汰到容量的 90%
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute(
+            "SELECT key, blob, size FROM entries ORDER BY last_access"
+        )
+        evicted = []
+        for key, blob, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key, blob))
+            self._total_bytes -= size
+        for key, blob in evicted:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._drop_blob_if_unused(blob)
+        self._conn.commit()
+        logger.info("缓存淘汰 %s 条记录", len(evicted))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpCache:
+    """获取进程内共享的 HTTP 缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache()
+        return _cache
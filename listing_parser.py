@@ -0,0 +1,98 @@
+# 书籍列表页解析
+# https://www.ciweimao.com/book_list/0-0-0-0-0-0/quanbu/1
+
+import re
+from typing import List, Tuple
+
+from lxml import etree
+
+# 预编译的 XPath，避免每页重新编译
+ROWS = etree.XPath("//div[5]/div/div[2]/div[1]/table//tr")
+FRAGMENT_ROWS = etree.XPath("//table//tr")
+CELLS = etree.XPath("td")
+CELL_TEXT = etree.XPath("p/text()")
+CELL_LINK = etree.XPath("p/a")
+
+_TABLE_START = re.compile(r"<table\b", re.I)
+_TABLE_END = re.compile(r"</table\s*>", re.I)
+
+_parser = etree.HTMLParser(encoding="utf-8")
+
+
+def _text(cell) -> str:
+    texts = CELL_TEXT(cell)
+    return texts[0] if texts else ""
+
+
+def _link(cell) -> Tuple[str, str]:
+    links = CELL_LINK(cell)
+    if not links:
+        return "", ""
+    return links[0].text or "", links[0].get("href", "")
+
+
+def parse_rows(rows) -> List[Tuple]:
+    """逐行提取，每行只遍历一次，缺失的单元格以空字符串占位，不会错位
+
+    返回的元组与 books 表的列顺序一致:
+    (category, book_name, book_url, latest_chapter, latest_chapter_url,
+     author, author_url, word_count, update_time)
+    """
+    books = []
+    for row in rows:
+        cells = CELLS(row)
+        if len(cells) < 6:
+            # 表头或异常行
+            continue
+        book_name, book_url = _link(cells[1])
+        if not book_url:
+            continue
+        latest_chapter, latest_chapter_url = _link(cells[2])
+        author, author_url = _link(cells[3])
+        books.append(
+            (
+                _text(cells[0]),
+                book_name,
+                book_url,
+                latest_chapter,
+                latest_chapter_url,
+                author,
+                author_url,
+                _text(cells[4]),
+                _text(cells[5]),
+            )
+        )
+    return books
+
+
+def _table_fragment(text: str) -> str:
+    """定位包含书籍链接的 <table> 片段，找不到时返回空字符串"""
+    for start in _TABLE_START.finditer(text):
+        end = _TABLE_END.search(text, start.end())
+        if end is None:
+            break
+        fragment = text[start.start() : end.end()]
+        if "/book/" in fragment:
+            return fragment
+    return ""
+
+
+def parse_listing(text) -> List[Tuple]:
+    """解析列表页，返回按行对齐的书籍记录
+
+    优先只解析书籍表格所在的片段，跳过整页 DOM 构建；
+    片段解析不到数据时退回完整解析。接受 str 或 UTF-8 字节。
+    """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    fragment = _table_fragment(text)
+    if fragment:
+        tree = etree.fromstring(fragment, _parser)
+        books = parse_rows(FRAGMENT_ROWS(tree))
+        if books:
+            return books
+
+    tree = etree.fromstring(text, _parser)
+    if tree is None:
+        return []
+    return parse_rows(ROWS(tree))
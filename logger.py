@@ -1,39 +1,191 @@
+import atexit
+import copy
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+from config import LOG_LEVEL, LOG_REPEAT_BURST, LOG_REPEAT_INTERVAL
 
-def setup_logger(name, log_path, level=logging.DEBUG):
-    """设置logger"""
+# 每个日志文件只有一个监听线程和一个轮转文件处理器，避免多个处理器同时轮转
+_listeners = {}
+_listeners_lock = threading.Lock()
+# 子进程的日志转发监听线程
+_relays = []
+# 在子进程中设置，所有 logger 改为把记录发给父进程
+_worker_queue = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """把日志记录放入队列，写文件在监听线程中完成
+
+    入队前在调用线程中合并 msg 和 args，参数是可变对象时，
+    输出的是记录日志那一刻的值，而不是监听线程处理时的值。
+    同进程内的队列不需要序列化，异常信息保留原样，由监听线程格式化堆栈。
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class RepeatFilter(logging.Filter):
+    """按调用位置限制 WARNING 及以上日志的频率
+
+    每个调用位置在 interval 秒内最多输出 burst 条，其余丢弃。
+    被抑制的条数记在下一条放行记录的 suppressed 属性上，由 RepeatFormatter
+    附加到输出末尾；记录的 msg 和 args 保持不变，其他处理器看到的是原始记录。
+    """
+
+    def __init__(
+        self, interval: float = LOG_REPEAT_INTERVAL, burst: int = LOG_REPEAT_BURST
+    ):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - start >= self.interval:
+                start, count = now, 0
+            if count >= self.burst:
+                self._windows[key] = (start, count, suppressed + 1)
+                return False
+            self._windows[key] = (start, count + 1, 0)
+        record.suppressed = suppressed
+        return True
+
+
+class RepeatFormatter(logging.Formatter):
+    """在消息末尾附上 RepeatFilter 记录的被抑制条数"""
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message = f"{message} (此前已抑制 {suppressed} 条重复日志)"
+        return message
+
+
+def _get_queue(log_path):
+    """获取日志文件对应的队列，首次调用时启动监听线程"""
+    with _listeners_lock:
+        if log_path not in _listeners:
+            # 设置日志轮转
+            file_handler = RotatingFileHandler(
+                log_path,
+                maxBytes=10 * 1024 * 1024,  # 10MB
+                backupCount=5,
+                encoding="utf-8",  # 明确指定UTF-8编码
+                delay=True,  # 第一次写入时才打开文件，只导入模块的子进程不会打开
+            )
+
+            # 设置日志格式
+            formatter = RepeatFormatter(
+                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            )
+            file_handler.setFormatter(formatter)
+
+            # 添加控制台输出
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(
+                log_queue, file_handler, console_handler, respect_handler_level=True
+            )
+            listener.start()
+            _listeners[log_path] = (log_queue, listener)
+        return _listeners[log_path][0]
+
+
+@atexit.register
+def _stop_listeners():
+    # 退出前写完队列中剩余的日志，先停转发线程，它们会往文件队列里写
+    with _listeners_lock:
+        for relay in _relays:
+            relay.stop()
+        _relays.clear()
+        for _, listener in _listeners.values():
+            listener.stop()
+        _listeners.clear()
+
+
+def create_worker_queue(mp_context, log_path):
+    """创建供子进程使用的日志队列
+
+    子进程的记录经由该队列交给本进程，再写入 log_path 对应的日志文件，
+    保证一个日志文件只由一个进程写入和轮转。
+    """
+    log_queue = mp_context.Queue()
+    relay = QueueListener(
+        log_queue, DeferredQueueHandler(_get_queue(os.path.abspath(log_path)))
+    )
+    relay.start()
+    with _listeners_lock:
+        _relays.append(relay)
+    return log_queue
+
+
+def redirect_to_queue(log_queue):
+    """在子进程中调用，把已有和之后创建的 logger 都改为发往父进程的队列"""
+    global _worker_queue
+    _worker_queue = log_queue
+    for logger in list(logging.Logger.manager.loggerDict.values()):
+        if isinstance(logger, logging.Logger) and any(
+            isinstance(h, DeferredQueueHandler) for h in logger.handlers
+        ):
+            logger.handlers = [_worker_handler()]
+    # 子进程不再需要本地的监听线程和文件处理器
+    with _listeners_lock:
+        for _, listener in _listeners.values():
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        _listeners.clear()
+
+
+def _worker_handler():
+    # 跨进程队列需要序列化，使用 QueueHandler 默认的 prepare 预先格式化消息
+    handler = QueueHandler(_worker_queue)
+    handler.addFilter(RepeatFilter())
+    return handler
+
+
+def setup_logger(name, log_path, level=LOG_LEVEL):
+    """设置logger
+
+    所有 logger 通过队列把记录交给同一日志文件的监听线程写入，
+    调用方只做入队操作，不会被磁盘 IO 阻塞。
+    """
     # 确保日志目录存在
     os.makedirs(os.path.dirname(log_path), exist_ok=True)
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
+    logger.propagate = False
 
     # 清除已有的处理器
     if logger.handlers:
         logger.handlers = []
 
-    # 设置日志轮转
-    file_handler = RotatingFileHandler(
-        log_path,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5,
-        encoding="utf-8",  # 明确指定UTF-8编码
-    )
-
-    # 设置日志格式 - 修正这里的错误
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    file_handler.setFormatter(formatter)
-
-    # 添加控制台输出
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
+    if _worker_queue is not None:
+        logger.addHandler(_worker_handler())
+        return logger
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    handler = DeferredQueueHandler(_get_queue(os.path.abspath(log_path)))
+    handler.addFilter(RepeatFilter())
+    logger.addHandler(handler)
 
     return logger
@@ -0,0 +1,394 @@
+import bisect
+import collections
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from logger import setup_logger
+from config import (
+    LOG_PATH,
+    METRICS_PORT,
+    METRICS_SUMMARY_INTERVAL,
+    METRICS_PROFILE_INTERVAL,
+)
+
+logger = setup_logger("metrics", LOG_PATH)
+
+# 延迟类直方图的默认分桶(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(
+            k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    """只增不减的计数器，按标签分组"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] += value
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge:
+    """瞬时值，可以直接设置，也可以在采集时调用回调获取"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Tuple, float] = {}
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        with self._lock:
+            self._functions[_label_key(labels)] = function
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return [(self.name, key, value) for key, value in values.items()]
+
+
+class Histogram:
+    """固定分桶的直方图，记录分布、总和与次数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., +Inf 计数, 总和]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            data[index] += 1
+            data[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self) -> Tuple[int, float, float]:
+        """返回所有标签合计的 (次数, 平均值, 近似 p95)"""
+        with self._lock:
+            rows = [list(data) for data in self._values.values()]
+        if not rows:
+            return 0, 0.0, 0.0
+        counts = [sum(col) for col in zip(*(row[:-1] for row in rows))]
+        total = sum(counts)
+        if total == 0:
+            return 0, 0.0, 0.0
+        mean = sum(row[-1] for row in rows) / total
+        threshold = total * 0.95
+        seen = 0
+        p95 = float("inf")
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= threshold:
+                p95 = bound
+                break
+        return total, mean, p95
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        with self._lock:
+            items = [(key, list(data)) for key, data in self._values.items()]
+        samples = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", key, cumulative, (("le", le),)))
+            samples.append((f"{self.name}_count", key, cumulative))
+            samples.append((f"{self.name}_sum", key, data[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample in metric.samples():
+                name, key, value = sample[:3]
+                extra = sample[3] if len(sample) > 3 else ()
+                lines.append(f"{name}{_format_labels(key, extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 爬虫各阶段的公共指标
+REQUEST_SECONDS = REGISTRY.histogram(
+    "crawler_request_seconds", "网络请求耗时，按请求类型和代理区分"
+)
+REQUESTS = REGISTRY.counter("crawler_requests_total", "请求次数，按类型和状态码区分")
+RETRIES = REGISTRY.counter("crawler_retries_total", "重试次数")
+BYTES_FETCHED = REGISTRY.counter("crawler_bytes_fetched_total", "下载的响应字节数")
+PARSE_SECONDS = REGISTRY.histogram("crawler_parse_seconds", "页面解析耗时")
+DB_WRITE_SECONDS = REGISTRY.histogram("crawler_db_write_seconds", "数据库写入耗时")
+QUEUE_DEPTH = REGISTRY.gauge("crawler_queue_depth", "各队列当前长度")
+
+
+_queue_sizes: Dict[str, List[weakref.WeakMethod]] = {}
+_queue_sizes_lock = threading.Lock()
+
+
+def _total_queue_size(name: str) -> float:
+    with _queue_sizes_lock:
+        methods = _queue_sizes.get(name, [])
+        alive = [method() for method in methods]
+        _queue_sizes[name] = [m for m, bound in zip(methods, alive) if bound]
+    return sum(bound() for bound in alive if bound)
+
+
+def track_queue_depth(name: str, size: Callable[[], float]):
+    """把 size 计入 QUEUE_DEPTH{queue=name}
+
+    每个队列名在进程内只注册一次回调，同名的多个实例合计；
+    size 必须是绑定方法，只保存弱引用，实例被回收后自动移除。
+    """
+    with _queue_sizes_lock:
+        methods = _queue_sizes.get(name)
+        if methods is None:
+            methods = _queue_sizes[name] = []
+            QUEUE_DEPTH.set_function(lambda: _total_queue_size(name), queue=name)
+        methods.append(weakref.WeakMethod(size))
+
+
+def proxy_label(proxy) -> str:
+    """代理标签只保留主机和端口，不暴露认证信息"""
+    if not proxy:
+        return "direct"
+    parts = urlsplit(proxy)
+    return f"{parts.hostname}:{parts.port}" if parts.hostname else "unknown"
+
+
+def observe_response(kind: str, proxy, response, seconds: float):
+    """记录一次真实网络请求的状态码、耗时与字节数，缓存命中时调用方不应调用"""
+    status = getattr(response, "status_code", None) or getattr(response, "status", 0)
+    REQUESTS.inc(kind=kind, status=status)
+    REQUEST_SECONDS.observe(seconds, kind=kind, proxy=proxy_label(proxy))
+    BYTES_FETCHED.inc(len(response.content), kind=kind)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = REGISTRY.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/profile" and _profiler is not None:
+            body = _profiler.render().encode("utf-8")
+            content_type = "text/plain; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 采集请求很频繁，不写访问日志
+        pass
+
+
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "socket.py", "ssl.py")
+
+
+class SamplingProfiler:
+    """采样分析器：定期抓取所有线程的当前栈帧，统计最常出现的函数
+
+    开销只与采样间隔有关，可以在生产爬取时长期开启。
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = 0
+        self._counts: Dict[Tuple[str, str, int], int] = collections.Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    code = frame.f_code
+                    # 跳过自身和阻塞等待中的线程，只统计在干活的栈帧
+                    if ident == own or code.co_filename.endswith(_IDLE_FILES):
+                        continue
+                    self._counts[(code.co_name, code.co_filename, frame.f_lineno)] += 1
+
+    def top(self, limit: int = 20) -> List[Tuple[Tuple[str, str, int], int]]:
+        with self._lock:
+            return self._counts.most_common(limit)
+
+    def render(self, limit: int = 30) -> str:
+        lines = [f"samples: {self.samples}"]
+        for (function, filename, line), count in self.top(limit):
+            lines.append(f"{count:8d}  {function} ({filename}:{line})")
+        return "\n".join(lines) + "\n"
+
+
+_started = False
+_start_lock = threading.Lock()
+_profiler = None
+
+
+def _summary_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        logger.info(summary_line())
+
+
+def summary_line() -> str:
+    """一行汇总：请求、解析、写库的次数/平均/p95，以及队列长度"""
+    parts = [f"请求 {REQUESTS.total():.0f} 重试 {RETRIES.total():.0f}"]
+    for label, histogram in (
+        ("网络", REQUEST_SECONDS),
+        ("解析", PARSE_SECONDS),
+        ("写库", DB_WRITE_SECONDS),
+    ):
+        count, mean, p95 = histogram.summary()
+        parts.append(
+            f"{label} n={count} avg={mean * 1000:.0f}ms p95<={p95 * 1000:.0f}ms"
+        )
+    parts.append(f"下载 {BYTES_FETCHED.total() / 1024 / 1024:.1f}MB")
+    depths = ", ".join(
+        f"{dict(key).get('queue')}={value:.0f}"
+        for _, key, value in QUEUE_DEPTH.samples()
+    )
+    if depths:
+        parts.append(f"队列 {depths}")
+    return " | ".join(parts)
+
+
+def start_metrics(
+    port: int = METRICS_PORT,
+    summary_interval: float = METRICS_SUMMARY_INTERVAL,
+    profile_interval: float = METRICS_PROFILE_INTERVAL,
+):
+    """启动指标端点、周期汇总和采样分析器，重复调用无副作用
+
+    port 或 interval 为 0 时不启动对应组件。
+    """
+    global _started, _profiler
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    if profile_interval:
+        _profiler = SamplingProfiler(profile_interval).start()
+    if port:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        threading.Thread(
+            target=server.serve_forever, name="metrics-http", daemon=True
+        ).start()
+        logger.info("指标端点: http://127.0.0.1:%s/metrics", port)
+    if summary_interval:
+        threading.Thread(
+            target=_summary_loop,
+            args=(summary_interval,),
+            name="metrics-summary",
+            daemon=True,
+        ).start()
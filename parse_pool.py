@@ -0,0 +1,166 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List
+
+from logger import create_worker_queue, redirect_to_queue, setup_logger
+from config import LOG_PATH
+from metrics import PARSE_SECONDS, track_queue_depth
+
+logger = setup_logger("parse_pool", LOG_PATH)
+
+_STOP = object()
+
+
+def _parsers() -> Dict:
+    # 在子进程中按需导入，避免主进程循环依赖
+    from listing_parser import parse_listing
+    from details import parse_book_data
+    from chapters import parse_chapter_list
+    from authors import parse_author_page
+
+    return {
+        "listing": parse_listing,
+        "detail": parse_book_data,
+        "chapters": parse_chapter_list,
+        "author": parse_author_page,
+    }
+
+
+def _init_worker(log_queue):
+    """子进程初始化：日志经队列交给主进程写文件，不在子进程中打开日志文件"""
+    redirect_to_queue(log_queue)
+
+
+def _parse_batch(kind: str, documents: List[bytes]) -> List:
+    """在子进程中解析一批文档，逐个返回 (是否成功, 结果或异常, 耗时)"""
+    parser = _parsers()[kind]
+    results = []
+    for document in documents:
+        start = time.perf_counter()
+        try:
+            results.append((True, parser(document), time.perf_counter() - start))
+        except Exception as e:
+            results.append((False, e, time.perf_counter() - start))
+    return results
+
+
+class ParsePool:
+    """进程池解析阶段
+
+    把原始响应字节交给子进程解析，按批次提交以摊薄进程间通信开销。
+    线程中调用 parse() 拿到 Future，协程中 await parse_async()。
+    """
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        batch_size: int = 16,
+        flush_interval: float = 0.02,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # 使用 spawn，避免在多线程进程中 fork 带来的锁问题
+        mp_context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(create_worker_queue(mp_context, LOG_PATH),),
+        )
+        self._queue = queue.Queue()
+        track_queue_depth("parse", self._queue.qsize)
+        self._thread = threading.Thread(
+            target=self._run, name="parse-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def parse(self, kind: str, document) -> Future:
+        """提交一个文档，Future 返回解析结果"""
+        future = Future()
+        self._queue.put((kind, document, future))
+        return future
+
+    async def parse_async(self, kind: str, document):
+        return await asyncio.wrap_future(self.parse(kind, document))
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._executor.shutdown()
+
+    def _run(self):
+        pending: Dict[str, list] = {}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                for kind, batch in pending.items():
+                    self._submit(kind, batch)
+                return
+            if item is not None:
+                kind = item[0]
+                batch = pending.setdefault(kind, [])
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) >= self.batch_size:
+                    self._submit(kind, pending.pop(kind))
+
+            if deadline is not None and time.monotonic() >= deadline:
+                for kind, batch in pending.items():
+                    self._submit(kind, batch)
+                pending = {}
+            if not pending:
+                deadline = None
+
+    def _submit(self, kind: str, batch: list):
+        futures = [future for _, _, future in batch]
+        try:
+            batch_future = self._executor.submit(
+                _parse_batch, kind, [document for _, document, _ in batch]
+            )
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        def distribute(done):
+            try:
+                results = done.result()
+            except Exception as e:
+                logger.error("解析进程出错: %s", e)
+                for future in futures:
+                    future.set_exception(e)
+                return
+            for future, (ok, result, seconds) in zip(futures, results):
+                PARSE_SECONDS.observe(seconds, kind=kind)
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+        batch_future.add_done_callback(distribute)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParsePool:
+    """获取进程内共享的解析进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool()
+        return _pool
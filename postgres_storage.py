@@ -0,0 +1,646 @@
+# PostgreSQL 存储后端，多台机器上的爬虫可以同时写入同一个库
+
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from config import DETAIL_LEASE_SECONDS, LOG_PATH, PG_MAX_PENDING, PG_POOL_SIZE
+from database import (
+    BOOK_URL_INDEX,
+    DETAIL_COLUMNS,
+    PAGE_DONE,
+    PAGE_FAILED,
+    STATS_COLUMNS,
+    detail_row,
+    page_hash,
+    stats_snapshot,
+)
+from logger import setup_logger
+from metrics import DB_WRITE_SECONDS, track_queue_depth
+from storage import Storage
+
+try:
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # 可选依赖，只有使用 PostgreSQL 时才需要
+    dict_row = None
+    ConnectionPool = None
+
+logger = setup_logger("postgres_storage", LOG_PATH)
+
+BOOK_COLUMNS = (
+    "category",
+    "book_name",
+    "book_url",
+    "latest_chapter",
+    "latest_chapter_url",
+    "author",
+    "author_url",
+    "word_count",
+    "update_time",
+)
+
+# 行数不少于该值时先 COPY 到临时表再合并，否则直接多行 upsert
+COPY_THRESHOLD = 100
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS books (
+        id BIGSERIAL PRIMARY KEY,
+        category TEXT,
+        book_name TEXT,
+        book_url TEXT UNIQUE,
+        latest_chapter TEXT,
+        latest_chapter_url TEXT,
+        author TEXT,
+        author_url TEXT,
+        word_count TEXT,
+        update_time TEXT,
+        detail_crawled SMALLINT NOT NULL DEFAULT 0,
+        detail_stale SMALLINT NOT NULL DEFAULT 0,
+        book_image TEXT,
+        lease_owner TEXT,
+        lease_expires DOUBLE PRECISION NOT NULL DEFAULT 0,
+        created_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_books_lease
+    ON books(lease_expires, id) WHERE detail_crawled = 0
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS book_details (
+        id BIGSERIAL PRIMARY KEY,
+        book_id BIGINT REFERENCES books (id),
+        book_url TEXT UNIQUE,
+        title TEXT,
+        author TEXT,
+        author_id TEXT,
+        description TEXT,
+        last_update TEXT,
+        status TEXT,
+        tags TEXT,
+        total_hits BIGINT,
+        total_favor BIGINT,
+        total_word BIGINT,
+        total_recommend BIGINT,
+        week_hits BIGINT,
+        mouth_hits BIGINT,
+        week_recommend BIGINT,
+        mouth_recommend BIGINT,
+        book_type TEXT,
+        word_count TEXT,
+        chapter_count INTEGER,
+        first_publish_status TEXT,
+        is_crawled SMALLINT DEFAULT 1,
+        created_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+    # 统计字段的历史快照，与 SQLite 后端相同，只在数值变化时追加
+    f"""
+    CREATE TABLE IF NOT EXISTS book_stats_history (
+        book_id BIGINT NOT NULL,
+        ts BIGINT NOT NULL,
+        {", ".join(f"{column} BIGINT" for column in STATS_COLUMNS)},
+        PRIMARY KEY (book_id, ts)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_stats_history_ts ON book_stats_history(ts)
+    """,
+    # 列表页爬取进度，用于断点续爬
+    """
+    CREATE TABLE IF NOT EXISTS crawl_pages (
+        page INTEGER PRIMARY KEY,
+        status TEXT,
+        attempts INTEGER DEFAULT 0,
+        row_count INTEGER DEFAULT 0,
+        content_hash TEXT,
+        updated_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+)
+
+
+def _upsert_sql(table, columns, source, conflict):
+    """生成 INSERT ... ON CONFLICT DO UPDATE，source 为 VALUES 或 SELECT 子句"""
+    updates = ", ".join(
+        f"{column} = EXCLUDED.{column}"
+        for column in columns
+        if column != conflict
+    )
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) {source} "
+        f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+    )
+
+
+def _values(count):
+    return "VALUES (" + ", ".join(["%s"] * count) + ")"
+
+
+def _copy_to_stage(cursor, stage, table, columns, rows):
+    """建立只在本事务内存在的临时表并用 COPY 写入，不带原表的默认值和约束"""
+    cursor.execute(
+        f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS "
+        f"SELECT {', '.join(columns)} FROM {table} WITH NO DATA"
+    )
+    with cursor.copy(f"COPY {stage} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+# xmax 为 0 表示这一行是新插入的，而不是冲突后更新的
+_INSERTED = " RETURNING (xmax = 0) AS inserted"
+_BOOKS_UPSERT_SQL = (
+    _upsert_sql("books", BOOK_COLUMNS, _values(len(BOOK_COLUMNS)), "book_url")
+    + _INSERTED
+)
+_BOOKS_MERGE_SQL = (
+    _upsert_sql(
+        "books",
+        BOOK_COLUMNS,
+        f"SELECT {', '.join(BOOK_COLUMNS)} FROM books_stage",
+        "book_url",
+    )
+    + _INSERTED
+)
+_DETAIL_UPSERT_SQL = _upsert_sql(
+    "book_details", DETAIL_COLUMNS, _values(len(DETAIL_COLUMNS)), "book_url"
+)
+_DETAIL_MERGE_SQL = _upsert_sql(
+    "book_details",
+    DETAIL_COLUMNS,
+    f"SELECT {', '.join(DETAIL_COLUMNS)} FROM details_stage",
+    "book_url",
+)
+# 标记已爬取并清除租约；没有解析到封面时保留原有链接
+_MARK_CRAWLED_SQL = """
+    UPDATE books AS b
+    SET detail_crawled = 1, detail_stale = 0,
+        lease_owner = NULL, lease_expires = 0,
+        book_image = COALESCE(NULLIF(c.cover, ''), b.book_image)
+    FROM unnest(%s::bigint[], %s::text[]) AS c(id, cover)
+    WHERE b.id = c.id
+"""
+_RECORD_PAGE_SQL = """
+    INSERT INTO crawl_pages (page, status, attempts, row_count, content_hash)
+    VALUES (%s, %s, 1, %s, %s)
+    ON CONFLICT (page) DO UPDATE SET
+        status = EXCLUDED.status,
+        attempts = crawl_pages.attempts + 1,
+        row_count = EXCLUDED.row_count,
+        content_hash = COALESCE(EXCLUDED.content_hash, crawl_pages.content_hash),
+        updated_at = now()
+"""
+_LATEST_STATS_SQL = f"""
+    SELECT DISTINCT ON (book_id) book_id, {", ".join(STATS_COLUMNS)}
+    FROM book_stats_history
+    WHERE book_id = ANY(%s)
+    ORDER BY book_id, ts DESC
+"""
+# 同一秒内多次写入同一本书时以最后一次为准
+_INSERT_STATS_SQL = _upsert_sql(
+    "book_stats_history",
+    ("book_id", "ts") + STATS_COLUMNS,
+    _values(len(STATS_COLUMNS) + 2),
+    "book_id, ts",
+)
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL 存储后端
+
+    每个进程持有一个连接池，写入在线程池中并发执行，由数据库处理并发；
+    未完成的写入超过 max_pending 时 submit_* 阻塞，与 SQLite 写线程的有界队列相同。
+    大批量写入先 COPY 到临时表再一次性合并，小批量直接多行 upsert。
+    任务领取用 FOR UPDATE SKIP LOCKED，多台机器领取时互不阻塞。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = PG_POOL_SIZE,
+        max_pending: int = PG_MAX_PENDING,
+    ):
+        if ConnectionPool is None:
+            raise RuntimeError(
+                "PostgreSQL 存储需要安装 psycopg: pip install 'psycopg[binary]' psycopg_pool"
+            )
+        self.url = url
+        self.pool = ConnectionPool(
+            url,
+            min_size=1,
+            max_size=pool_size,
+            kwargs={"row_factory": dict_row},
+            open=True,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="pg-writer"
+        )
+        # 已提交但尚未完成的写入数量
+        self._pending = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending_lock = threading.Lock()
+        track_queue_depth("pg_writer", self._pending_count)
+        self.init_database()
+
+    def _pending_count(self) -> int:
+        return self._pending
+
+    def init_database(self):
+        """创建表结构，多个进程同时启动时用咨询锁串行执行"""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("SELECT pg_advisory_xact_lock(hashtext('ciweimao_schema'))")
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            logger.info("PostgreSQL 数据库初始化成功")
+        except Exception as e:
+            logger.error("初始化数据库失败: %s", e)
+            logger.error(traceback.format_exc())
+            raise
+
+    def save_books(self, books_data: List[Tuple]) -> int:
+        """按 book_url 插入或更新书籍信息，返回新增记录数"""
+        try:
+            return self._write_books(books_data)
+        except Exception as e:
+            logger.error("保存数据失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def _write_books(self, books_data: List[Tuple]) -> int:
+        if not books_data:
+            logger.warning("没有数据需要保存")
+            return 0
+        with self.pool.connection() as conn, DB_WRITE_SECONDS.time(
+            op="pg_save_books"
+        ):
+            with conn.cursor() as cursor:
+                return self._save_books(cursor, books_data)
+
+    def _save_books(self, cursor, books_data: List[Tuple]) -> int:
+        # 同一批次内按 book_url 去重，保留最后一条，
+        # 同一条 upsert 语句不能两次更新同一行
+        rows = list({book[BOOK_URL_INDEX]: book for book in books_data}.values())
+        if len(rows) >= COPY_THRESHOLD:
+            _copy_to_stage(cursor, "books_stage", "books", BOOK_COLUMNS, rows)
+            cursor.execute(_BOOKS_MERGE_SQL)
+            flags = [row["inserted"] for row in cursor.fetchall()]
+        else:
+            cursor.executemany(_BOOKS_UPSERT_SQL, rows, returning=True)
+            flags = []
+            while True:
+                flags.extend(row["inserted"] for row in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+        inserted = sum(1 for flag in flags if flag)
+        logger.debug("新增 %d 条, 更新 %d 条", inserted, len(flags) - inserted)
+        return inserted
+
+    def save_listing_page(self, page: int, books_data: List[Tuple]) -> int:
+        """在一个事务中保存一页书籍并标记该页完成，返回新增记录数
+
+        upsert 本身是幂等的，不需要 SQLite 后端那样的内存去重索引。
+        """
+        try:
+            return self._write_listing_page(page, books_data)
+        except Exception as e:
+            logger.error("保存第 %s 页数据失败: %s", page, e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def _write_listing_page(self, page: int, books_data: List[Tuple]) -> int:
+        with self.pool.connection() as conn, DB_WRITE_SECONDS.time(op="pg_save_page"):
+            with conn.cursor() as cursor:
+                inserted = 0
+                if books_data:
+                    inserted = self._save_books(cursor, books_data)
+                cursor.execute(
+                    _RECORD_PAGE_SQL,
+                    (page, PAGE_DONE, len(books_data), page_hash(books_data)),
+                )
+        return inserted
+
+    def _record_page_failed(self, page: int) -> bool:
+        with self.pool.connection() as conn:
+            conn.execute(_RECORD_PAGE_SQL, (page, PAGE_FAILED, 0, None))
+        return True
+
+    def get_pending_pages(self, start_page: int, end_page: int) -> List[int]:
+        """获取区间内尚未成功爬取的页码"""
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT page FROM crawl_pages
+                    WHERE status = %s AND page BETWEEN %s AND %s
+                    """,
+                    (PAGE_DONE, start_page, end_page),
+                ).fetchall()
+            done = {row["page"] for row in rows}
+            return [p for p in range(start_page, end_page + 1) if p not in done]
+        except Exception as e:
+            logger.error("获取爬取进度失败: %s", e)
+            logger.error(traceback.format_exc())
+            return list(range(start_page, end_page + 1))
+
+    def _submit(self, function, *args) -> Future:
+        """把写操作交给线程池，并统计尚未完成的数量
+
+        未完成的写入达到上限时阻塞，直到有写入完成；
+        写入出错时异常设置到返回的 Future 上。
+        """
+        self._slots.acquire()
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(self._run_write, function, *args)
+        except BaseException:
+            self._finish_write()
+            raise
+
+    def _run_write(self, function, *args):
+        try:
+            return function(*args)
+        finally:
+            self._finish_write()
+
+    def _finish_write(self):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit_books(self, books_data: List[Tuple]) -> Future:
+        return self._submit(self._write_books, books_data)
+
+    def submit_listing_page(self, page: int, books_data: List[Tuple]) -> Future:
+        return self._submit(self._write_listing_page, page, books_data)
+
+    def submit_page_failed(self, page: int) -> Future:
+        return self._submit(self._record_page_failed, page)
+
+    def save_book_detail(self, book_id, book_url, detail_data: Dict) -> bool:
+        return self.save_book_details_bulk([(book_id, book_url, detail_data)]) == 1
+
+    def save_book_details_bulk(self, records: Iterable[Tuple]) -> int:
+        """在一个事务中写入详情、封面链接并标记已爬取，返回写入条数"""
+        try:
+            return self._write_book_details(records)
+        except Exception as e:
+            logger.error("批量保存书籍详情失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def _write_book_details(self, records: Iterable[Tuple]) -> int:
+        records = list(records)
+        if not records:
+            return 0
+        rows = [detail_row(*record) for record in records]
+        with self.pool.connection() as conn, DB_WRITE_SECONDS.time(
+            op="pg_save_book_details"
+        ):
+            rows = list({row[1]: row for row in rows}.values())
+            with conn.cursor() as cursor:
+                if len(rows) >= COPY_THRESHOLD:
+                    _copy_to_stage(
+                        cursor, "details_stage", "book_details", DETAIL_COLUMNS, rows
+                    )
+                    cursor.execute(_DETAIL_MERGE_SQL)
+                else:
+                    cursor.executemany(_DETAIL_UPSERT_SQL, rows)
+                self._record_stats(cursor, [stats_snapshot(row) for row in rows])
+                cursor.execute(
+                    _MARK_CRAWLED_SQL,
+                    (
+                        [book_id for book_id, _, _ in records],
+                        [data.get("cover", "") for _, _, data in records],
+                    ),
+                )
+        return len(records)
+
+    def _record_stats(self, cursor, snapshots: List[Tuple], ts: int = None) -> int:
+        """与每本书最近一次快照比较，只追加有变化的统计，返回追加数量"""
+        ts = int(time.time()) if ts is None else ts
+        cursor.execute(
+            _LATEST_STATS_SQL, ([book_id for book_id, _ in snapshots],)
+        )
+        latest = {
+            row["book_id"]: tuple(row[column] for column in STATS_COLUMNS)
+            for row in cursor.fetchall()
+        }
+        changed = []
+        for book_id, values in snapshots:
+            if latest.get(book_id) != values:
+                latest[book_id] = values
+                changed.append((book_id, ts, *values))
+        if changed:
+            cursor.executemany(_INSERT_STATS_SQL, changed)
+        return len(changed)
+
+    def get_stats_series(
+        self, book_id: int, start_ts: int = None, end_ts: int = None
+    ) -> List[Dict]:
+        """返回一本书在时间区间内的统计快照，按时间升序"""
+        try:
+            with self.pool.connection() as conn:
+                return conn.execute(
+                    f"""
+                    SELECT ts, {", ".join(STATS_COLUMNS)} FROM book_stats_history
+                    WHERE book_id = %s AND ts BETWEEN %s AND %s
+                    ORDER BY ts
+                    """,
+                    (book_id, start_ts or 0, end_ts or int(time.time())),
+                ).fetchall()
+        except Exception as e:
+            logger.error("获取统计历史失败 %s: %s", book_id, e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def get_top_movers(
+        self, metric: str = "total_hits", window: int = 7 * 24 * 3600, limit=20
+    ) -> List[Dict]:
+        """返回最近 window 秒内 metric 增长最多的书籍，规则与 SQLite 后端相同"""
+        if metric not in STATS_COLUMNS:
+            raise ValueError(f"不支持的统计字段: {metric}")
+        since = int(time.time()) - window
+        try:
+            with self.pool.connection() as conn:
+                return conn.execute(
+                    f"""
+                    SELECT book_id, start_value, end_value,
+                           end_value - start_value AS delta
+                    FROM (
+                        SELECT c.book_id,
+                            COALESCE(
+                                (SELECT {metric} FROM book_stats_history h
+                                 WHERE h.book_id = c.book_id AND h.ts <= %s
+                                 ORDER BY h.ts DESC LIMIT 1),
+                                (SELECT {metric} FROM book_stats_history h
+                                 WHERE h.book_id = c.book_id
+                                 ORDER BY h.ts LIMIT 1)
+                            ) AS start_value,
+                            (SELECT {metric} FROM book_stats_history h
+                             WHERE h.book_id = c.book_id
+                             ORDER BY h.ts DESC LIMIT 1) AS end_value
+                        FROM (
+                            SELECT DISTINCT book_id FROM book_stats_history
+                            WHERE ts > %s
+                        ) c
+                    ) movers
+                    ORDER BY delta DESC
+                    LIMIT %s
+                    """,
+                    (since, since, limit),
+                ).fetchall()
+        except Exception as e:
+            logger.error("获取统计变化排行失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def submit_book_detail(self, book_id, book_url, detail_data: Dict) -> Future:
+        return self._submit(self._write_book_detail, book_id, book_url, detail_data)
+
+    def _write_book_detail(self, book_id, book_url, detail_data: Dict) -> bool:
+        return self._write_book_details([(book_id, book_url, detail_data)]) == 1
+
+    def submit_detail_crawled(self, book_id) -> Future:
+        return self._submit(self._mark_detail_crawled, book_id)
+
+    def _mark_detail_crawled(self, book_id) -> bool:
+        with self.pool.connection() as conn:
+            conn.execute(_MARK_CRAWLED_SQL, ([book_id], [""]))
+        return True
+
+    def get_uncrawled_books(self, limit=100) -> List:
+        try:
+            with self.pool.connection() as conn:
+                return conn.execute(
+                    """
+                    SELECT id, book_url FROM books
+                    WHERE detail_crawled = 0 ORDER BY id LIMIT %s
+                    """,
+                    (limit,),
+                ).fetchall()
+        except Exception as e:
+            logger.error("获取未爬取书籍失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def is_detail_exists(self, book_url) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT EXISTS (SELECT 1 FROM book_details WHERE book_url = %s)",
+                    (book_url,),
+                ).fetchone()
+                return row["exists"]
+        except Exception as e:
+            logger.error("检查书籍详情是否存在失败 %s: %s", book_url, e)
+            logger.error(traceback.format_exc())
+            return False
+
+    def count_books(self) -> int:
+        try:
+            with self.pool.connection() as conn:
+                return conn.execute("SELECT COUNT(*) AS n FROM books").fetchone()["n"]
+        except Exception as e:
+            logger.error("获取书籍总数失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def claim_books(
+        self, owner: str, limit=100, lease_seconds: float = DETAIL_LEASE_SECONDS
+    ) -> List:
+        """领取一批书籍，已被其他事务锁定的行直接跳过，不等待"""
+        now = time.time()
+        try:
+            with self.pool.connection() as conn:
+                books = conn.execute(
+                    """
+                    UPDATE books SET lease_owner = %s, lease_expires = %s
+                    WHERE id IN (
+                        SELECT id FROM books
+                        WHERE detail_crawled = 0 AND lease_expires < %s
+                        ORDER BY lease_expires, id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, book_url, detail_stale
+                    """,
+                    (owner, now + lease_seconds, now, limit),
+                ).fetchall()
+            logger.debug("%s 领取 %d 本书籍", owner, len(books))
+            return sorted(books, key=lambda book: book["id"])
+        except Exception as e:
+            logger.error("领取书籍失败: %s", e)
+            logger.error(traceback.format_exc())
+            return []
+
+    def renew_leases(
+        self,
+        owner: str,
+        book_ids: List[int],
+        lease_seconds: float = DETAIL_LEASE_SECONDS,
+    ) -> int:
+        return self._update_leases(
+            "lease_expires = %s",
+            (time.time() + lease_seconds,),
+            "lease_owner = %s AND detail_crawled = 0",
+            owner,
+            book_ids,
+        )
+
+    def release_leases(self, owner: str, book_ids: List[int]) -> int:
+        return self._update_leases(
+            "lease_owner = NULL, lease_expires = 0",
+            (),
+            "lease_owner = %s",
+            owner,
+            book_ids,
+        )
+
+    def reclaim_expired_leases(self) -> int:
+        try:
+            with self.pool.connection() as conn:
+                count = conn.execute(
+                    """
+                    UPDATE books SET lease_owner = NULL, lease_expires = 0
+                    WHERE detail_crawled = 0
+                      AND lease_expires > 0 AND lease_expires < %s
+                    """,
+                    (time.time(),),
+                ).rowcount
+            if count:
+                logger.info("回收 %s 个过期租约", count)
+            return count
+        except Exception as e:
+            logger.error("回收过期租约失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def _update_leases(self, assignments, values, condition, owner, book_ids):
+        if not book_ids:
+            return 0
+        try:
+            with self.pool.connection() as conn:
+                return conn.execute(
+                    f"""
+                    UPDATE books SET {assignments}
+                    WHERE {condition} AND id = ANY(%s)
+                    """,
+                    (*values, owner, list(book_ids)),
+                ).rowcount
+        except Exception as e:
+            logger.error("更新租约失败: %s", e)
+            logger.error(traceback.format_exc())
+            return 0
+
+    def close(self):
+        """等待已提交的写入完成并关闭连接池"""
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+        logger.info("PostgreSQL 连接池已关闭")
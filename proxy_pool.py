@@ -0,0 +1,295 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+import requests
+
+from logger import setup_logger
+from config import (
+    PROXIES,
+    LOG_PATH,
+    PROXY_PROBE_URL,
+    PROXY_FAILURE_THRESHOLD,
+    PROXY_BASE_BACKOFF,
+    PROXY_MAX_BACKOFF,
+)
+
+logger = setup_logger("proxy_pool", LOG_PATH)
+
+
+# 说明代理本身不可用的状态码：被目标站封禁、代理认证失败、被限流
+PROXY_FAILURE_STATUSES = (403, 407, 429)
+
+
+def is_proxy_failure(status: Optional[int] = None, error: Exception = None) -> bool:
+    """判断一次失败是否应计入代理的健康统计
+
+    只有连接错误、超时和 PROXY_FAILURE_STATUSES 中的状态码与代理有关；
+    404、解析错误、缓存响应上的错误都不是代理的问题，不能让代理因此被隔离。
+    """
+    if error is not None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None) or getattr(
+            error, "status", None
+        )
+        if status is None:
+            return isinstance(
+                error,
+                (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    aiohttp.ClientConnectionError,
+                    asyncio.TimeoutError,
+                ),
+            )
+    return status in PROXY_FAILURE_STATUSES
+
+
+def to_requests_proxies(proxy: Optional[str]) -> Optional[Dict[str, str]]:
+    """把代理地址转换为 requests 使用的 proxies 参数"""
+    return {"http": proxy, "https": proxy} if proxy else None
+
+
+class ProxyStats:
+    """单个代理的健康统计"""
+
+    def __init__(self, proxy: str):
+        self.proxy = proxy
+        self.success = 0
+        self.failure = 0
+        self.consecutive_failures = 0
+        self.latency_ewma = None
+        self.quarantine_count = 0
+        self.retry_at = 0.0  # 隔离结束时间, 0 表示未隔离
+
+    @property
+    def quarantined(self) -> bool:
+        return self.retry_at > 0
+
+    @property
+    def success_rate(self) -> float:
+        # 拉普拉斯平滑, 新代理从 0.5 起步
+        return (self.success + 1) / (self.success + self.failure + 2)
+
+    def score(self) -> float:
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return self.success_rate / (latency + 0.1)
+
+
+class ProxyManager:
+    """线程安全、可在 asyncio 中直接调用的代理池
+
+    按成功率和延迟 EWMA 加权选择代理；连续失败的代理会被隔离，
+    隔离时长指数退避，并由后台线程探测恢复，不占用请求路径。
+    """
+
+    def __init__(
+        self,
+        proxies: List[str] = None,
+        probe_url: str = PROXY_PROBE_URL,
+        failure_threshold: int = PROXY_FAILURE_THRESHOLD,
+        base_backoff: float = PROXY_BASE_BACKOFF,
+        max_backoff: float = PROXY_MAX_BACKOFF,
+        alpha: float = 0.3,
+        probe_interval: float = 1.0,
+    ):
+        self.probe_url = probe_url
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.alpha = alpha
+        self.probe_interval = probe_interval
+        self._lock = threading.Lock()
+        self._stats = {p: ProxyStats(p) for p in (proxies or PROXIES)}
+        self._stop = threading.Event()
+        self._probe_thread = None
+
+    def get_proxy(self) -> Optional[str]:
+        """按健康分数加权选择一个代理
+
+        全部被隔离时阻塞等待，直到最早的隔离到期或有代理恢复。
+        """
+        while True:
+            proxy, delay = self._choose()
+            if delay <= 0:
+                return proxy
+            time.sleep(delay)
+
+    async def get_proxy_async(self) -> Optional[str]:
+        """get_proxy 的异步版本，等待时不阻塞事件循环"""
+        while True:
+            proxy, delay = self._choose()
+            if delay <= 0:
+                return proxy
+            await asyncio.sleep(delay)
+
+    def _choose(self) -> Tuple[Optional[str], float]:
+        """返回 (代理, 0)，全部被隔离时返回 (None, 需要等待的秒数)"""
+        with self._lock:
+            if not self._stats:
+                return None, 0.0
+            healthy = [s for s in self._stats.values() if not s.quarantined]
+            if healthy:
+                weights = [s.score() for s in healthy]
+                return random.choices(healthy, weights=weights)[0].proxy, 0.0
+            # 隔离已到期的代理等同于一次探测，只交给一个调用方：
+            # 把到期时间再推后一个隔离时长，其他调用方继续等待，
+            # 探测请求成功后由 report_success 解除隔离
+            stats = min(self._stats.values(), key=lambda s: s.retry_at)
+            now = time.monotonic()
+            delay = stats.retry_at - now
+            if delay <= 0:
+                stats.retry_at = now + self._backoff(stats)
+                return stats.proxy, 0.0
+        logger.debug("所有代理均被隔离，%.1f 秒后重试", delay)
+        # 分段等待，期间有代理被成功请求或探测恢复时可以尽早返回
+        return None, min(delay, 1.0)
+
+    def report_success(self, proxy: Optional[str], latency: float):
+        """请求成功后回报延迟"""
+        if not proxy:
+            return
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            stats.success += 1
+            stats.consecutive_failures = 0
+            if stats.latency_ewma is None:
+                stats.latency_ewma = latency
+            else:
+                stats.latency_ewma = (
+                    self.alpha * latency + (1 - self.alpha) * stats.latency_ewma
+                )
+            if stats.quarantined:
+                self._release(stats)
+
+    def report_failure(self, proxy: Optional[str], error: str = ""):
+        """请求失败后回报，连续失败达到阈值则隔离"""
+        if not proxy:
+            return
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            stats.failure += 1
+            stats.consecutive_failures += 1
+            if (
+                not stats.quarantined
+                and stats.consecutive_failures >= self.failure_threshold
+            ):
+                self._quarantine(stats, error)
+        self._ensure_probe_thread()
+
+    def report_error(
+        self, proxy: Optional[str], error: Exception = None, status: int = None
+    ):
+        """回报一次失败的请求，只有 is_proxy_failure 认定与代理有关的失败才计入"""
+        if not is_proxy_failure(status, error):
+            return
+        reason = str(error) if error is not None else f"状态码 {status}"
+        self.report_failure(proxy, reason)
+
+    def snapshot(self) -> List[Dict]:
+        """返回所有代理的统计信息"""
+        with self._lock:
+            return [
+                {
+                    "proxy": s.proxy,
+                    "success": s.success,
+                    "failure": s.failure,
+                    "consecutive_failures": s.consecutive_failures,
+                    "latency_ewma": s.latency_ewma,
+                    "quarantined": s.quarantined,
+                    "score": s.score(),
+                }
+                for s in self._stats.values()
+            ]
+
+    def stop(self):
+        """停止后台探测线程"""
+        self._stop.set()
+        if self._probe_thread is not None:
+            self._probe_thread.join(timeout=5)
+
+    def _backoff(self, stats: ProxyStats) -> float:
+        """第 quarantine_count 次隔离的时长"""
+        return min(
+            self.base_backoff * 2 ** max(stats.quarantine_count - 1, 0),
+            self.max_backoff,
+        )
+
+    def _quarantine(self, stats: ProxyStats, error: str = ""):
+        # 调用方需持有锁
+        stats.quarantine_count += 1
+        backoff = self._backoff(stats)
+        stats.retry_at = time.monotonic() + backoff
+        logger.warning("代理 %s 被隔离 %.0f 秒: %s", stats.proxy, backoff, error)
+
+    def _release(self, stats: ProxyStats):
+        # 调用方需持有锁
+        stats.retry_at = 0.0
+        stats.quarantine_count = 0
+        stats.consecutive_failures = 0
+        logger.info("代理 %s 恢复可用", stats.proxy)
+
+    def _ensure_probe_thread(self):
+        with self._lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._stop.clear()
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, name="proxy-probe", daemon=True
+            )
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        """后台探测到期的隔离代理"""
+        while not self._stop.wait(self.probe_interval):
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    s.proxy
+                    for s in self._stats.values()
+                    if s.quarantined and s.retry_at <= now
+                ]
+            for proxy in due:
+                self._probe(proxy)
+
+    def _probe(self, proxy: str):
+        start = time.monotonic()
+        try:
+            response = requests.get(
+                self.probe_url, proxies=to_requests_proxies(proxy), timeout=5
+            )
+            ok = response.status_code == 200
+            error = f"状态码 {response.status_code}"
+        except Exception as e:
+            ok = False
+            error = str(e)
+
+        with self._lock:
+            stats = self._stats[proxy]
+            if not stats.quarantined:
+                return
+            if ok:
+                stats.latency_ewma = time.monotonic() - start
+                self._release(stats)
+            else:
+                self._quarantine(stats, error)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_proxy_manager() -> ProxyManager:
+    """获取进程内共享的代理池"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ProxyManager(PROXIES)
+        return _manager
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from logger import setup_logger
+from config import (
+    LOG_PATH,
+    RATE_LIMIT_HOST_RATE,
+    RATE_LIMIT_PROXY_RATE,
+    RATE_LIMIT_MIN_RATE,
+    RATE_LIMIT_MAX_RATE,
+)
+
+logger = setup_logger("rate_limiter", LOG_PATH)
+
+
+class TokenBucket:
+    """AIMD 自适应速率的令牌桶
+
+    成功时速率线性增加，收到 429/5xx/超时时速率减半，
+    同一冷却期内只减一次，避免一波失败把速率压到底。
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float = RATE_LIMIT_MIN_RATE,
+        max_rate: float = RATE_LIMIT_MAX_RATE,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        # 容量约等于一秒的请求量，允许小幅突发
+        self.tokens = max(rate, 1.0)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+
+    @property
+    def capacity(self) -> float:
+        return max(self.rate, 1.0)
+
+    def reserve(self, now: float) -> float:
+        """预留一个令牌，返回需要等待的秒数（调用方需持有锁）"""
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, now: float) -> bool:
+        if now - self._last_decrease < self.cooldown:
+            return False
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        return True
+
+
+def is_throttle_signal(status: Optional[int] = None, error: Exception = None) -> bool:
+    """判断是否为需要降速的信号：429、5xx 或超时"""
+    if error is not None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None) or getattr(
+            error, "status", None
+        )
+        if status is None:
+            return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or (
+                "timeout" in type(error).__name__.lower()
+            )
+    return status is not None and (status == 429 or status >= 500)
+
+
+class RateLimiter:
+    """按目标站点和代理分别限速，线程和 asyncio 中均可使用"""
+
+    def __init__(
+        self,
+        host_rate: float = RATE_LIMIT_HOST_RATE,
+        proxy_rate: float = RATE_LIMIT_PROXY_RATE,
+    ):
+        self.host_rate = host_rate
+        self.proxy_rate = proxy_rate
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, TokenBucket] = {}
+        self._proxies: Dict[str, TokenBucket] = {}
+
+    def _buckets(self, url: str, proxy: Optional[str]):
+        host = urlsplit(url).netloc
+        buckets = [self._hosts.setdefault(host, TokenBucket(self.host_rate))]
+        if proxy:
+            buckets.append(self._proxies.setdefault(proxy, TokenBucket(self.proxy_rate)))
+        return buckets
+
+    def _reserve(self, url: str, proxy: Optional[str]) -> float:
+        now = time.monotonic()
+        with self._lock:
+            return max(bucket.reserve(now) for bucket in self._buckets(url, proxy))
+
+    def acquire(self, url: str, proxy: Optional[str] = None):
+        """阻塞直到允许向 url 发出请求"""
+        delay = self._reserve(url, proxy)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, url: str, proxy: Optional[str] = None):
+        """acquire 的异步版本"""
+        delay = self._reserve(url, proxy)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def report(
+        self,
+        url: str,
+        proxy: Optional[str] = None,
+        status: Optional[int] = None,
+        error: Exception = None,
+    ):
+        """回报请求结果，用于调整速率"""
+        now = time.monotonic()
+        throttle = is_throttle_signal(status, error)
+        with self._lock:
+            for bucket in self._buckets(url, proxy):
+                if throttle:
+                    if bucket.on_throttle(now):
+                        logger.warning(
+                            "收到限流信号 %s，速率降至 %.2f/s", status or error, bucket.rate
+                        )
+                elif error is None and status is not None and status < 400:
+                    bucket.on_success()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """返回当前各站点和代理的速率"""
+        with self._lock:
+            return {
+                "hosts": {k: b.rate for k, b in self._hosts.items()},
+                "proxies": {k: b.rate for k, b in self._proxies.items()},
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程内共享的限速器"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -1,142 +1,155 @@
-import sqlite3
-import requests
+# 封面补抓：详情爬取已在同一事务中写入封面链接，
+# 这里只处理详情页当时没有解析到封面的书籍
+
 from concurrent.futures import ThreadPoolExecutor
-import random
 import time
 from typing import List, Dict
-import logging
-import re
-from config import DB_NAME, PROXIES
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from lxml import etree
+from config import DB_NAME, LOG_PATH
+from logger import setup_logger
+from database import Database
+from details import extract_cover
+from header_profiles import get_header_profiles
+from metrics import observe_response, start_metrics
+from rate_limiter import get_rate_limiter
+from http_cache import get_http_cache
+from proxy_pool import (
+    ProxyManager,
+    get_proxy_manager,
+    to_requests_proxies,
 )
 
+logger = setup_logger("spride_img", LOG_PATH)
+
 class ProxyPool:
+    """共享代理池的适配层，返回 requests 格式的代理"""
+
     def __init__(self, proxies=None):
-        self.proxies = proxies or [
-            # 默认代理列表，将被config中的代理覆盖
-            "http://proxy1.example.com:8080",
-            "http://proxy2.example.com:8080",
-        ]
-        self.current_index = 0
+        # 未指定代理列表时使用进程内共享的代理池，统计信息与其他爬虫互通
+        self.manager = ProxyManager(proxies) if proxies else get_proxy_manager()
 
     def get_proxy(self) -> Dict[str, str]:
-        proxy = self.proxies[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.proxies)
-        return {"http": proxy, "https": proxy}
+        return to_requests_proxies(self.manager.get_proxy())
+
+    def report_success(self, proxy: Dict[str, str], latency: float):
+        if proxy:
+            self.manager.report_success(proxy["http"], latency)
+
+    def report_failure(self, proxy: Dict[str, str], error: str = ""):
+        if proxy:
+            self.manager.report_failure(proxy["http"], error)
+
+    def report_error(self, proxy: Dict[str, str], error: Exception):
+        if proxy:
+            self.manager.report_error(proxy["http"], error)
 
 class BookImageCrawler:
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self.proxy_pool = ProxyPool(PROXIES)
-        self.session = requests.Session()
-        
-        # 设置请求头，模拟浏览器
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-        })
-
-    def get_books_without_image(self) -> List[Dict]:
-        """获取没有封面的图书信息"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, book_url, book_name 
-            FROM books 
-            WHERE book_image IS NULL OR book_image = ''
-        """)
-        books = [{"id": row[0], "book_url": row[1], "book_name": row[2]} 
-                for row in cursor.fetchall()]
-        conn.close()
-        return books
+        self.db = Database(db_path)
+        self.proxy_pool = ProxyPool()
+        self.rate_limiter = get_rate_limiter()
+        self.http_cache = get_http_cache()
+        self.header_profiles = get_header_profiles()
+
+    def get_books_without_image(self, after_id: int = 0, limit: int = 1000) -> List[Dict]:
+        """按 id 分页获取详情已爬取但仍没有封面的图书"""
+        return [dict(row) for row in self.db.get_books_without_image(after_id, limit)]
 
     def extract_image_url(self, html_content: str, book_url: str) -> str:
-        """从HTML中提取图片URL"""
-        # 根据用户提供的实际HTML结构调整正则表达式
-        img_patterns = [
-            # 用户提供的特定格式
-            r'<div class="cover ly-fl">\s*<img src="(.*?)"',
-            # 通用模式作为备选
-            r'<img.*?src="(.*?)".*?alt="[^"]*(?:' + re.escape(book_url.split('/')[-1]) + '|[^"]*)"',
-            r'<img.*?src="(.*?)".*?>',
-            r'<meta property="og:image" content="(.*?)"'
-        ]
-        
-        for pattern in img_patterns:
-            matches = re.findall(pattern, html_content)
-            if matches:
-                img_url = matches[0]
-                # 处理相对URL
-                if img_url.startswith('//'):
-                    img_url = 'https:' + img_url
-                elif not img_url.startswith(('http://', 'https://')):
-                    # 获取book_url的域名部分
-                    domain = '/'.join(book_url.split('/')[:3])
-                    img_url = domain + ('/' if not img_url.startswith('/') else '') + img_url
-                return img_url
-        return None
+        """从HTML中提取图片URL，与详情解析使用同一套规则"""
+        tree = etree.HTML(html_content)
+        if tree is None:
+            return None
+        return extract_cover(tree) or None
 
     def get_image_url(self, book_url: str) -> str:
         """获取图书封面链接"""
         max_retries = 3
         for attempt in range(max_retries):
+            proxy = self.proxy_pool.get_proxy()
+            proxy_key = proxy["http"] if proxy else None
+            sent_at = []
+
+            def before_send():
+                self.rate_limiter.acquire(book_url, proxy_key)
+                # 限速等待结束后才开始计时
+                sent_at.append(time.perf_counter())
+
             try:
-                proxy = self.proxy_pool.get_proxy()
-                response = self.session.get(book_url, proxies=proxy, timeout=10)
+                start = time.monotonic()
+                response = self.http_cache.request(
+                    "GET",
+                    book_url,
+                    # 按代理使用固定的浏览器请求头
+                    headers=self.header_profiles.for_proxy(proxy_key),
+                    before_send=before_send,
+                    proxies=proxy,
+                    timeout=10,
+                )
+                if not response.from_cache:
+                    observe_response(
+                        "detail", proxy_key, response, time.perf_counter() - sent_at[-1]
+                    )
+                    self.rate_limiter.report(
+                        book_url, proxy_key, status=response.status_code
+                    )
                 response.raise_for_status()
-                
+                if not response.from_cache:
+                    self.proxy_pool.report_success(proxy, time.monotonic() - start)
+
                 # 提取图片URL
                 img_url = self.extract_image_url(response.text, book_url)
                 if img_url:
                     return img_url
-                logging.warning(f"在页面中未找到图片链接: {book_url}")
+                logger.warning("在页面中未找到图片链接: %s", book_url)
                 
             except Exception as e:
-                logging.error(f"获取页面失败 {book_url}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(random.uniform(1, 3))
+                self.proxy_pool.report_error(proxy, e)
+                if getattr(e, "response", None) is None:
+                    self.rate_limiter.report(book_url, proxy_key, error=e)
+                logger.error("获取页面失败 %s: %s", book_url, e)
                 continue
         return None
 
     def update_book_image(self, book_id: int, image_url: str):
-        """更新数据库中的图片URL"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE books 
-            SET book_image = ? 
-            WHERE id = ?
-        """, (image_url, book_id))
-        conn.commit()
-        conn.close()
+        """更新数据库中的图片URL，交给数据库的写线程分组提交"""
+        return self.db.submit_book_image(book_id, image_url)
 
     def process_book(self, book: Dict):
         """处理单本图书"""
         try:
-            logging.info(f"开始处理图书: {book['book_name']}")
+            logger.info("开始处理图书: %s", book["book_name"])
             image_url = self.get_image_url(book['book_url'])
             if image_url:
                 self.update_book_image(book['id'], image_url)
-                logging.info(f"成功更新图书封面链接: {book['book_name']} -> {image_url}")
+                logger.info("成功更新图书封面链接: %s -> %s", book["book_name"], image_url)
             else:
-                logging.error(f"无法获取图书封面链接: {book['book_name']}")
+                logger.error("无法获取图书封面链接: %s", book["book_name"])
         except Exception as e:
-            logging.error(f"处理图书失败 {book['book_name']}: {str(e)}")
+            logger.error("处理图书失败 %s: %s", book["book_name"], e)
 
-    def run(self, max_workers: int = 5):
+    def run(self, max_workers: int = 5, batch_size: int = 1000):
         """运行爬虫"""
-        books = self.get_books_without_image()
-        logging.info(f"找到 {len(books)} 本需要处理封面的图书")
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            executor.map(self.process_book, books)
+        total = 0
+        last_id = 0
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                while True:
+                    books = self.get_books_without_image(last_id, batch_size)
+                    if not books:
+                        break
+                    last_id = books[-1]["id"]
+                    total += len(books)
+                    logger.info("找到 %s 本需要补抓封面的图书 (id <= %s)", len(books), last_id)
+                    list(executor.map(self.process_book, books))
+        finally:
+            # 关闭时等待写线程提交剩余的更新
+            self.db.close()
+        logger.info("封面补抓结束，共处理 %s 本图书", total)
 
 if __name__ == "__main__":
+    start_metrics()
     # 使用示例
     crawler = BookImageCrawler(
         db_path=DB_NAME,  # 使用config中的数据库路径
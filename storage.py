@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Tuple
+
+from config import DB_NAME, DETAIL_LEASE_SECONDS, STORAGE_URL
+
+
+class Storage(ABC):
+    """爬虫使用的存储接口
+
+    列表页和详情爬虫只依赖这些方法，可以在 SQLite 与 PostgreSQL 之间切换。
+    查询返回的行支持按列名取值，如 book["id"]。
+    """
+
+    @abstractmethod
+    def save_books(self, books_data: List[Tuple]) -> int:
+        """保存书籍信息，返回新增记录数"""
+
+    @abstractmethod
+    def submit_books(self, books_data: List[Tuple]) -> Future:
+        """异步保存书籍信息，Future 返回新增记录数"""
+
+    @abstractmethod
+    def submit_listing_page(self, page: int, books_data: List[Tuple]) -> Future:
+        """异步保存一页列表数据并在同一事务中标记该页完成，Future 返回新增记录数"""
+
+    @abstractmethod
+    def submit_page_failed(self, page: int) -> Future:
+        """异步记录列表页爬取失败"""
+
+    @abstractmethod
+    def get_pending_pages(self, start_page: int, end_page: int) -> List[int]:
+        """获取区间内尚未成功爬取的页码"""
+
+    @abstractmethod
+    def save_book_detail(self, book_id, book_url, detail_data: Dict) -> bool:
+        """保存一条书籍详情并标记已爬取"""
+
+    @abstractmethod
+    def save_book_details_bulk(self, records: Iterable[Tuple]) -> int:
+        """批量保存 (book_id, book_url, detail_data)，返回写入条数"""
+
+    @abstractmethod
+    def submit_book_detail(self, book_id, book_url, detail_data: Dict) -> Future:
+        """异步保存书籍详情，Future 返回是否成功"""
+
+    @abstractmethod
+    def submit_detail_crawled(self, book_id) -> Future:
+        """异步标记书籍详情已爬取"""
+
+    @abstractmethod
+    def get_uncrawled_books(self, limit=100) -> List:
+        """获取未爬取详情的书籍"""
+
+    @abstractmethod
+    def is_detail_exists(self, book_url) -> bool:
+        """检查书籍详情是否已存在"""
+
+    @abstractmethod
+    def count_books(self) -> int:
+        """获取书籍总数"""
+
+    @abstractmethod
+    def claim_books(
+        self, owner: str, limit=100, lease_seconds: float = DETAIL_LEASE_SECONDS
+    ) -> List:
+        """原子地领取一批未爬取详情的书籍
+
+        返回含 id、book_url、detail_stale 的行；detail_stale 为 1 表示
+        已有的详情已过期，需要重新抓取。
+        """
+
+    @abstractmethod
+    def renew_leases(
+        self,
+        owner: str,
+        book_ids: List[int],
+        lease_seconds: float = DETAIL_LEASE_SECONDS,
+    ) -> int:
+        """为仍由 owner 持有的租约续期，返回续期成功的数量"""
+
+    @abstractmethod
+    def release_leases(self, owner: str, book_ids: List[int]) -> int:
+        """释放 owner 持有的租约"""
+
+    @abstractmethod
+    def reclaim_expired_leases(self) -> int:
+        """清理已过期的租约，返回清理的数量"""
+
+    @abstractmethod
+    def close(self):
+        """写完未提交的数据并释放连接"""
+
+
+def open_storage(url: str = STORAGE_URL) -> Storage:
+    """按连接地址打开存储
+
+    postgresql:// 或 postgres:// 使用 PostgreSQL，sqlite:///路径 或空值使用 SQLite。
+    """
+    if url.startswith(("postgresql://", "postgres://")):
+        from postgres_storage import PostgresStorage
+
+        return PostgresStorage(url)
+
+    from database import Database
+
+    if url.startswith("sqlite:///"):
+        return Database(url[len("sqlite:///") :])
+    if url:
+        raise ValueError(f"不支持的存储地址: {url}")
+    return Database(DB_NAME)
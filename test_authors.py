@@ -0,0 +1,125 @@
+# 作者主页的测试：统计信息与作品列表的解析、缺失字段处理和入库
+
+import pytest
+
+from authors import author_id_from_url, parse_author_page
+from database import Database
+
+AUTHOR_URL = "https://www.ciweimao.com/reader/1"
+
+BOOK = (
+    "玄幻",
+    "书1",
+    "https://www.ciweimao.com/book/1",
+    "第一章",
+    "https://www.ciweimao.com/chapter/1",
+    "作者",
+    "https://www.ciweimao.com/reader/1",
+    "1万",
+    "2024-01-01",
+)
+
+BOOK_ITEM = """
+<li data-book-id="{book_id}">
+  <img data-original="https://img.ciweimao.com/{book_id}.jpg">
+  <h3 class="title">
+    <a href="https://www.ciweimao.com/book/{book_id}"> 书{book_id} </a>
+  </h3>
+  <p class="intro"><span>1.2万点击</span><span>玄幻</span></p>
+  <div class="info"><p>更新</p><p>第十章</p><p>时间</p><p>2024-01-01</p></div>
+</li>
+"""
+
+
+def author_html(book_ids, stats=True):
+    items = "".join(BOOK_ITEM.format(book_id=i) for i in book_ids)
+    header = (
+        '<div><div><ul><li><b id="J_BookAmount">2</b></li><li><b>3.5万</b></li>'
+        "<li><b>120</b></li><li><b>8</b></li></ul></div></div>"
+        if stats
+        else "<div></div>"
+    )
+    return f"""
+<html><body>
+<div></div><div></div>{header}
+<img id="userAvatar" data-original="https://img.ciweimao.com/avatar.jpg">
+<ul class="book-list">{items}</ul>
+</body></html>
+""".encode(
+        "utf-8"
+    )
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "books.db"))
+    db.save_books([BOOK])
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_parse_author_page():
+    info = parse_author_page(author_html([1, 2]))
+    stats = ("book_amount", "footprint", "fans", "following")
+    assert [info[key] for key in stats] == ["2", "3.5万", "120", "8"]
+    assert info["avatar"] == "https://img.ciweimao.com/avatar.jpg"
+    assert info["books"][0] == {
+        "book_id": "1",
+        "cover": "https://img.ciweimao.com/1.jpg",
+        "name": "书1",
+        "url": "https://www.ciweimao.com/book/1",
+        "clicks": "1.2万点击",
+        "category": "玄幻",
+        "update_to": "第十章",
+        "update_time": "2024-01-01",
+    }
+    assert [b["book_id"] for b in info["books"]] == ["1", "2"]
+
+
+def test_missing_book_fields_are_empty():
+    page = author_html([1]).decode("utf-8")
+    page = page.replace("<span>1.2万点击</span><span>玄幻</span>", "")
+    (book,) = parse_author_page(page)["books"]
+    assert (book["clicks"], book["category"]) == ("", "")
+    assert book["update_time"] == "2024-01-01"
+
+
+@pytest.mark.parametrize(
+    "intro, expected",
+    [
+        ("<span></span><span>玄幻</span>", ("", "玄幻")),
+        ("<span>1.2万<i>点击</i></span><span>玄幻</span>", ("1.2万点击", "玄幻")),
+    ],
+)
+def test_intro_spans_do_not_shift(intro, expected):
+    page = author_html([1]).decode("utf-8")
+    page = page.replace("<span>1.2万点击</span><span>玄幻</span>", intro)
+    (book,) = parse_author_page(page)["books"]
+    assert (book["clicks"], book["category"]) == expected
+
+
+def test_page_without_stats_returns_none():
+    assert parse_author_page(author_html([1], stats=False)) is None
+
+
+def test_author_id_from_url():
+    assert author_id_from_url(AUTHOR_URL) == 1
+    assert author_id_from_url("https://www.ciweimao.com/book/1") is None
+
+
+def test_saved_author_is_not_crawled_again(db):
+    (author,) = db.get_uncrawled_authors()
+    assert author["author_url"] == AUTHOR_URL
+
+    info = parse_author_page(author_html([1, 2]))
+    assert db.submit_author(AUTHOR_URL, author["author"], info).result(timeout=5)
+    conn = db._read_connection()
+    row = conn.execute(
+        "SELECT author_id, book_amount, footprint, fans FROM authors"
+    ).fetchone()
+    assert row == (1, 2, 35000, 120)
+    count = conn.execute("SELECT COUNT(*) FROM author_books").fetchone()[0]
+    assert count == 2
+    assert db.get_uncrawled_authors() == []
@@ -0,0 +1,145 @@
+# 章节目录的测试：与已入库章节比较只写入差异，最新章节已入库时按检查时间跳过请求
+
+import time
+
+import pytest
+
+import chapters
+from chapters import crawl_book_chapters, parse_chapter_list
+from database import Database
+from db_writer import completed_future
+
+LOCK = '<i class="icon-lock"></i>'
+
+BOOK = (
+    "玄幻",
+    "书1",
+    "https://www.ciweimao.com/book/1",
+    "第一章",
+    "https://www.ciweimao.com/chapter/1",
+    "作者",
+    "https://www.ciweimao.com/reader/1",
+    "1万",
+    "2024-01-01",
+)
+
+
+def chapter_html(items):
+    """生成章节目录片段，items 为 (chapter_id, 标题, 是否锁定) 列表"""
+    links = "".join(
+        f'<li><a href="https://www.ciweimao.com/chapter/{chapter_id}">'
+        f'{LOCK if locked else ""}{title}</a></li>'
+        for chapter_id, title, locked in items
+    )
+    return (
+        '<div class="book-chapter-box"><h4 class="sub-tit">第一卷</h4>'
+        f'<ul class="book-chapter-list">{links}</ul></div>'
+    ).encode("utf-8")
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "books.db"))
+    db.save_books([BOOK])
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def fake_fetch(monkeypatch):
+    """章节目录请求由 pages 中的 HTML 代替，记录请求次数"""
+    pages = []
+    calls = []
+
+    class Response:
+        from_cache = True
+
+        def __init__(self, content):
+            self.content = content
+
+    class Pool:
+        def parse(self, kind, document):
+            return completed_future(parse_chapter_list(document))
+
+    def fetch(book_id, proxies=None, before_send=None):
+        calls.append(book_id)
+        return Response(pages[-1])
+
+    monkeypatch.setattr(chapters, "fetch_chapter_list", fetch)
+    monkeypatch.setattr(chapters, "get_parse_pool", Pool)
+    return pages, calls
+
+
+def stored(db):
+    return db._read_connection().execute(
+        "SELECT chapter_id, title, is_locked FROM chapters ORDER BY position"
+    ).fetchall()
+
+
+def test_save_chapters_writes_only_differences(db):
+    book_id = db.get_books_for_chapters()[0]["id"]
+    first = parse_chapter_list(chapter_html([(1, "一", False), (2, "二", True)]))
+    assert db.submit_chapters(book_id, first).result(timeout=5) == (2, 0)
+    assert db.submit_chapters(book_id, first).result(timeout=5) == (0, 0)
+
+    # 第 2 章解锁、改名，新增第 3 章
+    second = parse_chapter_list(
+        chapter_html([(1, "一", False), (2, "二(修)", False), (3, "三", True)])
+    )
+    assert db.submit_chapters(book_id, second).result(timeout=5) == (1, 1)
+    assert stored(db) == [(1, "一", 0), (2, "二(修)", 0), (3, "三", 1)]
+
+
+def volume(title, chapter_ids):
+    return {
+        "title": title,
+        "chapters": [
+            {
+                "chapter_id": i,
+                "title": f"第{i}章",
+                "is_locked": False,
+                "url": f"https://www.ciweimao.com/chapter/{i}",
+            }
+            for i in chapter_ids
+        ],
+    }
+
+
+def test_reordered_and_moved_chapters_are_updated(db):
+    book_id = db.get_books_for_chapters()[0]["id"]
+    first = [volume("第一卷", [1, 2, 3])]
+    assert db.submit_chapters(book_id, first).result(timeout=5) == (3, 0)
+
+    # 第 3 章提到最前，第 2 章移到新的第二卷
+    second = [volume("第一卷", [3, 1]), volume("第二卷", [2])]
+    assert db.submit_chapters(book_id, second).result(timeout=5) == (0, 3)
+    rows = db._read_connection().execute(
+        """
+        SELECT c.chapter_id, v.title, c.position FROM chapters c
+        JOIN volumes v ON v.id = c.volume_id ORDER BY c.position
+        """
+    ).fetchall()
+    assert rows == [(3, "第一卷", 1), (1, "第一卷", 2), (2, "第二卷", 3)]
+
+
+def test_stored_latest_chapter_is_rechecked_after_interval(db, fake_fetch):
+    pages, calls = fake_fetch
+    # book(1) 的最新章节 id 为 1
+    pages.append(chapter_html([(1, "一", True)]))
+    (book,) = db.get_books_for_chapters()
+    assert crawl_book_chapters(book, db).result(timeout=5) == (1, 0)
+
+    # 刚检查过，最新章节已入库时不再请求
+    (book,) = db.get_books_for_chapters()
+    assert book["chapters_checked_at"] >= int(time.time()) - 1
+    assert crawl_book_chapters(book, db).result(timeout=5) == (0, 0)
+    assert len(calls) == 1
+
+    # 超过检查间隔后重新请求，发现锁定状态变化
+    pages.append(chapter_html([(1, "一", False)]))
+    result = crawl_book_chapters(book, db, recheck_seconds=0).result(timeout=5)
+    assert result == (0, 1)
+    assert len(calls) == 2
+    assert stored(db) == [(1, "一", 0)]
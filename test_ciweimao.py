@@ -0,0 +1,122 @@
+# 异步列表页流水线的测试：流式入库、去重、断点续爬，以及出错时取消其余各级
+# 网络请求由 fetch_page 的替身代替，解析走真实的解析进程池
+
+import asyncio
+
+import pytest
+
+import ciweimao
+from database import Database
+
+
+def listing_html(book_ids):
+    """与列表页结构相同的 HTML，每个 book_id 一行"""
+    rows = "".join(
+        "<tr>"
+        "<td><p>玄幻</p></td>"
+        f'<td><p><a href="https://www.ciweimao.com/book/{i}">书{i}</a></p></td>'
+        f'<td><p><a href="https://www.ciweimao.com/chapter/{i}">第一章</a></p></td>'
+        '<td><p><a href="https://www.ciweimao.com/reader/1">作者</a></p></td>'
+        "<td><p>1万</p></td>"
+        "<td><p>2024-01-01</p></td>"
+        "</tr>"
+        for i in book_ids
+    )
+    return (
+        "<html><body><div>"
+        "<table><tr><th>类别</th><th>书名</th></tr>"
+        f"{rows}</table>"
+        "</div></body></html>"
+    ).encode("utf-8")
+
+
+@pytest.fixture
+def db_name(tmp_path, monkeypatch):
+    db_name = str(tmp_path / "books.db")
+    monkeypatch.setattr(ciweimao, "open_storage", lambda: Database(db_name))
+    return db_name
+
+
+def run_pages(monkeypatch, pages, failing=(), **kwargs):
+    fetched = []
+
+    async def fake_fetch_page(session, page):
+        fetched.append(page)
+        if page in failing:
+            raise ConnectionError("连接失败")
+        return pages[page]
+
+    monkeypatch.setattr(ciweimao, "fetch_page", fake_fetch_page)
+    asyncio.run(
+        ciweimao.process_pages(
+            start_page=1,
+            end_page=len(pages),
+            max_concurrent_requests=2,
+            parse_workers=1,
+            **kwargs,
+        )
+    )
+    return sorted(fetched)
+
+
+def test_pipeline_saves_pages_and_resumes(db_name, monkeypatch):
+    # 第 2、3 页有重复的书籍，只写入一次
+    pages = {
+        1: listing_html(range(0, 5)),
+        2: listing_html(range(5, 10)),
+        3: listing_html(range(8, 12)),
+        4: listing_html(range(12, 15)),
+    }
+    assert run_pages(monkeypatch, pages, failing={4}) == [1, 2, 3, 4]
+
+    db = Database(db_name)
+    try:
+        assert db.count_books() == 12
+        assert db.get_pending_pages(1, 4) == [4]
+    finally:
+        db.close()
+
+    assert run_pages(monkeypatch, pages, resume=True) == [4]
+    db = Database(db_name)
+    try:
+        assert db.count_books() == 15
+        assert db.get_pending_pages(1, 4) == []
+    finally:
+        db.close()
+
+
+def test_total_is_counted_before_storage_closes(tmp_path, monkeypatch):
+    calls = []
+
+    class RecordingDatabase(Database):
+        def count_books(self):
+            calls.append("count")
+            return super().count_books()
+
+        def close(self):
+            calls.append("close")
+            super().close()
+
+    db_name = str(tmp_path / "books.db")
+    monkeypatch.setattr(ciweimao, "open_storage", lambda: RecordingDatabase(db_name))
+    run_pages(monkeypatch, {1: listing_html(range(3))})
+    assert calls == ["count", "close"]
+
+
+def test_run_stages_cancels_siblings_on_error():
+    cancelled = []
+
+    async def forever():
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("解析进程池已关闭")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(asyncio.wait_for(ciweimao.run_stages(forever(), failing()), 5))
+    assert cancelled == [True]
@@ -0,0 +1,146 @@
+# 多线程列表页爬虫的测试，get_page_data 由替身代替，不访问网络
+
+import pytest
+
+import ciweimao_thread
+from database import Database
+
+
+def book_row(i, update_time="2024-01-01"):
+    return (
+        "玄幻",
+        f"书{i}",
+        f"https://www.ciweimao.com/book/{i}",
+        "第一章",
+        f"https://www.ciweimao.com/chapter/{i}",
+        "作者",
+        "https://www.ciweimao.com/reader/1",
+        "1万",
+        update_time,
+    )
+
+
+@pytest.fixture
+def db_name(tmp_path, monkeypatch):
+    db_name = str(tmp_path / "books.db")
+    monkeypatch.setattr(ciweimao_thread, "Database", lambda: Database(db_name))
+    return db_name
+
+
+def test_resume_fetches_only_pending_pages(db_name, monkeypatch):
+    fetched = []
+    failing = {3}
+
+    def fake_get_page_data(page):
+        fetched.append(page)
+        if page in failing:
+            raise ConnectionError("连接失败")
+        return [book_row(page)]
+
+    monkeypatch.setattr(ciweimao_thread, "get_page_data", fake_get_page_data)
+    ciweimao_thread.process_pages(1, 4, max_workers=2)
+    assert sorted(fetched) == [1, 2, 3, 4]
+
+    fetched.clear()
+    failing.clear()
+    ciweimao_thread.process_pages(1, 4, max_workers=2, resume=True)
+    assert fetched == [3]
+    db = Database(db_name)
+    try:
+        assert db.count_books() == 4
+        assert db.get_pending_pages(1, 4) == []
+    finally:
+        db.close()
+
+
+def listing_pages(count=5, per_page=3):
+    """按更新时间倒序排列的列表页，第 p 页为 {p: [书籍元组...]}"""
+    pages = {}
+    for p in range(1, count + 1):
+        ids = range((p - 1) * per_page, p * per_page)
+        pages[p] = [book_row(i, f"2024-01-01 {23 - i:02d}:00") for i in ids]
+    return pages
+
+
+SORTED_URL = "https://www.ciweimao.com/book_list/sorted/{page}"
+
+
+def run_incremental(monkeypatch, pages, failing=(), **kwargs):
+    fetched = []
+    failing = set(failing)
+
+    def fake_get_page_data(page, url_template=None):
+        fetched.append(page)
+        if page in failing:
+            failing.discard(page)
+            raise ConnectionError("连接失败")
+        return pages[page]
+
+    monkeypatch.setattr(ciweimao_thread, "get_page_data", fake_get_page_data)
+    still_failed = ciweimao_thread.crawl_incremental(
+        max_pages=len(pages), max_workers=1, url_template=SORTED_URL, **kwargs
+    )
+    return fetched, still_failed
+
+
+def seed(db_name, pages):
+    db = Database(db_name)
+    try:
+        db.save_books([b for books in pages.values() for b in books])
+    finally:
+        db.close()
+
+
+def stale_urls(db_name):
+    db = Database(db_name)
+    try:
+        return {b["book_url"] for b in db.claim_books("test") if b["detail_stale"]}
+    finally:
+        db.close()
+
+
+def test_is_sorted_by_update():
+    newer, older = book_row(1, "2024-02-01 10:00"), book_row(2, "2024-01-01 10:00")
+    assert ciweimao_thread.is_sorted_by_update([newer, older])
+    assert ciweimao_thread.is_sorted_by_update([newer, book_row(3, ""), older])
+    assert not ciweimao_thread.is_sorted_by_update([older, newer])
+    # 本页不能比上一页的最后一行更新
+    assert not ciweimao_thread.is_sorted_by_update([newer], after="2024-01-15 00:00")
+
+
+def test_incremental_stops_at_first_unchanged_page(db_name, monkeypatch):
+    pages = listing_pages()
+    seed(db_name, pages)
+    pages[1][0] = book_row(0, "2024-01-02 00:00")
+
+    fetched, still_failed = run_incremental(monkeypatch, pages)
+    assert fetched == [1, 2]
+    assert still_failed == []
+    assert stale_urls(db_name) == {book_row(0)[2]}
+
+
+def test_incremental_fails_when_listing_is_unsorted(db_name, monkeypatch):
+    pages = listing_pages()
+    seed(db_name, pages)
+    pages[1].reverse()
+
+    with pytest.raises(ciweimao_thread.ListingOrderError):
+        run_incremental(monkeypatch, pages)
+
+
+def test_incremental_requires_sorted_listing_url(db_name):
+    with pytest.raises(ValueError):
+        ciweimao_thread.crawl_incremental(url_template="")
+
+
+def test_incremental_retries_failed_pages(db_name, monkeypatch):
+    pages = listing_pages()
+    seed(db_name, pages)
+    pages[1][0] = book_row(0, "2024-01-02 00:00")
+    pages[2][0] = book_row(3, "2024-01-01 20:30")
+
+    # 第 2 页失败时第 3 页没有变化，先停止，再重试第 2 页
+    fetched, still_failed = run_incremental(monkeypatch, pages, failing={2})
+    assert fetched == [1, 2, 3, 2]
+    assert still_failed == []
+    assert stale_urls(db_name) == {book_row(0)[2], book_row(3)[2]}
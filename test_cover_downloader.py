@@ -0,0 +1,154 @@
+# 封面下载的测试：内容寻址存储去重、客户端错误不重试、
+# 已下载但文件被删除的封面重新下载
+
+import asyncio
+import os
+
+import pytest
+
+import cover_downloader
+from cover_downloader import BlobStore, BlobWriter, CoverSync, download_cover
+from database import Database
+
+COVER_URL = "https://img.ciweimao.com/cover.jpg"
+
+BOOK = (
+    "玄幻",
+    "书1",
+    "https://www.ciweimao.com/book/1",
+    "第一章",
+    "https://www.ciweimao.com/chapter/1",
+    "作者",
+    "https://www.ciweimao.com/reader/1",
+    "1万",
+    "2024-01-01",
+)
+
+DETAIL = {
+    "title": "书",
+    "stats": {"总点击": "26.5万", "总收藏": "100", "总字数": "1.2万"},
+    "detail_stats": {"章节": "12"},
+    "cover": COVER_URL,
+}
+
+
+class FakeResponse:
+    def __init__(self, status, body=b""):
+        self.status = status
+        self.content = self
+        self._body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self._body), size):
+            yield self._body[i : i + size]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """按顺序返回预设的 (状态码, 内容)，记录请求次数"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, headers=None):
+        self.calls += 1
+        return FakeResponse(*self.responses.pop(0))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / "covers"))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "books.db"))
+    db.save_books([BOOK])
+    (claimed,) = db.claim_books("a")
+    db.submit_book_detail(claimed["id"], claimed["book_url"], DETAIL).result(timeout=5)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_identical_content_is_stored_once(store):
+    digests = []
+    for expected_new in (True, False):
+        writer = store.open_writer()
+        writer.write(b"image")
+        digest, size, new = writer.commit()
+        assert (size, new) == (5, expected_new)
+        digests.append(digest)
+    assert digests[0] == digests[1]
+    assert store.path(digests[0]).endswith(
+        os.path.join(digests[0][:2], digests[0][2:4], digests[0])
+    )
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_abort_removes_tmp_file(store):
+    writer = store.open_writer()
+    writer.write(b"part")
+    writer.abort()
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_chunks_are_buffered_before_writing(store, monkeypatch):
+    monkeypatch.setattr(cover_downloader, "CHUNK_SIZE", 4)
+    monkeypatch.setattr(cover_downloader, "WRITE_BUFFER_SIZE", 10)
+    writes = []
+    original_write = BlobWriter.write
+
+    def write(self, data):
+        writes.append(len(data))
+        original_write(self, data)
+
+    monkeypatch.setattr(BlobWriter, "write", write)
+    body = bytes(range(25))
+    digest, size, _ = asyncio.run(
+        download_cover(FakeSession((200, body)), store, COVER_URL)
+    )
+    # 每攒够 10 字节写一次，剩余部分最后写入
+    assert writes == [12, 12, 1]
+    with open(store.path(digest), "rb") as f:
+        assert (f.read(), size) == (body, 25)
+
+
+def test_client_errors_are_not_retried(db, store):
+    sync = CoverSync(db, store, retries=3)
+    session = FakeSession((404,))
+    assert asyncio.run(sync.fetch(session, COVER_URL)) is None
+    assert session.calls == 1
+
+    session = FakeSession((503,), (200, b"image"))
+    assert asyncio.run(sync.fetch(session, f"{COVER_URL}?v=2"))[1] == 5
+    assert session.calls == 2
+
+
+def test_deleted_blob_is_downloaded_again(db, store):
+    async def run(session):
+        sync = CoverSync(db, store)
+        await sync.sync_books(session, db.get_pending_covers())
+        return sync.missing_blobs(db.get_downloaded_covers())
+
+    assert asyncio.run(run(FakeSession((200, b"image")))) == []
+    assert db.get_pending_covers() == []
+
+    (downloaded,) = db.get_downloaded_covers()
+    os.remove(store.path(downloaded["cover_sha256"]))
+
+    async def verify(session):
+        sync = CoverSync(db, store)
+        missing = sync.missing_blobs(db.get_downloaded_covers())
+        assert [b["id"] for b in missing] == [downloaded["id"]]
+        assert await sync.sync_books(session, missing) == (1, 0)
+
+    asyncio.run(verify(FakeSession((200, b"image"))))
+    assert store.exists(downloaded["cover_sha256"])
@@ -0,0 +1,343 @@
+# SQLite 存储的测试
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database import MIGRATIONS, STATS_COLUMNS, Database, parse_count
+
+DETAIL = {
+    "title": "书",
+    "stats": {"总点击": "26.5万", "总收藏": "100", "总字数": "1.2万"},
+    "detail_stats": {"章节": "12"},
+    "cover": "",
+}
+
+
+def book_row(i, update_time="2024-01-01"):
+    return (
+        "玄幻",
+        f"书{i}",
+        f"https://www.ciweimao.com/book/{i}",
+        "第一章",
+        f"https://www.ciweimao.com/chapter/{i}",
+        "作者",
+        "https://www.ciweimao.com/reader/1",
+        "1万",
+        update_time,
+    )
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "books.db"))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_pending_pages_are_missing_or_failed(db):
+    db.submit_page(1, [book_row(1)], 1, "a").result(timeout=5)
+    db.submit_page_failed(2).result(timeout=5)
+    db.submit_page(4, [book_row(4)], 1, "b").result(timeout=5)
+    assert db.get_pending_pages(1, 5) == [2, 3, 5]
+
+    # 失败后重试成功，尝试次数累加
+    db.submit_page(2, [book_row(2)], 1, "c").result(timeout=5)
+    assert db.get_pending_pages(1, 5) == [3, 5]
+    row = db._read_connection().execute(
+        "SELECT status, attempts, row_count FROM crawl_pages WHERE page = 2"
+    ).fetchone()
+    assert row == ("done", 2, 1)
+
+
+def test_listing_page_skips_known_books(db):
+    first = db.submit_listing_page(1, [book_row(i) for i in range(5)])
+    second = db.submit_listing_page(2, [book_row(i) for i in range(3, 8)])
+    assert first.result(timeout=5) == 5
+    assert second.result(timeout=5) == 3
+    assert db.count_books() == 8
+    assert db.get_pending_pages(1, 2) == []
+
+
+def test_failed_page_write_releases_dedup_claims(db):
+    def fail(cursor, *args):
+        raise RuntimeError("磁盘已满")
+
+    db._save_page = fail
+    future = db.submit_listing_page(1, [book_row(1)])
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    assert book_row(1)[2] not in db.get_book_index()
+    assert db.get_pending_pages(1, 1) == [1]
+
+    del db._save_page
+    assert db.submit_listing_page(1, [book_row(1)]).result(timeout=5) == 1
+
+
+def test_changed_books_are_claimed_as_stale(db):
+    db.save_books([book_row(1)])
+    (claimed,) = db.claim_books("a")
+    assert claimed["detail_stale"] == 0
+    db.submit_book_detail(claimed["id"], claimed["book_url"], DETAIL).result(timeout=5)
+    assert db.claim_books("a") == []
+
+    db.submit_changed_books([book_row(1, "2024-02-01")]).result(timeout=5)
+    (stale,) = db.claim_books("a")
+    assert stale["id"] == claimed["id"]
+    assert stale["detail_stale"] == 1
+
+    db.submit_book_detail(stale["id"], stale["book_url"], DETAIL).result(timeout=5)
+    db.submit_changed_books([book_row(1, "2024-02-01")]).result(timeout=5)
+    (again,) = db.claim_books("b")
+    assert again["detail_stale"] == 1
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("0.57万", 5700),
+        ("26.5万", 265000),
+        ("1.01亿", 101000000),
+        ("1,234", 1234),
+        ("0.29万", 2900),
+        ("1.2.3万", None),
+        ("无", None),
+    ],
+)
+def test_parse_count(text, expected):
+    assert parse_count(text) == expected
+
+
+def test_save_book_details_bulk(db):
+    db.save_books([book_row(1), book_row(2)])
+    claimed = db.claim_books("a")
+    covers = [f"https://img.ciweimao.com/{row['id']}.jpg" for row in claimed]
+    records = [
+        (
+            row["id"],
+            row["book_url"],
+            {**DETAIL, "stats": {**DETAIL["stats"], "总点击": hits}, "cover": cover},
+        )
+        for row, hits, cover in zip(claimed, ("0.57万", "1.2亿"), covers)
+    ]
+    assert db.save_book_details_bulk(records) == 2
+
+    conn = db._read_connection()
+    rows = conn.execute(
+        "SELECT total_hits, chapter_count FROM book_details ORDER BY book_id"
+    ).fetchall()
+    assert rows == [(5700, 12), (120000000, 12)]
+    books = conn.execute(
+        "SELECT detail_crawled, lease_owner, book_image FROM books ORDER BY id"
+    ).fetchall()
+    assert books == [(1, None, cover) for cover in covers]
+    assert db.claim_books("b") == []
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_fresh_database_is_fully_migrated(db):
+    with sqlite3.connect(db.db_name) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        indexes = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+        assert version == MIGRATIONS[-1][0]
+        assert {
+            "lease_owner",
+            "lease_expires",
+            "detail_stale",
+            "chapters_checked_at",
+            "book_image",
+        } <= columns(conn, "books")
+        assert "idx_books_lease" in indexes
+        assert "idx_books_uncrawled" not in indexes
+
+
+def test_legacy_database_is_upgraded(tmp_path):
+    # 迁移前的 books 表结构，已有数据需要保留
+    db_name = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db_name) as conn:
+        conn.execute(
+            """
+            CREATE TABLE books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category TEXT,
+                book_name TEXT,
+                book_url TEXT UNIQUE,
+                latest_chapter TEXT,
+                latest_chapter_url TEXT,
+                author TEXT,
+                author_url TEXT,
+                word_count TEXT,
+                update_time TEXT,
+                detail_crawled INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+        conn.execute(
+            """
+            INSERT INTO books (
+                category, book_name, book_url, latest_chapter,
+                latest_chapter_url, author, author_url,
+                word_count, update_time
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            book_row(1),
+        )
+
+    db = Database(db_name)
+    try:
+        with sqlite3.connect(db_name) as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            assert version == MIGRATIONS[-1][0]
+            assert "detail_stale" in columns(conn, "books")
+        assert db.count_books() == 1
+        assert [b["book_url"] for b in db.claim_books("a")] == [book_row(1)[2]]
+    finally:
+        db.close()
+
+    # 再次打开时不会重复执行迁移
+    Database(db_name).close()
+
+
+def test_legacy_details_are_recrawled(tmp_path):
+    # 旧版本把 "1.2万" 记为 1.2，已有详情需要重新爬取
+    db_name = str(tmp_path / "legacy.db")
+    Database(db_name).close()
+    with sqlite3.connect(db_name) as conn:
+        conn.execute(
+            "INSERT INTO books (book_url, detail_crawled) VALUES (?, 1), (?, 1)",
+            (book_row(1)[2], book_row(2)[2]),
+        )
+        conn.execute(
+            """
+            INSERT INTO book_details (book_id, book_url, total_hits)
+            VALUES (1, ?, 1.2)
+            """,
+            (book_row(1)[2],),
+        )
+        conn.execute("PRAGMA user_version = 6")
+
+    db = Database(db_name)
+    try:
+        (claimed,) = db.claim_books("a")
+        assert (claimed["book_url"], claimed["detail_stale"]) == (book_row(1)[2], 1)
+    finally:
+        db.close()
+
+
+def test_claim_books_is_exclusive(db):
+    assert db.save_books([book_row(i) for i in range(10)]) == 10
+    first = db.claim_books("a", limit=6)
+    second = db.claim_books("b", limit=6)
+    assert len(first) == 6
+    assert len(second) == 4
+    assert not {b["id"] for b in first} & {b["id"] for b in second}
+    assert db.claim_books("c") == []
+
+
+def test_concurrent_claims_do_not_overlap(db):
+    db.save_books([book_row(i) for i in range(200)])
+    claimed = {}
+
+    def worker(owner):
+        ids = []
+        while True:
+            books = db.claim_books(owner, limit=7)
+            if not books:
+                break
+            ids.extend(b["id"] for b in books)
+        claimed[owner] = ids
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    all_ids = [i for ids in claimed.values() for i in ids]
+    assert len(all_ids) == 200
+    assert len(set(all_ids)) == 200
+
+
+def test_renew_and_release_only_own_leases(db):
+    db.save_books([book_row(i) for i in range(3)])
+    ids = [b["id"] for b in db.claim_books("a")]
+    assert db.renew_leases("b", ids) == 0
+    assert db.release_leases("b", ids) == 0
+    assert db.renew_leases("a", ids) == 3
+
+    assert db.release_leases("a", ids[:1]) == 1
+    assert [b["id"] for b in db.claim_books("b")] == ids[:1]
+
+
+def test_expired_leases_are_reclaimed(db):
+    db.save_books([book_row(i) for i in range(3)])
+    claimed = db.claim_books("a", lease_seconds=-1)
+    assert len(claimed) == 3
+
+    # 已爬取详情的书籍不再回收
+    done = claimed[0]
+    assert db.submit_book_detail(done["id"], done["book_url"], DETAIL).result(
+        timeout=5
+    )
+    assert db.reclaim_expired_leases() == 2
+    assert {b["id"] for b in db.claim_books("b")} == {b["id"] for b in claimed[1:]}
+
+
+def stats(hits, favor=0):
+    """按 STATS_COLUMNS 排列的统计值，只关心点击和收藏"""
+    return (hits, favor) + (0,) * (len(STATS_COLUMNS) - 2)
+
+
+def record_stats(db, snapshots, ts):
+    return db.start_writer().submit(db._record_stats, snapshots, ts).result(timeout=5)
+
+
+def test_stats_history_only_appends_changes(db):
+    now = int(time.time())
+    assert record_stats(db, [(1, stats(100))], now - 30) == 1
+    assert record_stats(db, [(1, stats(100))], now - 20) == 0
+    assert record_stats(db, [(1, stats(150, 2))], now - 10) == 1
+
+    series = db.get_stats_series(1)
+    assert [(s["ts"], s["total_hits"], s["total_favor"]) for s in series] == [
+        (now - 30, 100, 0),
+        (now - 10, 150, 2),
+    ]
+    assert [s["ts"] for s in db.get_stats_series(1, start_ts=now - 15)] == [now - 10]
+
+
+def test_top_movers_use_value_at_window_start(db):
+    now = int(time.time())
+    day = 24 * 3600
+    # 书 1 在窗口前已有快照，窗口内增长 50；书 2 只有窗口内的快照，增长 500；
+    # 书 3 窗口内没有变化，不参与排行
+    record_stats(db, [(1, stats(1000)), (3, stats(10))], now - 10 * day)
+    record_stats(db, [(1, stats(1050)), (2, stats(100))], now - day)
+    record_stats(db, [(2, stats(600))], now - 60)
+
+    movers = db.get_top_movers(window=7 * day)
+    assert [(m["book_id"], m["delta"]) for m in movers] == [(2, 500), (1, 50)]
+    assert movers[1]["start_value"] == 1000
+    assert db.get_top_movers(limit=1)[0]["book_id"] == 2
+    with pytest.raises(ValueError):
+        db.get_top_movers(metric="title")
+
+
+def test_stats_history_rejects_non_integers(db):
+    record_stats(db, [(1, stats(100))], ts=100)
+    with sqlite3.connect(db.db_name) as conn:
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("UPDATE book_stats_history SET total_hits = 1.5")
@@ -16,7 +16,7 @@ def init_database(db_name):
         # 确保数据库目录存在
         os.makedirs(os.path.dirname(db_name), exist_ok=True)
 
-        logger.info(f"初始化数据库: {db_name}")
+        logger.info("初始化数据库: %s", db_name)
         with sqlite3.connect(db_name) as conn:
             cursor = conn.cursor()
 
@@ -39,10 +39,10 @@ def init_database(db_name):
             """
             )
             conn.commit()
-        logger.info(f"数据库初始化成功: {db_name}")
+        logger.info("数据库初始化成功: %s", db_name)
         return True
     except Exception as e:
-        logger.error(f"初始化数据库失败: {str(e)}")
+        logger.error("初始化数据库失败: %s", e)
         import traceback
 
         logger.error(traceback.format_exc())
@@ -56,7 +56,7 @@ def save_books(db_name, books_data: List[Tuple]):
         return 0
 
     try:
-        logger.info(f"正在保存 {len(books_data)} 条数据到 {db_name}")
+        logger.info("正在保存 %s 条数据到 %s", len(books_data), db_name)
 
         with sqlite3.connect(db_name) as conn:
             cursor = conn.cursor()
@@ -64,11 +64,11 @@ def save_books(db_name, books_data: List[Tuple]):
             # 先查询现有记录数
             cursor.execute("SELECT COUNT(*) FROM books")
             before_count = cursor.fetchone()[0]
-            logger.info(f"保存前数据库中有 {before_count} 条记录")
+            logger.info("保存前数据库中有 %s 条记录", before_count)
 
             # 打印数据示例
             if books_data:
-                logger.info(f"数据示例：{books_data[0]}")
+                logger.info("数据示例：%s", books_data[0])
 
             # 插入数据
             cursor.executemany(
@@ -92,12 +92,10 @@ def save_books(db_name, books_data: List[Tuple]):
             # 计算实际新增的记录数
             new_records = after_count - before_count
 
-            logger.info(
-                f"成功保存数据: 总共处理 {len(books_data)} 条，新增 {new_records} 条记录"
-            )
+            logger.info("成功保存数据: 总共处理 %s 条，新增 %s 条记录", len(books_data), new_records)
             return new_records
     except Exception as e:
-        logger.error(f"保存数据失败: {str(e)}")
+        logger.error("保存数据失败: %s", e)
         import traceback
 
         logger.error(traceback.format_exc())
@@ -112,10 +110,10 @@ def get_all_books(db_name):
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM books")
             books = cursor.fetchall()
-            logger.info(f"从数据库获取了 {len(books)} 条记录")
+            logger.info("从数据库获取了 %s 条记录", len(books))
             return books
     except Exception as e:
-        logger.error(f"获取数据失败: {str(e)}")
+        logger.error("获取数据失败: %s", e)
         import traceback
 
         logger.error(traceback.format_exc())
@@ -126,7 +124,7 @@ def test_database():
     """测试数据库功能"""
     # 使用绝对路径确保能找到数据库文件
     db_name = DB_NAME
-    logger.info(f"数据库路径: {db_name}")
+    logger.info("数据库路径: %s", db_name)
 
     # 初始化数据库
     if not init_database(db_name):
@@ -152,15 +150,15 @@ def test_database():
 
     # 获取当前记录数
     before_count = len(get_all_books(db_name))
-    logger.info(f"测试前数据库中有 {before_count} 条记录")
+    logger.info("测试前数据库中有 %s 条记录", before_count)
 
     # 保存测试数据
     saved_count = save_books(db_name, test_data)
-    logger.info(f"保存测试数据结果: 新增 {saved_count} 条记录")
+    logger.info("保存测试数据结果: 新增 %s 条记录", saved_count)
 
     # 获取保存后的记录数
     after_count = len(get_all_books(db_name))
-    logger.info(f"测试后数据库中有 {after_count} 条记录")
+    logger.info("测试后数据库中有 %s 条记录", after_count)
 
     # 验证记录是否增加
     if after_count > before_count:
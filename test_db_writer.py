@@ -0,0 +1,69 @@
+# 单写线程 DatabaseWriter 的测试：分组提交、Future 结果与单个操作失败的隔离
+
+import sqlite3
+
+import pytest
+
+from db_writer import DatabaseWriter, completed_future
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db_name = str(tmp_path / "writer.db")
+    with sqlite3.connect(db_name) as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+    writer = DatabaseWriter(db_name, batch_size=4, flush_interval=0.5)
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def insert(cursor, name):
+    cursor.execute("INSERT INTO items (name) VALUES (?)", (name,))
+    return cursor.lastrowid
+
+
+def count_items(writer):
+    with sqlite3.connect(writer.db_name) as conn:
+        return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+def test_futures_return_op_results(writer):
+    futures = [writer.submit(insert, f"书{i}") for i in range(3)]
+    assert [f.result(timeout=5) for f in futures] == [1, 2, 3]
+    assert count_items(writer) == 3
+
+
+def test_ops_are_grouped_into_batches(writer):
+    # 10 个操作加上 flush 共 11 个，按 batch_size=4 分为 3 个事务
+    futures = [writer.submit(insert, f"书{i}") for i in range(10)]
+    writer.flush(timeout=5)
+    assert all(f.done() for f in futures)
+    assert writer.commit_count == 3
+    assert count_items(writer) == 10
+
+
+def test_failed_op_does_not_roll_back_batch(writer):
+    first = writer.submit(insert, "重复")
+    duplicate = writer.submit(insert, "重复")
+    last = writer.submit(insert, "其他")
+    assert first.result(timeout=5) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        duplicate.result(timeout=5)
+    assert last.result(timeout=5) == 2
+    assert count_items(writer) == 2
+
+
+def test_close_commits_pending_ops(writer):
+    futures = [writer.submit(insert, f"书{i}") for i in range(6)]
+    writer.close()
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert count_items(writer) == 6
+
+    # 关闭后再次提交会重新启动写线程
+    assert writer.submit(insert, "重启").result(timeout=5) == 7
+
+
+def test_completed_future():
+    assert completed_future(5).result(timeout=0) == 5
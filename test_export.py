@@ -0,0 +1,95 @@
+# 导出的测试：跨块字典编码、UTC 时间戳、计数换算与失败时清理临时文件
+
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import export
+from database import Database
+from export import export_database, parse_time, read_arrow
+
+DETAIL = {
+    "title": "书",
+    "stats": {"总点击": "26.5万", "总收藏": "100", "总字数": "1.2万"},
+    "detail_stats": {"章节": "12"},
+    "cover": "",
+}
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / "books.db")
+    db = Database(db_name)
+    try:
+        # 作者在各块之间重复，也有新出现的
+        books = [
+            (
+                "玄幻",
+                f"书{i}",
+                f"https://www.ciweimao.com/book/{i}",
+                "第一章",
+                f"https://www.ciweimao.com/chapter/{i}",
+                f"作者{i % 3}",
+                "https://www.ciweimao.com/reader/1",
+                "1万",
+                "2024-01-01",
+            )
+            for i in range(5)
+        ]
+        db.save_books(books)
+        for row in db.claim_books("a"):
+            db.submit_book_detail(row["id"], row["book_url"], DETAIL).result(
+                timeout=5
+            )
+    finally:
+        db.close()
+    return db_name
+
+
+def test_arrow_dictionary_spans_chunks(db_name, tmp_path):
+    out = str(tmp_path / "out")
+    (result,) = export_database(
+        db_name, out, tables=["books"], fmt="arrow", chunk_size=2
+    )
+    assert result["rows"] == 5
+    table = read_arrow(result["path"])
+    assert table.column("author").to_pylist() == [f"作者{i % 3}" for i in range(5)]
+    assert table.column("word_count").to_pylist() == [10000] * 5
+    assert table.schema.field("created_at").type == pa.timestamp("s", tz="UTC")
+
+
+def test_epoch_is_exported_as_utc(db_name, tmp_path):
+    (result,) = export_database(
+        db_name, str(tmp_path / "out"), tables=["book_stats_history"]
+    )
+    table = pq.read_table(result["path"])
+    # Parquet 没有秒精度，读回为毫秒
+    assert table.schema.field("ts").type.tz == "UTC"
+    ts = table.column("ts").to_pylist()[0]
+    assert abs(ts.timestamp() - time.time()) < 60
+    assert table.column("total_hits").to_pylist() == [265000] * 5
+
+
+def test_failed_export_removes_tmp_file(db_name, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        yield from ()
+        raise RuntimeError("磁盘已满")
+
+    monkeypatch.setattr(export, "iter_batches", fail)
+    out = tmp_path / "out"
+    with pytest.raises(RuntimeError):
+        export_database(db_name, str(out), tables=["books"], fmt="arrow")
+    assert os.listdir(out) == []
+
+
+def test_parse_time():
+    assert parse_time("2024-01-02 03:04") == datetime(2024, 1, 2, 3, 4)
+    assert parse_time("2024/01/02") == datetime(2024, 1, 2)
+    assert parse_time("昨天") is None
+    utc = export._convert("utc", ["2024-01-02 03:04:05"])[0]
+    assert utc == datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
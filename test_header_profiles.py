@@ -0,0 +1,51 @@
+# 请求头配置的测试：按 UA 所属浏览器成套生成、同一代理始终得到同一套请求头
+
+from header_profiles import (
+    BUILTIN_USER_AGENTS,
+    HeaderProfiles,
+    browser_family,
+    build_profile,
+)
+
+FIREFOX = "Mozilla/5.0 (Windows NT 10.0; rv:125.0) Gecko/20100101 Firefox/125.0"
+SAFARI = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Safari/605.1.15"
+)
+
+
+def test_browser_family():
+    assert browser_family(FIREFOX) == "firefox"
+    assert browser_family(SAFARI) == "safari"
+    assert browser_family(BUILTIN_USER_AGENTS[0]) == "chrome"
+    assert browser_family("curl/8.0") == "chrome"
+
+
+def test_profile_headers_match_browser():
+    profile = build_profile(FIREFOX)
+    assert profile["User-Agent"] == FIREFOX
+    assert "zh-TW" in profile["Accept-Language"]
+    assert "image/apng" not in profile["Accept"]
+    assert "image/apng" in build_profile(BUILTIN_USER_AGENTS[0])["Accept"]
+
+
+def test_same_proxy_gets_same_profile():
+    profiles = HeaderProfiles(list(BUILTIN_USER_AGENTS))
+    proxy = "http://10.0.0.1:8080"
+    first = profiles.for_proxy(proxy)
+    assert profiles.for_proxy({"http": proxy, "https": proxy}) == first
+    # 新实例（如重启后）选择相同
+    assert HeaderProfiles(list(BUILTIN_USER_AGENTS)).for_proxy(proxy) == first
+    assert profiles.for_proxy(None) == profiles.for_proxy("direct")
+
+    chosen = {
+        profiles.for_proxy(f"http://10.0.0.{i}:8080")["User-Agent"] for i in range(50)
+    }
+    assert len(chosen) > 1
+
+
+def test_returned_headers_are_copies():
+    profiles = HeaderProfiles([FIREFOX])
+    headers = profiles.for_proxy(None)
+    headers["Referer"] = "https://www.ciweimao.com/"
+    assert "Referer" not in profiles.for_proxy(None)
@@ -0,0 +1,161 @@
+# HTTP 缓存的测试：有效期内命中、过期后条件请求、强制重新验证与离线模式，
+# 以及按压缩后大小统计容量、编码识别和 raise_for_status 携带的响应
+# 网络请求由 FakeRequester 代替，记录每次发出的请求头
+
+import os
+import zlib
+
+import pytest
+import requests
+
+from http_cache import CacheMiss, HttpCache
+
+URL = "https://www.ciweimao.com/book/1"
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+
+
+class FakeRequester:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def __call__(self, method, url, data=None, headers=None, **kwargs):
+        self.calls.append(headers)
+        return self.responses.pop(0)
+
+
+def make_cache(tmp_path, **kwargs):
+    kwargs.setdefault("max_bytes", 1024 * 1024)
+    kwargs.setdefault("ttl_rules", [])
+    kwargs.setdefault("default_ttl", 3600)
+    return HttpCache(cache_dir=str(tmp_path / "http"), **kwargs)
+
+
+def test_fresh_entry_is_served_from_cache(tmp_path):
+    cache = make_cache(tmp_path)
+    requester = FakeRequester(FakeResponse(200, "书".encode(), {"ETag": '"v1"'}))
+    first = cache.request("GET", URL, requester=requester)
+    assert not first.from_cache
+
+    second = cache.request("GET", URL, requester=requester)
+    assert second.from_cache
+    assert second.text == "书"
+    assert len(requester.calls) == 1
+
+
+def test_stale_entry_is_revalidated(tmp_path):
+    cache = make_cache(tmp_path, default_ttl=0)
+    requester = FakeRequester(
+        FakeResponse(200, b"v1", {"ETag": '"v1"', "Last-Modified": "Mon"}),
+        FakeResponse(304),
+    )
+    cache.request("GET", URL, requester=requester)
+    response = cache.request("GET", URL, requester=requester)
+    assert requester.calls[1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon"}
+    assert response.content == b"v1"
+    assert not response.from_cache
+
+
+def test_revalidate_bypasses_fresh_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    requester = FakeRequester(
+        FakeResponse(200, b"v1", {"ETag": '"v1"'}),
+        FakeResponse(200, b"v2", {"ETag": '"v2"'}),
+    )
+    cache.request("GET", URL, requester=requester)
+    response = cache.request("GET", URL, requester=requester, revalidate=True)
+    assert requester.calls[1] == {"If-None-Match": '"v1"'}
+    assert response.content == b"v2"
+    assert cache.request("GET", URL, requester=requester).content == b"v2"
+
+
+def test_offline_mode_never_touches_network(tmp_path):
+    cache = make_cache(tmp_path, default_ttl=0)
+    cache.request("GET", URL, requester=FakeRequester(FakeResponse(200, b"v1")))
+
+    offline = make_cache(tmp_path, offline=True, default_ttl=0)
+    requester = FakeRequester()
+    assert offline.request("GET", URL, requester=requester).content == b"v1"
+    with pytest.raises(CacheMiss):
+        offline.request("GET", f"{URL}/2", requester=requester)
+    assert requester.calls == []
+
+
+def test_errors_are_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    requester = FakeRequester(FakeResponse(404), FakeResponse(200, b"ok"))
+    assert cache.request("GET", URL, requester=requester).status_code == 404
+    assert cache.request("GET", URL, requester=requester).content == b"ok"
+
+
+def test_lru_eviction_keeps_total_under_limit(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=250)
+    for i in range(5):
+        body = os.urandom(100)
+        cache.request("GET", f"{URL}/{i}", requester=FakeRequester(FakeResponse(200, body)))
+    assert cache._total_bytes <= 250
+    assert cache.lookup(f"{URL}/4") is not None
+    assert cache.lookup(f"{URL}/0") is None
+
+
+def test_hits_do_not_write_until_next_store(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.request("GET", URL, requester=FakeRequester(FakeResponse(200, b"ok")))
+
+    def last_access():
+        return cache._conn.execute(
+            "SELECT last_access FROM entries WHERE key = ?", (URL,)
+        ).fetchone()[0]
+
+    stored_at = last_access()
+    changes = cache._conn.total_changes
+    assert cache.lookup(URL) is not None
+    assert cache._conn.total_changes == changes
+    assert last_access() == stored_at
+
+    other = FakeRequester(FakeResponse(200, b"other"))
+    cache.request("GET", f"{URL}/2", requester=other)
+    assert last_access() > stored_at
+
+
+def test_size_is_counted_compressed(tmp_path):
+    cache = make_cache(tmp_path)
+    body = b"a" * 10000
+    cache.request("GET", URL, requester=FakeRequester(FakeResponse(200, body)))
+    assert cache._total_bytes == len(zlib.compress(body, 6))
+
+
+def test_html_without_charset_is_not_decoded_as_latin1(tmp_path):
+    cache = make_cache(tmp_path)
+    body = "<html><body>刺猬猫</body></html>".encode()
+    headers = {"Content-Type": "text/html"}
+    live = cache.request(
+        "GET", URL, requester=FakeRequester(FakeResponse(200, body, headers))
+    )
+    assert live.encoding == "utf-8"
+    assert cache.request("GET", URL).text == "<html><body>刺猬猫</body></html>"
+
+
+def test_meta_charset_is_used(tmp_path):
+    cache = make_cache(tmp_path)
+    body = '<meta charset="gbk"><p>书</p>'.encode("gbk")
+    cache.request("GET", URL, requester=FakeRequester(FakeResponse(200, body)))
+    assert "书" in cache.request("GET", URL).text
+
+
+def test_cached_raise_for_status_carries_response(tmp_path):
+    cache = make_cache(tmp_path, default_ttl=0)
+    cache.request("GET", URL, requester=FakeRequester(FakeResponse(200, b"v1")))
+    response = make_cache(tmp_path, offline=True).request("GET", URL)
+    response.status_code = 503
+    with pytest.raises(requests.HTTPError) as exc:
+        response.raise_for_status()
+    assert exc.value.response is response
+    assert exc.value.response.status_code == 503
@@ -0,0 +1,52 @@
+# HTTP 客户端的测试：按代理复用 Session、连接池大小与异步会话配置
+
+import asyncio
+
+import requests
+
+from http_client import HttpClient, create_async_session
+
+PROXY = "http://10.0.0.1:8080"
+
+
+def test_session_per_proxy_is_reused():
+    client = HttpClient(pool_size=32, pool_hosts=4)
+    try:
+        direct = client.session()
+        proxied = client.session(PROXY)
+        assert client.session(PROXY) is proxied
+        assert direct is not proxied
+        assert proxied.proxies == {"http": PROXY, "https": PROXY}
+        assert direct.proxies == {}
+
+        adapter = proxied.get_adapter("https://www.ciweimao.com/")
+        assert adapter._pool_maxsize == 32
+        assert adapter._pool_connections == 4
+    finally:
+        client.close()
+    assert client._sessions == {}
+
+
+def test_request_uses_session_of_proxy(monkeypatch):
+    used = []
+
+    def fake_request(self, method, url, **kwargs):
+        used.append((self, method, url, kwargs["proxies"]))
+        return "ok"
+
+    monkeypatch.setattr(requests.Session, "request", fake_request)
+    client = HttpClient()
+    proxies = {"http": PROXY, "https": PROXY}
+    assert client.request("GET", "https://www.ciweimao.com/", proxies=proxies) == "ok"
+    client.request("POST", "https://www.ciweimao.com/")
+    assert used[0][0] is client.session(PROXY)
+    assert used[1][0] is client.session(None)
+    assert used[0][1:] == ("GET", "https://www.ciweimao.com/", proxies)
+
+
+def test_async_session_connection_limits():
+    async def run():
+        async with create_async_session(limit=16, limit_per_host=4) as session:
+            return session.connector.limit, session.connector.limit_per_host
+
+    assert asyncio.run(run()) == (16, 4)
@@ -0,0 +1,78 @@
+# 列表页解析的测试：按行对齐、缺失单元格占位、表头跳过与输入类型
+
+from listing_parser import parse_listing
+
+
+def listing_html(book_ids):
+    """与列表页结构相同的 HTML，每个 book_id 一行"""
+    rows = "".join(
+        "<tr>"
+        "<td><p>玄幻</p></td>"
+        f'<td><p><a href="https://www.ciweimao.com/book/{i}">书{i}</a></p></td>'
+        f'<td><p><a href="https://www.ciweimao.com/chapter/{i}">第一章</a></p></td>'
+        '<td><p><a href="https://www.ciweimao.com/reader/1">作者</a></p></td>'
+        "<td><p>1万</p></td>"
+        "<td><p>2024-01-01</p></td>"
+        "</tr>"
+        for i in book_ids
+    )
+    return (
+        "<html><body><div>"
+        "<table><tr><th>类别</th><th>书名</th></tr>"
+        f"{rows}</table>"
+        "</div></body></html>"
+    ).encode("utf-8")
+
+
+def test_rows_match_books_columns():
+    assert parse_listing(listing_html([1, 2])) == [
+        (
+            "玄幻",
+            f"书{i}",
+            f"https://www.ciweimao.com/book/{i}",
+            "第一章",
+            f"https://www.ciweimao.com/chapter/{i}",
+            "作者",
+            "https://www.ciweimao.com/reader/1",
+            "1万",
+            "2024-01-01",
+        )
+        for i in (1, 2)
+    ]
+
+
+def test_str_and_bytes_give_same_result():
+    html = listing_html([1])
+    assert parse_listing(html.decode("utf-8")) == parse_listing(html)
+
+
+def test_missing_link_keeps_columns_aligned():
+    # 第 2 行没有最新章节链接，后面的作者、字数不能前移
+    html = listing_html([1, 2]).decode("utf-8").replace(
+        '<a href="https://www.ciweimao.com/chapter/2">第一章</a>', ""
+    )
+    books = parse_listing(html)
+    assert len(books) == 2
+    assert books[1][3:5] == ("", "")
+    assert books[1][5:] == (
+        "作者",
+        "https://www.ciweimao.com/reader/1",
+        "1万",
+        "2024-01-01",
+    )
+
+
+def test_missing_text_is_empty_string():
+    html = listing_html([1]).decode("utf-8").replace("<p>1万</p>", "")
+    assert parse_listing(html)[0][7] == ""
+
+
+def test_rows_without_book_link_are_skipped():
+    html = listing_html([1]).decode("utf-8").replace(
+        "</table>", "<tr><td><p>广告</p></td></tr></table>"
+    )
+    assert [b[2] for b in parse_listing(html)] == ["https://www.ciweimao.com/book/1"]
+
+
+def test_page_without_table_returns_empty():
+    assert parse_listing("<html><body><p>维护中</p></body></html>") == []
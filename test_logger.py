@@ -0,0 +1,68 @@
+# 日志限流的测试：按调用位置限流、不修改原始记录、被抑制条数由格式化器附加
+
+import logging
+import queue
+import sys
+
+from logger import DeferredQueueHandler, RepeatFilter, RepeatFormatter
+
+
+def record(level=logging.WARNING, lineno=10, msg="页面 %s 失败", args=(1,)):
+    return logging.LogRecord("test", level, "crawler.py", lineno, msg, args, None)
+
+
+def test_burst_per_call_site():
+    repeat = RepeatFilter(interval=60, burst=2)
+    assert [repeat.filter(record()) for _ in range(4)] == [True, True, False, False]
+    # 其他位置和 INFO 日志不受影响
+    assert repeat.filter(record(lineno=11))
+    assert repeat.filter(record(level=logging.INFO))
+
+
+def test_suppressed_count_does_not_change_message(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("logger.time.monotonic", lambda: now[0])
+    repeat = RepeatFilter(interval=60, burst=1)
+    for _ in range(3):
+        repeat.filter(record())
+
+    now[0] = 61
+    released = record()
+    assert repeat.filter(released)
+    assert released.suppressed == 2
+    assert (released.msg, released.args) == ("页面 %s 失败", (1,))
+    assert released.getMessage() == "页面 1 失败"
+
+    formatter = RepeatFormatter("%(levelname)s %(message)s")
+    assert formatter.format(released) == "WARNING 页面 1 失败 (此前已抑制 2 条重复日志)"
+
+    # 抑制计数只附加一次
+    following = record()
+    now[0] = 122
+    assert repeat.filter(following)
+    assert formatter.format(following) == "WARNING 页面 1 失败"
+
+
+def test_queued_record_keeps_values_at_logging_time():
+    handler = DeferredQueueHandler(queue.Queue())
+    pending = [1, 2]
+    try:
+        raise ValueError("写入失败")
+    except ValueError:
+        original = logging.LogRecord(
+            "test",
+            logging.ERROR,
+            "crawler.py",
+            10,
+            "待写入: %s",
+            (pending,),
+            sys.exc_info(),
+        )
+    queued = handler.prepare(original)
+    pending.append(3)
+
+    assert queued.getMessage() == "待写入: [1, 2]"
+    assert queued.exc_info[0] is ValueError
+    assert "ValueError: 写入失败" in logging.Formatter().format(queued)
+    # 原始记录不变，其他处理器仍能看到 msg 和 args
+    assert (original.msg, original.args) == ("待写入: %s", (pending,))
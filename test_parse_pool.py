@@ -0,0 +1,87 @@
+# 解析进程池的测试：按批次提交、超时刷新、单个文档出错不影响同批其他文档
+
+import pytest
+
+from parse_pool import ParsePool, _parse_batch
+
+LISTING_HTML = """
+<html><body><div><table>
+<tr><th>类别</th><th>书名</th></tr>
+<tr>
+  <td><p>玄幻</p></td>
+  <td><p><a href="https://www.ciweimao.com/book/1">书1</a></p></td>
+  <td><p><a href="https://www.ciweimao.com/chapter/1">第一章</a></p></td>
+  <td><p><a href="https://www.ciweimao.com/reader/1">作者</a></p></td>
+  <td><p>1万</p></td>
+  <td><p>2024-01-01</p></td>
+</tr>
+</table></div></body></html>
+""".encode(
+    "utf-8"
+)
+
+BOOK = (
+    "玄幻",
+    "书1",
+    "https://www.ciweimao.com/book/1",
+    "第一章",
+    "https://www.ciweimao.com/chapter/1",
+    "作者",
+    "https://www.ciweimao.com/reader/1",
+    "1万",
+    "2024-01-01",
+)
+
+
+@pytest.fixture
+def recording_pool(monkeypatch):
+    """不启动子进程，只记录提交给进程池的批次"""
+    batches = []
+
+    def record(self, kind, batch):
+        batches.append((kind, [document for _, document, _ in batch]))
+        for _, document, future in batch:
+            future.set_result(document)
+
+    monkeypatch.setattr(ParsePool, "_submit", record)
+    pool = ParsePool(max_workers=1, batch_size=3, flush_interval=0.05)
+    yield pool, batches
+    pool.close()
+
+
+def test_full_batches_are_submitted_together(recording_pool):
+    pool, batches = recording_pool
+    futures = [pool.parse("listing", i) for i in range(6)]
+    assert [f.result(timeout=5) for f in futures] == list(range(6))
+    assert batches == [("listing", [0, 1, 2]), ("listing", [3, 4, 5])]
+
+
+def test_partial_batch_is_flushed_after_interval(recording_pool):
+    pool, batches = recording_pool
+    future = pool.parse("detail", b"x")
+    assert future.result(timeout=5) == b"x"
+    assert batches == [("detail", [b"x"])]
+
+
+def test_kinds_are_batched_separately(recording_pool):
+    pool, batches = recording_pool
+    futures = [pool.parse(kind, kind) for kind in ("listing", "detail", "listing")]
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(batches) == [("detail", ["detail"]), ("listing", ["listing"] * 2)]
+
+
+def test_parse_batch_reports_errors_per_document():
+    results = _parse_batch("listing", [LISTING_HTML, None])
+    assert results[0][:2] == (True, [BOOK])
+    assert results[1][0] is False
+    assert isinstance(results[1][1], Exception)
+
+
+def test_parse_in_subprocess():
+    pool = ParsePool(max_workers=1, batch_size=2)
+    try:
+        futures = [pool.parse("listing", LISTING_HTML) for _ in range(2)]
+        assert [f.result(timeout=60) for f in futures] == [[BOOK], [BOOK]]
+    finally:
+        pool.close()
@@ -0,0 +1,373 @@
+# PostgreSQL 存储后端的测试
+# 第一部分用假的连接池检查 SQL 与 COPY 的执行顺序、写入异常和关闭顺序，不需要数据库；
+# 第二部分是冒烟测试，需要一个可写的 PostgreSQL，通过环境变量指定，例如:
+#   CIWEIMAO_TEST_PG_URL=postgresql://postgres@localhost/postgres python -m pytest test_postgres_storage.py
+# 冒烟测试在独立的 schema 中建表，结束后删除，不影响库中已有的数据
+
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import pytest
+
+import postgres_storage
+from postgres_storage import SCHEMA, PostgresStorage
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+PG_URL = os.environ.get("CIWEIMAO_TEST_PG_URL", "")
+
+COVER_URL = "https://img.ciweimao.com/cover.jpg"
+DETAIL = {
+    "title": "书",
+    "stats": {"总点击": "26.5万", "总收藏": "100", "总字数": "1.2万"},
+    "detail_stats": {"章节": "12"},
+    "cover": COVER_URL,
+}
+
+
+def book_row(i, update_time="2024-01-01"):
+    return (
+        "玄幻",
+        f"书{i}",
+        f"https://www.ciweimao.com/book/{i}",
+        "第一章",
+        f"https://www.ciweimao.com/chapter/{i}",
+        "作者",
+        "https://www.ciweimao.com/reader/1",
+        "1万",
+        update_time,
+    )
+
+
+class FakeCopy:
+    def __init__(self):
+        self.rows = []
+
+    def write_row(self, row):
+        self.rows.append(tuple(row))
+
+
+class FakeCursor:
+    """记录执行的语句，结果由 FakePool.respond 按语句给出"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._sets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.pool.log.append(("execute", sql, params))
+        self._sets = [self.pool.respond(sql, params)]
+        return self
+
+    def executemany(self, sql, rows, returning=False):
+        rows = list(rows)
+        self.pool.log.append(("executemany", sql, rows))
+        results = [self.pool.respond(sql, row) for row in rows]
+        self._sets = results if returning else []
+
+    def fetchall(self):
+        return self._sets[0] if self._sets else []
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def nextset(self):
+        self._sets = self._sets[1:]
+        return True if self._sets else None
+
+    @property
+    def rowcount(self):
+        return len(self.fetchall())
+
+    @contextmanager
+    def copy(self, sql):
+        copy = FakeCopy()
+        yield copy
+        self.pool.log.append(("copy", sql, copy.rows))
+        self.pool.staged = copy.rows
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def execute(self, sql, params=None):
+        return FakeCursor(self.pool).execute(sql, params)
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+
+class FakePool:
+    """代替 psycopg_pool.ConnectionPool，books 的 upsert 按 book_url 判断是否新增"""
+
+    def __init__(self, url, **kwargs):
+        self.log = []
+        self.events = []
+        self.known = set()
+        self.staged = []
+        self.claimable = []
+        self.fail = False
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+    def respond(self, sql, params):
+        if self.fail and "INSERT INTO books" in sql:
+            raise RuntimeError("连接已断开")
+        if "RETURNING (xmax = 0)" in sql:
+            rows = [params] if params is not None else self.staged
+            inserted = []
+            for row in rows:
+                url = row[postgres_storage.BOOK_URL_INDEX]
+                inserted.append({"inserted": url not in self.known})
+                self.known.add(url)
+            return inserted
+        if "RETURNING id, book_url, detail_stale" in sql:
+            return self.claimable
+        return []
+
+    def close(self):
+        self.events.append("close")
+
+    def statements(self):
+        return [(kind, " ".join(sql.split())) for kind, sql, _ in self.log]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    monkeypatch.setattr(postgres_storage, "ConnectionPool", FakePool)
+    monkeypatch.setattr(postgres_storage, "dict_row", object())
+    db = PostgresStorage("postgresql://fake/ciweimao", pool_size=2, max_pending=4)
+    yield db
+    db._executor.shutdown(wait=True)
+
+
+def test_schema_runs_under_advisory_lock(fake):
+    sqls = [sql for _, sql, _ in fake.pool.log]
+    assert "pg_advisory_xact_lock" in sqls[0]
+    assert sqls[1:] == list(SCHEMA)
+
+
+def test_small_batch_uses_multirow_upsert(fake):
+    fake.pool.log.clear()
+    rows = [book_row(1), book_row(2), book_row(1, "2024-02-01")]
+    assert fake.save_books(rows) == 2
+    ((kind, sql, params),) = fake.pool.log
+    assert kind == "executemany"
+    assert sql == postgres_storage._BOOKS_UPSERT_SQL
+    # 同一批次内按 book_url 去重，保留最后一条
+    assert params == [book_row(1, "2024-02-01"), book_row(2)]
+    assert fake.save_books([book_row(2), book_row(3)]) == 1
+
+
+def test_large_batch_copies_into_stage_then_merges(fake):
+    fake.pool.log.clear()
+    rows = [book_row(i) for i in range(postgres_storage.COPY_THRESHOLD)]
+    assert fake.submit_books(rows).result() == len(rows)
+    kinds = fake.pool.statements()
+    assert kinds[0][0] == "execute"
+    assert kinds[0][1].startswith("CREATE TEMP TABLE books_stage ON COMMIT DROP")
+    assert kinds[1][0] == "copy"
+    assert kinds[1][1].startswith("COPY books_stage (category, book_name")
+    assert fake.pool.log[1][2] == rows
+    assert fake.pool.log[2][1] == postgres_storage._BOOKS_MERGE_SQL
+    assert len(fake.pool.log) == 3
+
+
+def test_bulk_details_copy_then_record_stats_and_mark(fake):
+    fake.pool.log.clear()
+    count = postgres_storage.COPY_THRESHOLD
+    records = [(i, f"https://www.ciweimao.com/book/{i}", DETAIL) for i in range(count)]
+    assert fake.save_book_details_bulk(records) == count
+    sqls = [sql for _, sql, _ in fake.pool.log]
+    assert sqls[0].startswith("CREATE TEMP TABLE details_stage")
+    assert sqls[1].startswith("COPY details_stage")
+    assert sqls[2:] == [
+        postgres_storage._DETAIL_MERGE_SQL,
+        postgres_storage._LATEST_STATS_SQL,
+        postgres_storage._INSERT_STATS_SQL,
+        postgres_storage._MARK_CRAWLED_SQL,
+    ]
+    # 没有历史快照，每本书都追加一条
+    assert len(fake.pool.log[4][2]) == count
+    ids, covers = fake.pool.log[5][2]
+    assert ids == list(range(count))
+    assert set(covers) == {COVER_URL}
+
+
+def test_claim_skips_locked_rows_and_sorts(fake):
+    fake.pool.claimable = [{"id": 2}, {"id": 1}]
+    fake.pool.log.clear()
+    assert fake.claim_books("a", limit=10, lease_seconds=60) == [{"id": 1}, {"id": 2}]
+    ((_, sql, params),) = fake.pool.log
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    owner, expires, now, limit = params
+    assert (owner, limit) == ("a", 10)
+    assert expires - now == pytest.approx(60)
+
+
+def test_write_errors_go_to_future_and_save_returns_zero(fake):
+    fake.pool.fail = True
+    assert fake.save_books([book_row(1)]) == 0
+    with pytest.raises(RuntimeError):
+        fake.submit_books([book_row(1)]).result(timeout=5)
+    with pytest.raises(RuntimeError):
+        fake.submit_listing_page(1, [book_row(1)]).result(timeout=5)
+    assert fake._pending == 0
+
+
+def test_submit_blocks_when_pending_is_full(fake):
+    release = threading.Event()
+    blockers = [fake._submit(release.wait) for _ in range(4)]
+    submitted = threading.Event()
+
+    def submit():
+        fake.submit_books([book_row(1)]).result()
+        submitted.set()
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    assert not submitted.wait(0.2)
+    assert fake._pending == 4
+    release.set()
+    for future in blockers:
+        future.result(timeout=5)
+    thread.join(timeout=5)
+    assert submitted.is_set()
+    assert fake._pending == 0
+
+
+def test_close_waits_for_writes_before_closing_pool(fake):
+    started = threading.Event()
+    release = threading.Event()
+
+    def write():
+        started.set()
+        release.wait()
+        fake.pool.events.append("write")
+
+    fake._submit(write)
+    started.wait(timeout=5)
+    closer = threading.Thread(target=fake.close)
+    closer.start()
+    closer.join(0.2)
+    assert fake.pool.events == []
+    release.set()
+    closer.join(timeout=5)
+    assert fake.pool.events == ["write", "close"]
+
+
+@pytest.fixture
+def storage():
+    if psycopg is None or not PG_URL:
+        pytest.skip("未安装 psycopg 或未设置 CIWEIMAO_TEST_PG_URL")
+
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(PG_URL, autocommit=True) as conn:
+        conn.execute(f"CREATE SCHEMA {schema}")
+    separator = "&" if "?" in PG_URL else "?"
+    url = f"{PG_URL}{separator}options={quote(f'-csearch_path={schema}')}"
+    db = PostgresStorage(url, pool_size=4)
+    try:
+        yield db
+    finally:
+        db.close()
+        with psycopg.connect(PG_URL, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def test_save_books_counts_only_new_rows(storage):
+    assert storage.save_books([book_row(i) for i in range(5)]) == 5
+    # 小批量走多行 upsert，大批量走 COPY，两条路径都只统计新增
+    assert storage.save_books([book_row(i, "2024-02-01") for i in range(3, 8)]) == 3
+    assert storage.submit_books([book_row(i) for i in range(200)]).result() == 192
+    assert storage.count_books() == 200
+
+
+def test_claim_books_is_exclusive(storage):
+    storage.save_books([book_row(i) for i in range(10)])
+    first = storage.claim_books("a", limit=6)
+    second = storage.claim_books("b", limit=6)
+    assert len(first) == 6
+    assert len(second) == 4
+    assert not {b["id"] for b in first} & {b["id"] for b in second}
+    assert storage.claim_books("c") == []
+
+    assert storage.release_leases("a", [first[0]["id"]]) == 1
+    assert [b["id"] for b in storage.claim_books("c")] == [first[0]["id"]]
+
+
+def test_expired_leases_are_reclaimed(storage):
+    storage.save_books([book_row(i) for i in range(3)])
+    claimed = storage.claim_books("a", lease_seconds=-1)
+    assert len(claimed) == 3
+    assert storage.reclaim_expired_leases() == 3
+    assert len(storage.claim_books("b")) == 3
+
+
+def test_detail_marks_crawled_and_records_history(storage):
+    storage.save_books([book_row(1)])
+    (claimed,) = storage.claim_books("a")
+    assert claimed["detail_stale"] == 0
+
+    future = storage.submit_book_detail(claimed["id"], claimed["book_url"], DETAIL)
+    assert future.result() is True
+    assert storage.is_detail_exists(claimed["book_url"])
+    assert storage.claim_books("a") == []
+
+    # 相同数值不追加快照，有变化时追加
+    assert storage.save_book_detail(claimed["id"], claimed["book_url"], DETAIL)
+    series = storage.get_stats_series(claimed["id"])
+    assert len(series) == 1
+    assert series[0]["total_hits"] == 265000
+    assert series[0]["total_word"] == 12000
+
+    with storage.pool.connection() as conn:
+        book = conn.execute(
+            "SELECT detail_crawled, book_image FROM books WHERE id = %s",
+            (claimed["id"],),
+        ).fetchone()
+        detail = conn.execute(
+            "SELECT total_hits, chapter_count FROM book_details WHERE book_id = %s",
+            (claimed["id"],),
+        ).fetchone()
+    assert book == {"detail_crawled": 1, "book_image": COVER_URL}
+    assert detail == {"total_hits": 265000, "chapter_count": 12}
+
+
+def test_bulk_details_use_copy_path(storage):
+    storage.save_books([book_row(i) for i in range(150)])
+    books = storage.claim_books("a", limit=150)
+    records = [
+        (b["id"], b["book_url"], {**DETAIL, "stats": {"总点击": f"{b['id']}万"}})
+        for b in books
+    ]
+    assert storage.save_book_details_bulk(records) == 150
+    assert storage.claim_books("a") == []
+    movers = storage.get_top_movers("total_hits")
+    assert len(movers) == 20
+    assert all(m["delta"] == 0 for m in movers)
+
+
+def test_write_errors_propagate_to_future(storage):
+    # 同步接口记录日志后返回 0，提交的写入把异常交给调用方
+    bad = [book_row(1)[:-1]]
+    assert storage.save_books(bad) == 0
+    with pytest.raises(psycopg.Error):
+        storage.submit_books(bad).result()
+    assert storage._pending == 0
@@ -0,0 +1,158 @@
+# 代理池的测试：连续失败后隔离、指数退避、成功后恢复、全部隔离时等待，以及失败归因
+
+import asyncio
+import threading
+import time
+
+import requests
+import pytest
+
+from proxy_pool import ProxyManager, is_proxy_failure
+
+
+@pytest.fixture
+def manager():
+    # 探测间隔设得很长，测试期间后台线程不会真正访问网络
+    manager = ProxyManager(
+        ["http://p1", "http://p2"],
+        failure_threshold=2,
+        base_backoff=10,
+        max_backoff=25,
+        probe_interval=3600,
+    )
+    try:
+        yield manager
+    finally:
+        manager.stop()
+
+
+def quarantined(manager):
+    return {s["proxy"] for s in manager.snapshot() if s["quarantined"]}
+
+
+def test_consecutive_failures_quarantine_proxy(manager):
+    manager.report_failure("http://p1", "超时")
+    assert quarantined(manager) == set()
+    # 中间的成功会重置连续失败计数
+    manager.report_success("http://p1", 0.2)
+    manager.report_failure("http://p1", "超时")
+    assert quarantined(manager) == set()
+    manager.report_failure("http://p1", "超时")
+    assert quarantined(manager) == {"http://p1"}
+    assert all(manager.get_proxy() == "http://p2" for _ in range(20))
+
+
+def test_backoff_grows_exponentially_up_to_max(manager):
+    stats = manager._stats["http://p1"]
+    retries = []
+    for _ in range(3):
+        with manager._lock:
+            manager._quarantine(stats)
+            retries.append(stats.retry_at)
+    assert stats.quarantine_count == 3
+    # 10、20、25(上限) 秒，retry_at 基于各自调用时的时钟
+    assert 9 < retries[1] - retries[0] < 11
+    assert 4 < retries[2] - retries[1] < 6
+
+
+def test_success_releases_quarantine(manager):
+    for _ in range(2):
+        manager.report_failure("http://p1", "超时")
+    manager.report_success("http://p1", 0.1)
+    assert quarantined(manager) == set()
+    assert manager._stats["http://p1"].quarantine_count == 0
+
+
+def test_all_quarantined_waits_for_earliest(manager):
+    for proxy in ("http://p1", "http://p2"):
+        for _ in range(2):
+            manager.report_failure(proxy, "超时")
+    manager._stats["http://p2"].retry_at = time.monotonic() + 0.1
+    start = time.monotonic()
+    assert manager.get_proxy() == "http://p2"
+    assert time.monotonic() - start >= 0.09
+
+
+def test_expired_quarantine_is_handed_to_one_caller(manager):
+    for proxy in ("http://p1", "http://p2"):
+        for _ in range(2):
+            manager.report_failure(proxy, "超时")
+    manager._stats["http://p1"].retry_at = time.monotonic() - 1
+    assert manager._choose() == ("http://p1", 0.0)
+    # 探测期间其他调用方继续等待，不会一起涌向刚失败的代理
+    proxy, delay = manager._choose()
+    assert proxy is None and delay > 0
+    assert manager._stats["http://p1"].retry_at - time.monotonic() > 9
+
+    manager.report_success("http://p1", 0.1)
+    assert manager._choose() == ("http://p1", 0.0)
+
+
+def test_all_quarantined_waits_without_blocking_loop(manager):
+    for proxy in ("http://p1", "http://p2"):
+        for _ in range(2):
+            manager.report_failure(proxy, "超时")
+    manager._stats["http://p1"].retry_at = time.monotonic() + 0.1
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        proxy = await manager.get_proxy_async()
+        ticker.cancel()
+        return proxy, ticks
+
+    proxy, ticks = asyncio.run(main())
+    assert proxy == "http://p1"
+    assert ticks > 1
+
+
+def test_success_during_wait_returns_released_proxy(manager):
+    for proxy in ("http://p1", "http://p2"):
+        for _ in range(2):
+            manager.report_failure(proxy, "超时")
+    timer = threading.Timer(0.1, manager.report_success, ("http://p2", 0.1))
+    timer.start()
+    start = time.monotonic()
+    assert manager.get_proxy() == "http://p2"
+    # 隔离时长为 10 秒，但另一个请求成功后立即可用
+    assert time.monotonic() - start < 5
+
+
+def test_report_error_counts_only_proxy_failures(manager):
+    manager.report_error("http://p1", ValueError("解析失败"))
+    manager.report_error("http://p1", status=404)
+    assert manager._stats["http://p1"].failure == 0
+    manager.report_error("http://p1", requests.ConnectionError())
+    manager.report_error("http://p1", status=403)
+    assert manager._stats["http://p1"].failure == 2
+    assert quarantined(manager) == {"http://p1"}
+
+
+def test_unknown_or_missing_proxy_is_ignored(manager):
+    manager.report_failure(None)
+    manager.report_failure("http://other")
+    manager.report_success("http://other", 0.1)
+    assert {s["proxy"] for s in manager.snapshot()} == {"http://p1", "http://p2"}
+
+
+def test_is_proxy_failure():
+    assert is_proxy_failure(403)
+    assert is_proxy_failure(429)
+    assert not is_proxy_failure(404)
+    assert not is_proxy_failure(500)
+    assert is_proxy_failure(error=requests.ConnectionError())
+    assert is_proxy_failure(error=requests.Timeout())
+    assert not is_proxy_failure(error=ValueError("解析失败"))
+
+    response = requests.Response()
+    response.status_code = 404
+    assert not is_proxy_failure(error=requests.HTTPError(response=response))
+    response.status_code = 407
+    assert is_proxy_failure(error=requests.HTTPError(response=response))
@@ -0,0 +1,77 @@
+# AIMD 令牌桶限速器的测试，时间通过 now 参数注入，不依赖真实等待
+
+import requests
+
+from rate_limiter import RateLimiter, TokenBucket, is_throttle_signal
+
+
+def test_reserve_allows_burst_then_waits():
+    bucket = TokenBucket(2.0, min_rate=0.5, max_rate=10.0)
+    assert bucket.capacity == 2.0
+    bucket._updated = 100.0
+    assert bucket.reserve(100.0) == 0.0
+    assert bucket.reserve(100.0) == 0.0
+    # 令牌用尽后按速率排队
+    assert bucket.reserve(100.0) == 0.5
+    assert bucket.reserve(100.0) == 1.0
+    # 经过足够时间后令牌补满，但不超过容量
+    bucket.reserve(110.0)
+    assert bucket.tokens == bucket.capacity - 1
+
+
+def test_success_increases_rate_linearly():
+    bucket = TokenBucket(1.0, min_rate=0.5, max_rate=1.25, increase=0.1)
+    bucket.on_success()
+    bucket.on_success()
+    assert abs(bucket.rate - 1.2) < 1e-9
+    bucket.on_success()
+    assert bucket.rate == 1.25
+
+
+def test_throttle_halves_rate_once_per_cooldown():
+    bucket = TokenBucket(8.0, min_rate=1.5, max_rate=10.0, cooldown=1.0)
+    assert bucket.on_throttle(100.0)
+    assert bucket.rate == 4.0
+    # 冷却期内的后续限流信号被忽略
+    assert not bucket.on_throttle(100.5)
+    assert bucket.rate == 4.0
+    assert bucket.on_throttle(101.0)
+    assert bucket.rate == 2.0
+    assert bucket.on_throttle(102.0)
+    assert bucket.rate == 1.5
+
+
+def test_throttle_signals():
+    assert is_throttle_signal(429)
+    assert is_throttle_signal(503)
+    assert not is_throttle_signal(404)
+    assert not is_throttle_signal(200)
+    assert not is_throttle_signal()
+    assert is_throttle_signal(error=requests.Timeout())
+    assert is_throttle_signal(error=TimeoutError())
+    assert not is_throttle_signal(error=requests.ConnectionError())
+
+    response = requests.Response()
+    response.status_code = 502
+    assert is_throttle_signal(error=requests.HTTPError(response=response))
+
+
+def test_limiter_adjusts_host_and_proxy_buckets():
+    limiter = RateLimiter(host_rate=4.0, proxy_rate=2.0)
+    url = "https://www.ciweimao.com/book/1"
+    limiter.acquire(url, "http://p1")
+    assert limiter.snapshot() == {
+        "hosts": {"www.ciweimao.com": 4.0},
+        "proxies": {"http://p1": 2.0},
+    }
+
+    limiter.report(url, "http://p1", status=429)
+    snapshot = limiter.snapshot()
+    assert snapshot["hosts"]["www.ciweimao.com"] == 2.0
+    assert snapshot["proxies"]["http://p1"] == 1.0
+
+    # 404 既不加速也不降速
+    limiter.report(url, "http://p1", status=404)
+    assert limiter.snapshot() == snapshot
+    limiter.report(url, "http://p1", status=200)
+    assert limiter.snapshot()["hosts"]["www.ciweimao.com"] > 2.0